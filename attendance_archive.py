@@ -0,0 +1,185 @@
+"""Archive binaire des pointages à enregistrements de taille fixe, lue par mmap.
+
+Format du fichier (little-endian):
+  en-tête (16 octets) : magic b'ZKAR', version (u2), taille d'enregistrement (u2), nombre (u8)
+  enregistrements     : uid (u4), epoch (i8, secondes), punch (u1), status (u1) = 14 octets
+
+Les enregistrements sont triés par (uid, epoch): la tranche d'un utilisateur et une plage
+de dates s'obtiennent par recherche dichotomique sur le fichier projeté en mémoire, sans
+charger l'historique en objets Python. Les noms des utilisateurs sont conservés dans un
+fichier JSON à côté de l'archive (<archive>.users.json).
+
+Dépendance: numpy (pip install numpy)
+"""
+
+import json
+import os
+
+import numpy as np
+
+from attendance_store import PUNCH_TYPES, load_attendance_store, record_punch_code
+
+MAGIC = b'ZKAR'
+VERSION = 1
+HEADER_DTYPE = np.dtype([('magic', 'S4'), ('version', '<u2'), ('record_size', '<u2'), ('count', '<u8')])
+RECORD_DTYPE = np.dtype([('uid', '<u4'), ('epoch', '<i8'), ('punch', 'u1'), ('status', 'u1')])
+
+
+def _names_path(archive_path):
+    return archive_path + ".users.json"
+
+
+def _to_epoch(dates):
+    """Dates/horodatages texte -> secondes epoch (heure locale de l'appareil, sans fuseau)"""
+    return np.array(dates, dtype='datetime64[s]').astype(np.int64)
+
+
+def write_archive(archive_path, attendance_data):
+    """Écrire l'archive depuis la vue {uid: {'name', 'records'}}; retourne le nombre de pointages
+
+    Les uid non numériques ne peuvent pas être archivés et sont ignorés.
+    """
+    uids, timestamps, punches, statuses = [], [], [], []
+    names = {}
+    for uid, data in attendance_data.items():
+        if not str(uid).isdigit():
+            print(f"  UID '{uid}' non numérique ignoré ({len(data['records'])} pointages)")
+            continue
+        names[uid] = data['name']
+        for record in data['records']:
+            punch = record_punch_code(record)
+            uids.append(int(uid))
+            timestamps.append(record['timestamp'])
+            punches.append(255 if punch is None else punch)
+            statuses.append(record.get('status') or 0)
+
+    records = np.zeros(len(uids), dtype=RECORD_DTYPE)
+    records['uid'] = uids
+    records['epoch'] = _to_epoch(timestamps)
+    records['punch'] = punches
+    records['status'] = statuses
+    records = records[np.lexsort((records['epoch'], records['uid']))]
+
+    header = np.array([(MAGIC, VERSION, RECORD_DTYPE.itemsize, len(records))], dtype=HEADER_DTYPE)
+    tmp_path = archive_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(records.tobytes())
+    os.replace(tmp_path, archive_path)
+
+    with open(_names_path(archive_path), 'w', encoding='utf-8') as f:
+        json.dump(names, f, indent=2, ensure_ascii=False)
+
+    return len(records)
+
+
+def open_archive(archive_path):
+    """Projeter l'archive en mémoire (lecture seule) et retourner le tableau des enregistrements"""
+    header = np.fromfile(archive_path, dtype=HEADER_DTYPE, count=1)[0]
+    if header['magic'] != MAGIC or header['record_size'] != RECORD_DTYPE.itemsize:
+        raise ValueError(f"Fichier d'archive invalide: {archive_path}")
+    count = int(header['count'])
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(archive_path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_DTYPE.itemsize, shape=(count,))
+
+
+def load_archive_names(archive_path):
+    """Noms des utilisateurs de l'archive {uid: nom}"""
+    path = _names_path(archive_path)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def user_slice(archive, uid):
+    """Tranche (vue sans copie) des pointages d'un utilisateur"""
+    uid = int(uid)
+    start = np.searchsorted(archive['uid'], uid, side='left')
+    end = np.searchsorted(archive['uid'], uid, side='right')
+    return archive[start:end]
+
+
+def range_scan(archive, date_debut, date_fin, uid=None):
+    """Pointages entre deux dates incluses (YYYY-MM-DD), pour un utilisateur ou pour tous"""
+    debut = _to_epoch([date_debut])[0]
+    fin = _to_epoch([date_fin])[0] + 86400
+    if uid is not None:
+        records = user_slice(archive, uid)
+        # Tranche triée par horodatage: recherche dichotomique
+        start = np.searchsorted(records['epoch'], debut, side='left')
+        end = np.searchsorted(records['epoch'], fin, side='left')
+        return records[start:end]
+    # Tous les utilisateurs: un seul balayage vectorisé de la colonne epoch
+    epoch = archive['epoch']
+    return archive[(epoch >= debut) & (epoch < fin)]
+
+
+def user_counts(archive):
+    """Nombre de pointages par utilisateur {uid: nombre}"""
+    uids, counts = np.unique(archive['uid'], return_counts=True)
+    return {str(u): int(c) for u, c in zip(uids, counts)}
+
+
+def records_to_dicts(records):
+    """Convertir des enregistrements binaires au format JSON historique"""
+    result = []
+    for ts, punch, status in zip(records['epoch'].astype('datetime64[s]').astype(str),
+                                 records['punch'].tolist(), records['status'].tolist()):
+        timestamp = ts.replace('T', ' ')
+        record = {
+            'timestamp': timestamp,
+            'date': timestamp[:10],
+            'heure': timestamp[11:],
+            'type': PUNCH_TYPES.get(punch, f'Type {punch}'),
+            'type_code': punch,
+            'status': status
+        }
+        # Type inconnu dans la source (anciens pointages)
+        if punch == 255:
+            record['type'] = 'Type inconnu'
+            del record['type_code']
+        result.append(record)
+    return result
+
+
+def export_archive(archive_path):
+    """Reconstruire la vue JSON {uid: {'name', 'records'}} depuis l'archive"""
+    archive = open_archive(archive_path)
+    names = load_archive_names(archive_path)
+    data = {}
+    for uid in user_counts(archive):
+        data[uid] = {
+            'name': names.get(uid, f'Utilisateur #{uid}'),
+            'records': records_to_dicts(user_slice(archive, uid))
+        }
+    return data
+
+
+def _load_source(source):
+    """Charger attendance.json ou un répertoire attendance_store"""
+    if os.path.isdir(source):
+        return load_attendance_store(source)
+    with open(source, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) != 4 or sys.argv[1] not in ('build', 'export'):
+        print("Usage: python attendance_archive.py build <attendance.json|attendance_store> <archive.zka>")
+        print("       python attendance_archive.py export <archive.zka> <attendance.json>")
+        sys.exit(1)
+
+    if sys.argv[1] == 'build':
+        total = write_archive(sys.argv[3], _load_source(sys.argv[2]))
+        taille = os.path.getsize(sys.argv[3])
+        print("Archive créée!")
+        print(f"  - Pointages: {total}")
+        print(f"  - Taille: {taille} octets")
+    else:
+        with open(sys.argv[3], 'w', encoding='utf-8') as f:
+            json.dump(export_archive(sys.argv[2]), f, indent=2, ensure_ascii=False)
+        print(f"Archive exportée vers {sys.argv[3]}")
@@ -0,0 +1,144 @@
+"""Export des pointages en flux pour la paie: CSV, CSV compressé (gzip) ou JSON par ligne.
+
+Les pointages sont lus un par un depuis le stockage (segments JSONL ou base SQLite),
+filtrés (plage de dates, liste d'UID, types de pointage) et écrits aussitôt; avec une plage
+de dates, les segments hors de la plage (bornes du manifeste) ne sont pas lus. La mémoire
+utilisée ne dépend pas de la taille de l'historique. Ils sont écrits dans l'ordre du
+stockage: ordre d'arrivée pour les segments (trié par utilisateur après une compaction),
+par utilisateur puis horodatage pour SQLite.
+
+Formats:
+  csv    : colonnes CSV_COLUMNS, une ligne par pointage
+  ndjson : un objet JSON par ligne ({'uid', 'name', 'timestamp', 'date', 'heure', 'type', ...})
+
+Le fichier est écrit sous un nom temporaire puis renommé: un export interrompu ne laisse
+pas de fichier incomplet.
+
+    python zk_cli.py export --format csv --output paie_janvier.csv.gz --from 2026-01-01 --to 2026-01-31
+"""
+
+import csv
+import gzip
+import json
+import os
+
+from attendance_store import PUNCH_CODES, PUNCH_TYPES, iter_segment, load_manifest, record_punch_code
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+CSV_COLUMNS = ['uid', 'name', 'timestamp', 'type', 'type_code', 'status', 'device']
+
+
+def parse_punch_types(values):
+    """Types de pointage (codes ou noms, ex: '0', 'Sortie') -> ensemble de codes"""
+    codes = set()
+    for value in values:
+        value = str(value).strip()
+        if value.isdigit() and int(value) in PUNCH_TYPES:
+            codes.add(int(value))
+        elif value in PUNCH_CODES:
+            codes.add(PUNCH_CODES[value])
+        else:
+            raise ValueError(f"type de pointage inconnu: {value}")
+    return codes
+
+
+def make_filter(date_debut=None, date_fin=None, uids=None, punch_codes=None):
+    """Fonction (uid, pointage) -> True si le pointage est exporté (None = sans filtre)"""
+    uids = None if uids is None else {str(uid) for uid in uids}
+
+    def keep(uid, record):
+        if date_debut and record['date'] < date_debut:
+            return False
+        if date_fin and record['date'] > date_fin:
+            return False
+        if uids is not None and uid not in uids:
+            return False
+        if punch_codes is not None and record_punch_code(record) not in punch_codes:
+            return False
+        return True
+    return keep
+
+
+def segment_in_range(segment, date_debut=None, date_fin=None):
+    """False si les bornes du segment (manifeste) sont entièrement hors de la plage de dates
+
+    Un segment sans bornes (stockage antérieur) est toujours lu.
+    """
+    if segment.get('first') is None or segment.get('last') is None:
+        return True
+    if date_debut and segment['last'][:10] < date_debut:
+        return False
+    if date_fin and segment['first'][:10] > date_fin:
+        return False
+    return True
+
+
+def iter_store_export(store_dir, date_debut=None, date_fin=None, uids=None, punch_codes=None):
+    """Pointages filtrés du stockage segmenté: (uid, nom, pointage), segment par segment
+
+    Les segments entièrement hors de la plage de dates ne sont pas ouverts.
+    """
+    keep = make_filter(date_debut, date_fin, uids, punch_codes)
+    manifest = load_manifest(store_dir)
+    names = manifest['users']
+    for segment in manifest['segments']:
+        if not segment_in_range(segment, date_debut, date_fin):
+            continue
+        for record in iter_segment(store_dir, segment):
+            uid = record.pop('uid')
+            if keep(uid, record):
+                yield uid, names.get(uid, f'Utilisateur #{uid}'), record
+
+
+def filter_rows(rows, punch_codes=None):
+    """Filtrer par type des lignes (uid, nom, pointage) déjà filtrées par date et UID"""
+    if punch_codes is None:
+        yield from rows
+        return
+    for uid, name, record in rows:
+        if record_punch_code(record) in punch_codes:
+            yield uid, name, record
+
+
+def _write_csv(rows, f):
+    writer = csv.writer(f)
+    writer.writerow(CSV_COLUMNS)
+    count = 0
+    for uid, name, r in rows:
+        writer.writerow([uid, name, r['timestamp'], r['type'], r.get('type_code', ''),
+                         r.get('status', ''), r.get('device', '')])
+        count += 1
+    return count
+
+
+def _write_ndjson(rows, f):
+    count = 0
+    for uid, name, record in rows:
+        f.write(json.dumps(dict(uid=uid, name=name, **record), ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def export_rows(rows, path, fmt='csv', compress=False):
+    """Écrire les lignes (uid, nom, pointage) au fil de l'eau; retourne le nombre exporté
+
+    compress: fichier compressé (gzip), aussi choisi par l'extension .gz
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format inconnu: {fmt}")
+    compress = compress or path.endswith('.gz')
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        if compress:
+            f = gzip.open(tmp_path, 'wt', encoding='utf-8', newline='')
+        else:
+            f = open(tmp_path, 'w', encoding='utf-8', newline='')
+        with f:
+            count = _write_csv(rows, f) if fmt == 'csv' else _write_ndjson(rows, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return count
+
@@ -0,0 +1,322 @@
+"""Stockage des pointages dans une base SQLite indexée.
+
+La clé primaire (uid, timestamp, type_code) déduplique nativement les pointages, avec la
+même clé que l'index du stockage segmenté (attendance_sync.AttendanceIndex): deux
+pointages de types différents à la même seconde sont conservés. Elle sert aussi les
+requêtes par utilisateur et par plage de dates; un index sur la date sert les requêtes
+tous utilisateurs confondus.
+
+Le type des anciens pointages sans 'type_code' est déduit de leur libellé
+(record_punch_code); UNKNOWN_PUNCH s'il est inconnu. Les bases créées avec l'ancienne clé
+(uid, timestamp) sont reconstruites une fois à l'ouverture.
+"""
+
+import json
+import os
+import sqlite3
+
+from attendance_store import SUMMARY_TAIL, build_summary, load_summary, record_punch_code, save_summary
+
+# Code enregistré pour un ancien pointage dont le type est inconnu
+UNKNOWN_PUNCH = -1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    uid TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attendance (
+    uid TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    date TEXT NOT NULL,
+    heure TEXT NOT NULL,
+    type TEXT NOT NULL,
+    type_code INTEGER NOT NULL,
+    status INTEGER,
+    device TEXT,
+    PRIMARY KEY (uid, timestamp, type_code)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance (date, uid);
+"""
+
+
+def connect_db(db_path):
+    """Ouvrir la base (et créer le schéma si nécessaire)"""
+    db = sqlite3.connect(db_path)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    # Bases créées avant l'ajout du numéro de série de l'appareil
+    columns = {row['name'] for row in db.execute("PRAGMA table_info(attendance)")}
+    if 'device' not in columns:
+        db.execute("ALTER TABLE attendance ADD COLUMN device TEXT")
+    key = [row['name'] for row in sorted(db.execute("PRAGMA table_info(attendance)"), key=lambda r: r['pk'])
+           if row['pk']]
+    if key != ['uid', 'timestamp', 'type_code']:
+        _migrate_primary_key(db)
+    return db
+
+
+def _punch_code(record):
+    """Code du type d'un pointage, déduit du libellé pour les anciens pointages"""
+    code = record.get('type_code')
+    if code is None:
+        code = record_punch_code({'type': record.get('type', '')})
+    return UNKNOWN_PUNCH if code is None else code
+
+
+def _migrate_primary_key(db):
+    """Reconstruire une base créée avec l'ancienne clé primaire (uid, timestamp)"""
+    # Une seule transaction (executescript validerait en cours de route): une migration
+    # interrompue laisse la base intacte
+    db.execute("BEGIN")
+    with db:
+        db.execute("ALTER TABLE attendance RENAME TO attendance_old")
+        db.execute("DROP INDEX IF EXISTS idx_attendance_date")
+        for statement in SCHEMA.split(';'):
+            if statement.strip():
+                db.execute(statement)
+        rows = db.execute("SELECT * FROM attendance_old")
+        db.executemany(
+            "INSERT OR IGNORE INTO attendance (uid, timestamp, date, heure, type, type_code, status, device) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((row['uid'], row['timestamp'], row['date'], row['heure'], row['type'], _punch_code(dict(row)),
+              row['status'], row['device'])
+             for row in rows)
+        )
+        db.execute("DROP TABLE attendance_old")
+
+
+def _row_to_record(row):
+    record = {
+        'timestamp': row['timestamp'],
+        'date': row['date'],
+        'heure': row['heure'],
+        'type': row['type'],
+        'status': row['status']
+    }
+    # Ancien pointage de type inconnu (sans 'type_code')
+    if row['type_code'] != UNKNOWN_PUNCH:
+        record['type_code'] = row['type_code']
+    if row['device'] is not None:
+        record['device'] = row['device']
+    return record
+
+
+def _insert_records(db, new_records, names):
+    """Insérer {uid: [pointage, ...]} en ignorant les doublons; retourne le nombre inséré"""
+    db.executemany(
+        "INSERT OR IGNORE INTO users (uid, name) VALUES (?, ?)",
+        [(uid, names.get(uid, f'Utilisateur #{uid}')) for uid in new_records]
+    )
+    before = db.total_changes
+    db.executemany(
+        "INSERT OR IGNORE INTO attendance (uid, timestamp, date, heure, type, type_code, status, device) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (uid, r['timestamp'], r['date'], r['heure'], r['type'], _punch_code(r), r.get('status'),
+             r.get('device'))
+            for uid, records in new_records.items()
+            for r in records
+        ]
+    )
+    return db.total_changes - before
+
+
+def db_summary_path(db_path):
+    """Chemin du résumé associé à une base"""
+    return db_path + ".summary.json"
+
+
+def _refresh_summary(db, summary, uids):
+    """Recalculer le résumé des seuls utilisateurs modifiés (via la clé primaire)"""
+    for uid in uids:
+        row = db.execute(
+            "SELECT u.name, COUNT(a.timestamp) AS total, MIN(a.timestamp) AS first, MAX(a.timestamp) AS last "
+            "FROM users u LEFT JOIN attendance a ON a.uid = u.uid WHERE u.uid = ? GROUP BY u.name",
+            (uid,)
+        ).fetchone()
+        if row is None:
+            continue
+        tail = db.execute(
+            "SELECT * FROM attendance WHERE uid = ? ORDER BY timestamp DESC LIMIT ?", (uid, SUMMARY_TAIL)
+        ).fetchall()
+        summary[uid] = {
+            'name': row['name'],
+            'count': row['total'],
+            'first': row['first'],
+            'last': row['last'],
+            'tail': [_row_to_record(r) for r in reversed(tail)]
+        }
+
+
+def append_attendance_db(db_path, new_records, names):
+    """Ajouter des pointages ({uid: [pointage, ...]}); les doublons sont ignorés par la clé primaire"""
+    db = connect_db(db_path)
+    try:
+        with db:
+            inserted = _insert_records(db, new_records, names)
+        summary = load_summary(db_summary_path(db_path))
+        if summary is None:
+            summary = {}
+            _refresh_summary(db, summary, [row['uid'] for row in db.execute("SELECT uid FROM users")])
+        elif inserted:
+            _refresh_summary(db, summary, list(new_records))
+        save_summary(db_summary_path(db_path), summary)
+        return inserted
+    finally:
+        db.close()
+
+
+def write_attendance_db(db_path, data):
+    """Remplacer tout le contenu de la base par la vue {uid: {'name', 'records'}}"""
+    db = connect_db(db_path)
+    try:
+        with db:
+            db.execute("DELETE FROM attendance")
+            db.execute("DELETE FROM users")
+            names = {uid: user_data['name'] for uid, user_data in data.items()}
+            _insert_records(db, {uid: user_data['records'] for uid, user_data in data.items()}, names)
+        save_summary(db_summary_path(db_path), build_summary(data))
+    finally:
+        db.close()
+
+
+def load_db_summary(db_path):
+    """Résumé de la base, reconstruit une seule fois s'il manque"""
+    summary = load_summary(db_summary_path(db_path))
+    if summary is None:
+        db = connect_db(db_path)
+        try:
+            summary = {}
+            _refresh_summary(db, summary, [row['uid'] for row in db.execute("SELECT uid FROM users")])
+        finally:
+            db.close()
+        save_summary(db_summary_path(db_path), summary)
+    return summary
+
+
+def load_attendance_db(db_path):
+    """Charger toute la base sous la forme historique {uid: {'name', 'records'}}"""
+    db = connect_db(db_path)
+    try:
+        data = {
+            row['uid']: {'name': row['name'], 'records': []}
+            for row in db.execute("SELECT uid, name FROM users")
+        }
+        for row in db.execute("SELECT * FROM attendance ORDER BY uid, timestamp"):
+            data.setdefault(row['uid'], {'name': f"Utilisateur #{row['uid']}", 'records': []})
+            data[row['uid']]['records'].append(_row_to_record(row))
+        return data
+    finally:
+        db.close()
+
+
+def list_users_db(db_path):
+    """Liste [(uid, nom, nombre de pointages)] calculée par la base"""
+    db = connect_db(db_path)
+    try:
+        rows = db.execute(
+            "SELECT u.uid, u.name, COUNT(a.timestamp) AS total "
+            "FROM users u LEFT JOIN attendance a ON a.uid = u.uid "
+            "GROUP BY u.uid, u.name"
+        )
+        return [(row['uid'], row['name'], row['total']) for row in rows]
+    finally:
+        db.close()
+
+
+def query_user_records_db(db_path, uid, date_debut=None, date_fin=None):
+    """Pointages d'un utilisateur entre deux dates incluses (None = sans borne), triés"""
+    # Les bornes de date sont traduites en bornes d'horodatage pour utiliser la clé primaire
+    sql = "SELECT * FROM attendance WHERE uid = ?"
+    params = [uid]
+    if date_debut:
+        sql += " AND timestamp >= ?"
+        params.append(f"{date_debut} 00:00:00")
+    if date_fin:
+        sql += " AND timestamp <= ?"
+        params.append(f"{date_fin} 23:59:59")
+    sql += " ORDER BY timestamp"
+
+    db = connect_db(db_path)
+    try:
+        return [_row_to_record(row) for row in db.execute(sql, params)]
+    finally:
+        db.close()
+
+
+def query_date_range_db(db_path, date_debut, date_fin):
+    """Pointages de tous les utilisateurs entre deux dates incluses: [(uid, pointage)]"""
+    db = connect_db(db_path)
+    try:
+        rows = db.execute(
+            "SELECT * FROM attendance WHERE date BETWEEN ? AND ? ORDER BY date, uid, timestamp",
+            (date_debut, date_fin)
+        )
+        return [(row['uid'], _row_to_record(row)) for row in rows]
+    finally:
+        db.close()
+
+
+def iter_records_db(db_path, date_debut=None, date_fin=None, uids=None):
+    """Parcourir les pointages sans tout charger: (uid, nom, pointage) par utilisateur puis horodatage
+
+    Les lignes sont lues au fil de l'itération (curseur SQLite); date_debut/date_fin incluses
+    (None = sans borne), uids: liste d'UID (None = tous).
+    """
+    sql = ("SELECT a.*, u.name AS name FROM attendance a LEFT JOIN users u ON u.uid = a.uid "
+           "WHERE 1 = 1")
+    params = []
+    if date_debut:
+        sql += " AND a.date >= ?"
+        params.append(date_debut)
+    if date_fin:
+        sql += " AND a.date <= ?"
+        params.append(date_fin)
+    if uids is not None:
+        uids = sorted(set(uids))
+        sql += f" AND a.uid IN ({', '.join('?' * len(uids))})"
+        params.extend(uids)
+    sql += " ORDER BY a.uid, a.timestamp"
+
+    db = connect_db(db_path)
+    try:
+        for row in db.execute(sql, params):
+            yield row['uid'], row['name'] or f"Utilisateur #{row['uid']}", _row_to_record(row)
+    finally:
+        db.close()
+
+
+def migrate_to_sqlite(source, db_path):
+    """Importer attendance.json (ou un répertoire attendance_store) dans la base; retourne le nombre inséré"""
+    if os.path.isdir(source):
+        from attendance_store import load_attendance_store
+        data = load_attendance_store(source)
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+    names = {uid: user_data['name'] for uid, user_data in data.items()}
+    db = connect_db(db_path)
+    try:
+        with db:
+            inserted = _insert_records(db, {uid: user_data['records'] for uid, user_data in data.items()}, names)
+        summary = load_summary(db_summary_path(db_path)) or {}
+        _refresh_summary(db, summary, list(data))
+        save_summary(db_summary_path(db_path), summary)
+        return inserted
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) != 4 or sys.argv[1] != 'migrate':
+        print("Usage: python attendance_sqlite.py migrate <attendance.json|attendance_store> <base.db>")
+        sys.exit(1)
+
+    inseres = migrate_to_sqlite(sys.argv[2], sys.argv[3])
+    print("Migration terminée!")
+    print(f"  - Pointages importés: {inseres}")
+    print(f"  - Base: {sys.argv[3]}")
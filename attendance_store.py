@@ -0,0 +1,395 @@
+"""Stockage des pointages en segments JSONL en ajout seul.
+
+Le répertoire du stockage contient:
+  - manifest.json        : liste des segments (avec le premier et le dernier horodatage de
+                           chacun), noms des utilisateurs
+  - segment-000001.jsonl : un pointage par ligne ({'uid', 'timestamp', 'date', ...})
+
+  - summary.json         : résumé par utilisateur (nombre, premier/dernier pointage,
+                           derniers pointages), tenu à jour à chaque ajout
+
+Une synchronisation ajoute uniquement les nouveaux pointages à la fin du segment actif;
+les segments pleins ne sont jamais réécrits. La compaction regroupe tous les segments
+en segments triés et dédupliqués.
+
+Les écritures (ajout, réécriture, compaction, migration) sont protégées par un verrou
+inter-processus sur le répertoire (<répertoire>.lock): une synchronisation lancée par cron
+et une capture en direct ne peuvent pas écrire le même segment en même temps.
+"""
+
+import heapq
+import json
+import os
+
+from safe_io import FileLock, atomic_write_json
+
+MANIFEST_NAME = "manifest.json"
+SUMMARY_NAME = "summary.json"
+# Nombre de derniers pointages conservés par utilisateur dans le résumé
+SUMMARY_TAIL = 10
+# Nombre maximal de pointages par segment avant d'en ouvrir un nouveau
+SEGMENT_MAX_RECORDS = 50000
+
+# Types de pointage ZK
+PUNCH_TYPES = {
+    0: 'Entrée',
+    1: 'Sortie',
+    2: 'Pause début',
+    3: 'Pause fin',
+    4: 'HS entrée',
+    5: 'HS sortie'
+}
+PUNCH_CODES = {name: code for code, name in PUNCH_TYPES.items()}
+
+
+def record_punch_code(pointage):
+    """Code du type de pointage d'un enregistrement JSON (None si inconnu)"""
+    if 'type_code' in pointage:
+        return pointage['type_code']
+    # Anciens enregistrements sans 'type_code'
+    type_name = str(pointage.get('type', ''))
+    if type_name in PUNCH_CODES:
+        return PUNCH_CODES[type_name]
+    if type_name.isdigit():
+        return int(type_name)
+    return None
+
+
+def _manifest_path(store_dir):
+    return os.path.join(store_dir, MANIFEST_NAME)
+
+
+def _segment_name(number):
+    return f"segment-{number:06d}.jsonl"
+
+
+def _empty_manifest():
+    return {'version': 1, 'segments': [], 'users': {}, 'next_segment': 1}
+
+
+def store_exists(store_dir):
+    """Vérifier si le stockage segmenté a déjà été initialisé"""
+    return os.path.exists(_manifest_path(store_dir))
+
+
+def load_manifest(store_dir):
+    """Charger le manifeste du stockage (vide s'il n'existe pas encore)"""
+    if store_exists(store_dir):
+        with open(_manifest_path(store_dir), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return _empty_manifest()
+
+
+def save_manifest(store_dir, manifest):
+    """Sauvegarder le manifeste (écriture dans un fichier temporaire puis renommage)"""
+    atomic_write_json(_manifest_path(store_dir), manifest)
+
+
+def store_summary_path(store_dir):
+    """Chemin du résumé d'un stockage segmenté"""
+    return os.path.join(store_dir, SUMMARY_NAME)
+
+
+def load_summary(path):
+    """Charger un résumé {uid: {'name', 'count', 'first', 'last', 'tail'}} (None s'il n'existe pas)"""
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return None
+
+
+def save_summary(path, summary):
+    """Sauvegarder un résumé (écriture dans un fichier temporaire puis renommage)"""
+    atomic_write_json(path, summary, indent=None)
+
+
+def build_summary(data):
+    """Construire le résumé complet depuis la vue {uid: {'name', 'records'}}"""
+    summary = {}
+    for uid, user_data in data.items():
+        records = user_data['records']
+        summary[uid] = {
+            'name': user_data['name'],
+            'count': len(records),
+            'first': records[0]['timestamp'] if records else None,
+            'last': records[-1]['timestamp'] if records else None,
+            'tail': records[-SUMMARY_TAIL:]
+        }
+    return summary
+
+
+def update_summary(summary, new_records, names):
+    """Mettre à jour le résumé avec des pointages nouveaux et dédupliqués ({uid: [pointage, ...]})"""
+    for uid, records in new_records.items():
+        if not records:
+            continue
+        ordered = sorted(records, key=lambda x: x['timestamp'])
+        entry = summary.setdefault(uid, {
+            'name': names.get(uid, f'Utilisateur #{uid}'),
+            'count': 0, 'first': None, 'last': None, 'tail': []
+        })
+        entry['count'] += len(ordered)
+        if entry['first'] is None or ordered[0]['timestamp'] < entry['first']:
+            entry['first'] = ordered[0]['timestamp']
+        if entry['last'] is None or ordered[-1]['timestamp'] > entry['last']:
+            entry['last'] = ordered[-1]['timestamp']
+        entry['tail'] = merge_sorted_records(list(entry['tail']), ordered)[-SUMMARY_TAIL:]
+    return summary
+
+
+def merge_sorted_records(records, new_records):
+    """Fusionner des pointages triés dans une liste déjà triée par horodatage"""
+    if not records or new_records[0]['timestamp'] >= records[-1]['timestamp']:
+        # Cas courant: les nouveaux pointages sont tous postérieurs
+        records.extend(new_records)
+        return records
+    return list(heapq.merge(records, new_records, key=lambda x: x['timestamp']))
+
+
+def iter_segment(store_dir, segment):
+    """Parcourir les pointages d'un segment (seules les lignes validées par le manifeste)"""
+    path = os.path.join(store_dir, segment['file'])
+    with open(path, 'r', encoding='utf-8') as f:
+        for _ in range(segment['records']):
+            line = f.readline()
+            if not line:
+                break
+            yield json.loads(line)
+
+
+def iter_store_records(store_dir):
+    """Parcourir tous les pointages du stockage, segment par segment"""
+    manifest = load_manifest(store_dir)
+    for segment in manifest['segments']:
+        yield from iter_segment(store_dir, segment)
+
+
+def iter_store_records_since(store_dir, since):
+    """Parcourir les pointages d'horodatage >= since ('YYYY-MM-DD HH:MM:SS')
+
+    Les segments entièrement antérieurs (d'après leurs bornes dans le manifeste) ne sont
+    pas lus; un segment sans bornes (stockage antérieur) est toujours lu.
+    """
+    manifest = load_manifest(store_dir)
+    for segment in manifest['segments']:
+        if segment.get('last') is not None and segment['last'] < since:
+            continue
+        for record in iter_segment(store_dir, segment):
+            if record['timestamp'] >= since:
+                yield record
+
+
+def _segment_bounds(segment, timestamps):
+    """Élargir les bornes (premier/dernier horodatage) d'un segment"""
+    if not timestamps:
+        return
+    first, last = min(timestamps), max(timestamps)
+    if segment.get('first') is None or first < segment['first']:
+        segment['first'] = first
+    if segment.get('last') is None or last > segment['last']:
+        segment['last'] = last
+
+
+def _add_missing_bounds(store_dir, manifest):
+    """Calculer une fois les bornes des segments écrits avant leur ajout au manifeste"""
+    for segment in manifest['segments']:
+        if segment['records'] and 'last' not in segment:
+            _segment_bounds(segment, [record['timestamp'] for record in iter_segment(store_dir, segment)])
+
+
+def load_attendance_store(store_dir):
+    """Charger le stockage sous la forme historique {uid: {'name', 'records'}}"""
+    manifest = load_manifest(store_dir)
+    users = manifest['users']
+    data = {}
+
+    for segment in manifest['segments']:
+        # Regrouper le segment par utilisateur puis fusionner dans les listes triées
+        by_uid = {}
+        for record in iter_segment(store_dir, segment):
+            uid = record.pop('uid')
+            by_uid.setdefault(uid, []).append(record)
+
+        for uid, records in by_uid.items():
+            if uid not in data:
+                data[uid] = {
+                    'name': users.get(uid, f'Utilisateur #{uid}'),
+                    'records': []
+                }
+            records.sort(key=lambda x: x['timestamp'])
+            data[uid]['records'] = merge_sorted_records(data[uid]['records'], records)
+
+    # Utilisateurs connus sans pointage
+    for uid, name in users.items():
+        if uid not in data:
+            data[uid] = {'name': name, 'records': []}
+
+    return data
+
+
+def _record_lines(new_records):
+    """Sérialiser {uid: [pointage, ...]} en lignes JSONL [(horodatage, ligne)]"""
+    return [
+        (record['timestamp'],
+         json.dumps(dict(record, uid=uid), ensure_ascii=False, separators=(',', ':')) + "\n")
+        for uid, records in new_records.items()
+        for record in records
+    ]
+
+
+def _write_lines(store_dir, manifest, lines):
+    """Écrire des lignes à la fin du segment actif, en ouvrant de nouveaux segments si nécessaire"""
+    os.makedirs(store_dir, exist_ok=True)
+    position = 0
+    while position < len(lines):
+        segments = manifest['segments']
+        if not segments or segments[-1]['records'] >= SEGMENT_MAX_RECORDS:
+            segments.append({
+                'file': _segment_name(manifest['next_segment']),
+                'records': 0,
+                'bytes': 0
+            })
+            manifest['next_segment'] += 1
+
+        segment = segments[-1]
+        batch = lines[position:position + SEGMENT_MAX_RECORDS - segment['records']]
+        path = os.path.join(store_dir, segment['file'])
+
+        with open(path, 'ab') as f:
+            # Ignorer une éventuelle fin de fichier écrite par une synchronisation interrompue
+            if f.tell() != segment['bytes']:
+                f.truncate(segment['bytes'])
+                f.seek(segment['bytes'])
+            f.write(''.join(line for _, line in batch).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+            segment['bytes'] = f.tell()
+
+        segment['records'] += len(batch)
+        _segment_bounds(segment, [timestamp for timestamp, _ in batch])
+        position += len(batch)
+
+
+def append_attendance_records(store_dir, new_records, names):
+    """Ajouter des pointages à la fin du stockage sans réécrire les segments existants
+
+    new_records: {uid: [pointage, ...]}
+    names: {uid: nom} utilisé pour les utilisateurs encore inconnus du stockage
+    """
+    with FileLock(store_dir):
+        # Manifeste relu sous le verrou: il inclut les ajouts des autres processus
+        manifest = load_manifest(store_dir)
+
+        for uid in new_records:
+            if uid not in manifest['users']:
+                manifest['users'][uid] = names.get(uid, f'Utilisateur #{uid}')
+
+        _add_missing_bounds(store_dir, manifest)
+        lines = _record_lines(new_records)
+        _write_lines(store_dir, manifest, lines)
+        save_manifest(store_dir, manifest)
+
+        # Résumé tenu à jour incrémentalement (reconstruit s'il n'existe pas encore)
+        summary = load_summary(store_summary_path(store_dir))
+        if summary is None:
+            summary = build_summary(load_attendance_store(store_dir))
+        else:
+            update_summary(summary, new_records, names)
+        save_summary(store_summary_path(store_dir), summary)
+
+    return len(lines)
+
+
+def write_attendance_store(store_dir, data):
+    """Réécrire tout le stockage à partir de la vue {uid: {'name', 'records'}}
+
+    Les nouveaux segments sont écrits à côté des anciens; le manifeste bascule ensuite
+    en une seule opération et les anciens segments sont supprimés.
+    """
+    with FileLock(store_dir):
+        _write_attendance_store(store_dir, data)
+
+
+def _write_attendance_store(store_dir, data):
+    """write_attendance_store, verrou déjà tenu par l'appelant"""
+    old_manifest = load_manifest(store_dir)
+
+    manifest = _empty_manifest()
+    manifest['next_segment'] = old_manifest['next_segment']
+    manifest['users'] = {uid: user_data['name'] for uid, user_data in data.items()}
+
+    records = {uid: user_data['records'] for uid, user_data in data.items() if user_data['records']}
+    _write_lines(store_dir, manifest, _record_lines(records))
+    save_manifest(store_dir, manifest)
+    save_summary(store_summary_path(store_dir), build_summary(data))
+
+    for segment in old_manifest['segments']:
+        path = os.path.join(store_dir, segment['file'])
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def compact_attendance_store(store_dir):
+    """Regrouper tous les segments en segments triés et sans doublons"""
+    with FileLock(store_dir):
+        data = load_attendance_store(store_dir)
+        before = sum(len(user_data['records']) for user_data in data.values())
+
+        for user_data in data.values():
+            seen = set()
+            unique = []
+            for record in user_data['records']:
+                # Même clé que l'index de déduplication et la clé primaire SQLite
+                key = (record['timestamp'], record_punch_code(record))
+                if key not in seen:
+                    seen.add(key)
+                    unique.append(record)
+            user_data['records'] = unique
+
+        _write_attendance_store(store_dir, data)
+    after = sum(len(user_data['records']) for user_data in data.values())
+    return before, after
+
+
+def load_store_summary(store_dir):
+    """Résumé du stockage, reconstruit une seule fois s'il manque"""
+    summary = load_summary(store_summary_path(store_dir))
+    if summary is None:
+        summary = build_summary(load_attendance_store(store_dir))
+        if store_exists(store_dir):
+            save_summary(store_summary_path(store_dir), summary)
+    return summary
+
+
+def migrate_legacy_attendance(legacy_file, store_dir):
+    """Importer l'ancien fichier attendance.json dans le stockage segmenté (une seule fois)"""
+    if store_exists(store_dir) or not os.path.exists(legacy_file):
+        return False
+    with FileLock(store_dir):
+        # Un autre processus a pu faire la migration pendant l'attente du verrou
+        if store_exists(store_dir):
+            return False
+        with open(legacy_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        _write_attendance_store(store_dir, data)
+    return True
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) != 3 or sys.argv[1] != 'compact':
+        print("Usage: python attendance_store.py compact <répertoire du stockage>")
+        sys.exit(1)
+
+    store_dir = sys.argv[2]
+    if not store_exists(store_dir):
+        print(f"Aucun stockage trouvé dans {store_dir}")
+        sys.exit(1)
+
+    segments_avant = len(load_manifest(store_dir)['segments'])
+    avant, apres = compact_attendance_store(store_dir)
+    segments_apres = len(load_manifest(store_dir)['segments'])
+    print("Compaction terminée!")
+    print(f"  - Segments: {segments_avant} -> {segments_apres}")
+    print(f"  - Pointages: {avant} -> {apres} ({avant - apres} doublon(s) supprimé(s))")
@@ -0,0 +1,374 @@
+"""Synchronisation des pointages: curseurs par appareil et synchronisation d'un parc.
+
+Le curseur d'un appareil (nombre de pointages et dernier pointage connu) permet de ne
+traiter que les pointages au-delà de la dernière synchronisation. Le mode parc lit un
+inventaire d'appareils et les synchronise en parallèle dans un groupe de threads borné:
+chaque thread télécharge et convertit les pointages de son appareil, puis le thread
+principal, seul à écrire, les fusionne dans le stockage avec le numéro de série de
+l'appareil sur chaque pointage. Un appareil lent ou hors ligne ne bloque pas les autres:
+au-delà de son délai, sa connexion est fermée (le thread échoue aussitôt au lieu de continuer
+en arrière-plan) et ses éventuels résultats tardifs sont ignorés.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from attendance_store import PUNCH_TYPES, record_punch_code
+from safe_io import atomic_write_json
+
+# Nombre d'appareils synchronisés simultanément
+FLEET_MAX_WORKERS = 8
+# Délai maximal (secondes) accordé à un appareil pour toute sa synchronisation
+DEVICE_SYNC_TIMEOUT = 300
+# Délai (secondes) de chaque échange réseau avec un appareil, ouverture de connexion comprise
+DEVICE_SOCKET_TIMEOUT = 5
+
+
+def load_sync_state(state_path):
+    """Charger les curseurs de synchronisation (un par appareil)"""
+    if os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def save_sync_state(state_path, state):
+    """Sauvegarder les curseurs de synchronisation (écriture atomique)"""
+    atomic_write_json(state_path, state)
+
+
+def device_key_for(ip, port=4370):
+    """Clé d'un appareil sans numéro de série lisible ('ip:port')
+
+    Le curseur d'un appareil est rangé sous son numéro de série, ou à défaut sous cette clé,
+    quelle que soit la synchronisation (menu, parc, temps réel).
+    """
+    return f"{ip}:{port}"
+
+
+def get_serial(conn):
+    """Numéro de série de l'appareil, ou None s'il n'est pas lisible"""
+    try:
+        return conn.get_serialnumber() or None
+    except Exception:
+        return None
+
+
+def record_cursor_key(record):
+    """Clé identifiant un pointage de l'appareil (user_id, horodatage, type)"""
+    return [str(record.user_id), record.timestamp.strftime('%Y-%m-%d %H:%M:%S'), record.punch]
+
+
+def find_new_attendance(attendance, cursor):
+    """Retourner les pointages au-delà du curseur, ou None si une resynchronisation complète est nécessaire"""
+    if not cursor or not cursor.get('last_key'):
+        return None
+
+    count = cursor.get('count', 0)
+    last_key = cursor['last_key']
+
+    # Cas normal: le journal a seulement grandi, le dernier pointage connu est à la même position
+    if 0 < count <= len(attendance) and record_cursor_key(attendance[count - 1]) == last_key:
+        return attendance[count:]
+
+    # Journal plein (rotation): les plus anciens pointages ont été supprimés, on cherche
+    # le dernier pointage connu en partant de la fin
+    for i in range(min(count, len(attendance)) - 1, -1, -1):
+        if record_cursor_key(attendance[i]) == last_key:
+            return attendance[i + 1:]
+
+    # Journal effacé ou remplacé
+    return None
+
+
+def make_cursor(attendance):
+    """Curseur pointant sur le dernier pointage du journal téléchargé"""
+    return {
+        'count': len(attendance),
+        'last_timestamp': attendance[-1].timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        'last_key': record_cursor_key(attendance[-1]),
+        'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def advance_cursor(cursor, records):
+    """Curseur après l'ajout de pointages reçus en direct (à la fin du journal de l'appareil)"""
+    return {
+        'count': (cursor or {}).get('count', 0) + len(records),
+        'last_timestamp': records[-1].timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        'last_key': record_cursor_key(records[-1]),
+        'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+class AttendanceIndex:
+    """Index de déduplication {(uid, horodatage, type)} des pointages enregistrés
+
+    Un pointage de l'appareil ne peut être un doublon que d'un pointage de même horodatage:
+    seuls les pointages enregistrés à partir du plus ancien horodatage à vérifier sont
+    chargés (load(since) -> pointages {'uid', 'timestamp', ...}). Une synchronisation
+    incrémentale ne lit donc que les derniers segments; la fenêtre n'est élargie que si des
+    pointages plus anciens arrivent (resynchronisation complète).
+
+    load=None: le stockage déduplique lui-même (SQLite), l'index ne contient que les
+    pointages ajoutés depuis sa création.
+    """
+
+    def __init__(self, load=None):
+        self.load = load
+        self.since = None
+        self.keys = set()
+
+    def cover(self, since):
+        """S'assurer que les pointages enregistrés à partir de since sont dans l'index"""
+        if self.load is None or (self.since is not None and self.since <= since):
+            return
+        self.keys.update((r['uid'], r['timestamp'], record_punch_code(r)) for r in self.load(since))
+        self.since = since
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def add(self, key):
+        self.keys.add(key)
+
+
+def record_to_pointage(record, device=None):
+    """Convertir un pointage pyzk au format du stockage (avec le numéro de série de l'appareil)"""
+    pointage = {
+        'timestamp': record.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        'date': record.timestamp.strftime('%Y-%m-%d'),
+        'heure': record.timestamp.strftime('%H:%M:%S'),
+        'type': PUNCH_TYPES.get(record.punch, f'Type {record.punch}'),
+        'type_code': record.punch,
+        'status': record.status
+    }
+    if device:
+        pointage['device'] = device
+    return pointage
+
+
+def select_new_records(records, index, device=None):
+    """Pointages absents de l'index (AttendanceIndex), groupés par uid et triés; l'index est mis à jour"""
+    pending = {}
+    if records:
+        index.cover(min(record.timestamp for record in records).strftime('%Y-%m-%d %H:%M:%S'))
+    for record in records:
+        uid = str(record.user_id)
+        timestamp = record.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+
+        # Les anciens enregistrements sans type sont comparés sur l'horodatage
+        key = (uid, timestamp, record.punch)
+        if key in index or (uid, timestamp, None) in index:
+            continue
+        index.add(key)
+        pending.setdefault(uid, []).append(record_to_pointage(record, device))
+
+    for nouveaux in pending.values():
+        nouveaux.sort(key=lambda x: x['timestamp'])
+    return pending
+
+
+def load_inventory(inventory_path):
+    """Charger l'inventaire des appareils (liste JSON de {'name', 'ip', 'port', ...})"""
+    with open(inventory_path, 'r', encoding='utf-8') as f:
+        devices = json.load(f)
+    for device in devices:
+        device.setdefault('name', device['ip'])
+    return devices
+
+
+def connect_device(device):
+    """Se connecter à un appareil de l'inventaire avec pyzk
+
+    Chaque échange est borné par 'timeout' (DEVICE_SOCKET_TIMEOUT par défaut). pyzk ajoute
+    avant la connexion un ping (5 s au plus, sauf ommit_ping) et un test TCP (10 s au plus,
+    non réglable): un appareil injoignable libère son thread en moins de 15 s + 2 × timeout.
+    """
+    from zk import ZK
+
+    zk = ZK(device['ip'], port=device.get('port', 4370), timeout=device.get('timeout', DEVICE_SOCKET_TIMEOUT),
+            password=device.get('password', 0), force_udp=device.get('force_udp', False),
+            ommit_ping=device.get('ommit_ping', False))
+    return zk.connect()
+
+
+def read_new_attendance(conn, sync_state, full=False, default_serial=None):
+    """Lire les pointages d'un appareil connecté au-delà de son curseur
+
+    default_serial: clé de l'appareil s'il n'a pas de numéro de série (device_key_for)
+    Retourne {'serial', 'records', 'names', 'cursor', 'total', 'resync'}; 'records' vaut None
+    si le journal de l'appareil n'a pas changé depuis la dernière synchronisation.
+    """
+    serial = get_serial(conn) or default_serial
+    cursor = None if full else sync_state.get(serial)
+    result = {'serial': serial, 'records': None, 'names': {}, 'cursor': cursor,
+              'total': None, 'resync': False}
+
+    # Journal inchangé (et pas plein, donc sans rotation): rien à télécharger
+    conn.read_sizes()
+    log_full = conn.rec_cap and conn.records >= conn.rec_cap
+    if cursor and conn.records == cursor.get('count') and not log_full:
+        result['total'] = conn.records
+        return result
+
+    attendance = conn.get_attendance()
+    result['total'] = len(attendance)
+    if not attendance:
+        result['records'] = []
+        result['cursor'] = None
+        return result
+
+    to_process = find_new_attendance(attendance, cursor) if cursor else None
+    if to_process is None:
+        result['resync'] = bool(cursor)
+        to_process = attendance
+    result['records'] = to_process
+    result['names'] = {str(user.uid): user.name for user in conn.get_users()}
+    result['cursor'] = make_cursor(attendance)
+    return result
+
+
+def merge_new_attendance(result, sync_state, state_path, append, index):
+    """Ajouter au stockage les pointages lus par read_new_attendance et avancer le curseur
+
+    Retourne le nombre de pointages ajoutés.
+    """
+    if result['records'] is None:
+        return 0
+    added = 0
+    new_records = select_new_records(result['records'], index, result['serial'])
+    if new_records:
+        added = append(new_records, result['names'])
+    if result['cursor']:
+        sync_state[result['serial']] = result['cursor']
+    else:
+        sync_state.pop(result['serial'], None)
+    save_sync_state(state_path, sync_state)
+    return added
+
+
+def abort_connection(conn):
+    """Fermer le socket d'une connexion pyzk utilisée par un autre thread
+
+    L'échange en cours échoue aussitôt (réception interrompue) au lieu d'attendre la fin du
+    téléchargement.
+    """
+    sock = getattr(conn, '_ZK__sock', None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    sock.close()
+
+
+def fetch_device_attendance(device, sync_state, full=False, connect=connect_device, opened=None):
+    """Télécharger les nouveaux pointages d'un appareil (exécuté dans un thread du groupe)
+
+    opened: fonction (conn) appelée dès la connexion établie (abandon par sync_fleet)
+    """
+    conn = connect(device)
+    if opened is not None:
+        opened(conn)
+    try:
+        return read_new_attendance(conn, sync_state, full,
+                                   default_serial=device_key_for(device['ip'], device.get('port', 4370)))
+    finally:
+        conn.disconnect()
+
+
+def sync_fleet(devices, state_path, append, index=None, max_workers=FLEET_MAX_WORKERS,
+               full=False, connect=connect_device):
+    """Synchroniser tous les appareils de l'inventaire en parallèle
+
+    append: fonction (new_records, names) qui ajoute les pointages au stockage
+    index: index de déduplication (AttendanceIndex), ou None si le stockage déduplique
+    Retourne un rapport par appareil {'device', 'serial', 'status', 'new', 'duration', 'error'}.
+
+    La fonction rend la main sans attendre les appareils abandonnés. Le thread d'un appareil
+    abandonné pendant connect() ne peut pas être interrompu: il se termine à la fin de la
+    connexion (bornée, voir connect_device), et sa connexion est alors aussitôt fermée. Jusque-
+    là, il retarde la sortie de l'interpréteur (les threads du groupe sont attendus à la sortie).
+    """
+    sync_state = load_sync_state(state_path)
+    index = AttendanceIndex() if index is None else index
+    reports = []
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    # Par position dans l'inventaire: deux appareils peuvent porter le même nom
+    started = {}
+    connections = {}
+    abandoned = set()
+    lock = threading.Lock()
+
+    def opened(i, conn):
+        with lock:
+            connections[i] = conn
+            late = i in abandoned
+        if late:
+            # Connexion établie après l'abandon de l'appareil
+            abort_connection(conn)
+
+    def run(i, device):
+        started[i] = time.monotonic()
+        return fetch_device_attendance(device, sync_state, full, connect,
+                                       opened=lambda conn: opened(i, conn))
+
+    futures = {executor.submit(run, i, device): i for i, device in enumerate(devices)}
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+
+            for future in done:
+                i = futures[future]
+                device = devices[i]
+                report = {'device': device['name'], 'serial': None, 'status': 'ok', 'new': 0,
+                          'duration': round(now - started.get(i, now), 3), 'error': None}
+                try:
+                    result = future.result()
+                except Exception as e:
+                    report['status'] = 'erreur'
+                    report['error'] = str(e)
+                    reports.append(report)
+                    continue
+
+                report['serial'] = result['serial']
+                if result['records'] is None:
+                    report['status'] = 'inchangé'
+                else:
+                    # Fusion dans le stockage par le seul thread principal
+                    report['new'] = merge_new_attendance(result, sync_state, state_path, append, index)
+                    if result['resync']:
+                        report['status'] = 'resynchronisé'
+                reports.append(report)
+
+            # Appareils qui dépassent leur délai: connexion fermée et résultat jamais fusionné
+            for future in list(pending):
+                i = futures[future]
+                device = devices[i]
+                start = started.get(i)
+                if (start is None or future.done() or
+                        now - start <= device.get('sync_timeout', DEVICE_SYNC_TIMEOUT)):
+                    continue
+                pending.discard(future)
+                with lock:
+                    abandoned.add(i)
+                    conn = connections.get(i)
+                if conn is not None:
+                    abort_connection(conn)
+                reports.append({'device': device['name'], 'serial': None, 'status': 'délai dépassé',
+                                'new': 0, 'duration': round(now - start, 3), 'error': None})
+    finally:
+        # Appareils pas encore commencés annulés; threads abandonnés laissés à leur fin (bornée)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return reports
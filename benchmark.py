@@ -0,0 +1,315 @@
+"""Banc de mesure des opérations de synchronisation, de restrictions et de requêtes.
+
+Pour chaque échelle (nombre de pointages; 1k, 10k et 100k par défaut), un jeu de données
+synthétique et reproductible est généré (utilisateurs, pointages et règles de restriction),
+puis chaque opération du script est chronométrée contre une connexion simulée en mémoire:
+
+  sync_complete      sync_attendance_to_json(full=True) sur un stockage vide
+  sync_incremental   sync_attendance_to_json() après 1 % de nouveaux pointages
+  sync_unchanged     sync_attendance_to_json() sans nouveau pointage
+  apply_restrictions apply_all_restrictions() avec environ un tiers des utilisateurs restreints
+  query_<filtre>     query_attendance() (filtres de get_user_attendance) sur un échantillon d'UID
+
+Chaque mesure donne la durée, le débit, le pic mémoire (tracemalloc) et le nombre
+d'allers-retours avec l'appareil. Le nombre d'allers-retours de la connexion simulée suit
+le découpage de pyzk (lectures en tampon par blocs de 0xFFC0 octets en TCP); avec
+--emulator, les commandes réellement reçues par zk_emulator.py sont comptées.
+
+Usage:
+    python benchmark.py --scales 1000,10000,100000 --backend json --output bench.json
+    python benchmark.py --compare bench.json
+
+Les résultats sont enregistrés en JSON pour comparer deux exécutions (--compare).
+"""
+
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from zk_cli import load_main_module
+from zk_emulator import generate_dataset
+
+# Échelles par défaut (nombre de pointages)
+DEFAULT_SCALES = (1000, 10000, 100000)
+# Nombre d'UID interrogés par filtre de requête
+QUERY_SAMPLE = 20
+# Taille d'un bloc des lectures en tampon de pyzk (TCP)
+PYZK_MAX_CHUNK = 0xFFC0
+# Taille des enregistrements transférés par l'appareil (format ZK8)
+USER_PACKET_SIZE = 72
+RECORD_SIZE = 40
+
+
+def users_for_scale(n_records):
+    """Nombre d'utilisateurs associé à une échelle (environ 10 pointages par utilisateur)"""
+    return max(10, min(n_records // 10, 60000))
+
+
+def generate_rules(uids, ratio=0.33, seed=0, today=None):
+    """Règles de restriction synthétiques (sections de disabled_users.json) pour ~ratio des UID"""
+    rng = random.Random(seed)
+    today = today or datetime.now()
+    data = {section: {} for section in (
+        'day_restrictions', 'day_activations', 'date_restrictions',
+        'date_activations', 'time_restrictions', 'time_activations')}
+
+    for uid in rng.sample(list(uids), int(len(uids) * ratio)):
+        uid = str(uid)
+        kind = rng.randrange(6)
+        if kind == 0:
+            data['day_restrictions'][uid] = rng.sample(range(1, 8), rng.randint(1, 3))
+        elif kind == 1:
+            data['day_activations'][uid] = rng.sample(range(1, 8), rng.randint(3, 6))
+        elif kind == 2:
+            data['date_restrictions'][uid] = [
+                (today + timedelta(days=rng.randint(-30, 30))).strftime('%Y-%m-%d') for _ in range(5)]
+        elif kind == 3:
+            data['date_activations'][uid] = [{'debut': (today - timedelta(days=5)).strftime('%Y-%m-%d'),
+                                              'fin': (today + timedelta(days=25)).strftime('%Y-%m-%d')}]
+        elif kind == 4:
+            debut = rng.randint(0, 22)
+            data['time_restrictions'][uid] = [{'debut': f'{debut:02d}:00', 'fin': f'{debut + 1:02d}:30'}]
+        else:
+            data['time_activations'][uid] = [{'debut': '08:00', 'fin': '18:00'}]
+    return data
+
+
+class FakeConnection:
+    """Connexion simulée en mémoire (interface pyzk) qui compte les allers-retours"""
+
+    def __init__(self, users, records, serial='BENCH0001'):
+        self._users = {u.uid: u for u in users}
+        self._records = records
+        self.serial = serial
+        self.users = len(users)
+        self.records = len(records)
+        self.rec_cap = max(len(records) * 2, 100000)
+        self.is_enabled = True
+        self.round_trips = 0
+
+    def _buffered_read(self, size):
+        # Préparation du tampon + un bloc par 0xFFC0 octets + libération
+        self.round_trips += 2 + -(-size // PYZK_MAX_CHUNK)
+
+    def read_sizes(self):
+        self.round_trips += 1
+        self.users = len(self._users)
+        self.records = len(self._records)
+        return True
+
+    def get_serialnumber(self):
+        self.round_trips += 1
+        return self.serial
+
+    def get_users(self):
+        self.read_sizes()
+        self._buffered_read(len(self._users) * USER_PACKET_SIZE)
+        return list(self._users.values())
+
+    def get_attendance(self):
+        self.read_sizes()
+        self._buffered_read(len(self._records) * RECORD_SIZE)
+        return list(self._records)
+
+    def get_templates(self):
+        # Aucun gabarit d'empreinte: pyzk s'arrête après read_sizes
+        self.read_sizes()
+        return []
+
+    def disable_device(self):
+        self.round_trips += 1
+        self.is_enabled = False
+
+    def enable_device(self):
+        self.round_trips += 1
+        self.is_enabled = True
+
+    def set_user(self, uid=None, name='', privilege=0, password='', group_id='', user_id='', card=0):
+        # Écriture + rafraîchissement, comme pyzk
+        self.round_trips += 2
+        from zk_protocol import User
+        self._users[uid] = User(uid, name, privilege, password, group_id, user_id or str(uid), card)
+
+    def delete_user(self, uid=0, user_id=''):
+        self.round_trips += 2
+        self._users.pop(uid, None)
+
+    def add_records(self, records):
+        self._records.extend(records)
+
+    def disconnect(self):
+        pass
+
+
+class EmulatorConnection:
+    """Connexion pyzk vers un zk_emulator.py local; les allers-retours sont comptés par l'émulateur"""
+
+    def __init__(self, users, records, serial='BENCH0001'):
+        from zk import ZK
+        from zk_emulator import DeviceEmulator, DeviceState, run_in_thread
+
+        self.state = DeviceState(users, records, serial=serial)
+        self.emulator = run_in_thread(DeviceEmulator(self.state, port=0))
+        self._conn = ZK('127.0.0.1', port=self.emulator.port, timeout=30, ommit_ping=True).connect()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    @property
+    def round_trips(self):
+        return self.state.stats['commands']
+
+    def add_records(self, records):
+        self.state.records.extend(records)
+        self.state.invalidate()
+
+    def disconnect(self):
+        self._conn.disconnect()
+        self.emulator.loop.call_soon_threadsafe(self.emulator.stop)
+
+
+def measure(name, func, conn, items):
+    """Chronométrer func(); retourne la mesure {'operation', 'seconds', ...}"""
+    trips_before = conn.round_trips
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'operation': name,
+        'seconds': round(seconds, 6),
+        'items': items,
+        'throughput': round(items / seconds, 1) if seconds > 0 else None,
+        'peak_memory_kb': round(peak / 1024, 1),
+        'round_trips': conn.round_trips - trips_before,
+    }
+
+
+def bench_scale(main, n_records, backend='json', emulator=False, seed=0):
+    """Mesurer toutes les opérations pour une échelle donnée"""
+    from user_cache import CachedConnection
+
+    n_users = users_for_scale(n_records)
+    total = n_records + n_records // 100
+    users, records = generate_dataset(n_users, total, seed=seed)
+    extra = records[n_records:]
+    records = records[:n_records]
+
+    workdir = tempfile.mkdtemp(prefix='zk_bench_')
+    main.ATTENDANCE_BACKEND = backend
+    main.ATTENDANCE_FILE = os.path.join(workdir, 'attendance.json')
+    main.ATTENDANCE_STORE_DIR = os.path.join(workdir, 'attendance_store')
+    main.ATTENDANCE_DB_FILE = os.path.join(workdir, 'attendance.db')
+    main.SYNC_STATE_FILE = os.path.join(workdir, 'sync_state.json')
+    main.DISABLED_USERS_FILE = os.path.join(workdir, 'disabled_users.json')
+    main.TEMPLATE_CACHE_FILE = os.path.join(workdir, 'templates.json.gz')
+
+    device = (EmulatorConnection if emulator else FakeConnection)(users, records)
+    conn = CachedConnection(device)
+    results = []
+    try:
+        results.append(measure('sync_complete', lambda: main.sync_attendance_to_json(conn, full=True),
+                               device, n_records))
+        device.add_records(extra)
+        results.append(measure('sync_incremental', lambda: main.sync_attendance_to_json(conn),
+                               device, len(extra)))
+        results.append(measure('sync_unchanged', lambda: main.sync_attendance_to_json(conn), device, 1))
+
+        main.save_disabled_users_data(generate_rules([u.uid for u in users], seed=seed), flush=True)
+        results.append(measure('apply_restrictions',
+                               lambda: (main.apply_all_restrictions(conn), main.flush_state()),
+                               device, n_users))
+
+        today = max(r.timestamp for r in records).date()
+        filters = {
+            'all': (None, None),
+            'today': (today.isoformat(), today.isoformat()),
+            'last_7_days': ((today - timedelta(days=7)).isoformat(), None),
+            'range': ((today - timedelta(days=30)).isoformat(), today.isoformat()),
+        }
+        sample = random.Random(seed).sample(range(1, n_users + 1), min(QUERY_SAMPLE, n_users))
+        for name, (date_debut, date_fin) in filters.items():
+            results.append(measure(
+                f'query_{name}',
+                lambda: [main.query_attendance(str(uid), date_debut, date_fin) for uid in sample],
+                device, len(sample)))
+    finally:
+        device.disconnect()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {'records': n_records, 'users': n_users, 'backend': backend, 'results': results}
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, backend='json', emulator=False, seed=0):
+    """Exécuter le banc pour toutes les échelles; retourne le rapport complet"""
+    main = load_main_module()
+    report = {
+        'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'connection': 'emulator' if emulator else 'fake',
+        'scales': [],
+    }
+    for n_records in scales:
+        print(f"Échelle {n_records} pointages ({backend})...", file=sys.stderr)
+        report['scales'].append(bench_scale(main, n_records, backend, emulator, seed))
+    return report
+
+
+def print_report(report, previous=None):
+    """Afficher les mesures (et l'écart avec une exécution précédente)"""
+    baseline = {}
+    if previous:
+        for scale in previous['scales']:
+            for r in scale['results']:
+                baseline[(scale['records'], scale['backend'], r['operation'])] = r
+
+    print(f"{'Échelle':>8} {'Opération':<20} {'Durée (s)':>10} {'Débit (/s)':>12} "
+          f"{'Mémoire (Ko)':>13} {'Allers-ret.':>11} {'Écart':>8}")
+    for scale in report['scales']:
+        for r in scale['results']:
+            ligne = (f"{scale['records']:>8} {r['operation']:<20} {r['seconds']:>10.4f} "
+                     f"{r['throughput'] or 0:>12.0f} {r['peak_memory_kb']:>13.0f} {r['round_trips']:>11}")
+            old = baseline.get((scale['records'], scale['backend'], r['operation']))
+            if old and old['seconds']:
+                ligne += f" {(r['seconds'] / old['seconds'] - 1) * 100:>+7.0f}%"
+            print(ligne)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Banc de mesure du script ZK")
+    parser.add_argument('--scales', default=','.join(str(s) for s in DEFAULT_SCALES),
+                        help="nombres de pointages, séparés par des virgules")
+    parser.add_argument('--backend', default='json', choices=('json', 'sqlite'))
+    parser.add_argument('--emulator', action='store_true',
+                        help="mesurer via pyzk contre zk_emulator.py au lieu de la connexion simulée")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json",
+                        help="fichier JSON des résultats")
+    parser.add_argument('--compare', help="résultats JSON d'une exécution précédente")
+    args = parser.parse_args()
+
+    report = run_benchmarks([int(s) for s in args.scales.split(',')], args.backend, args.emulator, args.seed)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    print_report(report, previous)
+    print(f"\nRésultats enregistrés dans {args.output}")
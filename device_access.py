@@ -0,0 +1,265 @@
+"""Restrictions appliquées par l'appareil lui-même: fuseaux horaires et groupes d'accès.
+
+Au lieu de supprimer puis recréer un utilisateur à chaque transition, les règles par jour
+de la semaine et par plage horaire (day_* et time_* de disabled_users.json) sont traduites
+en fuseaux horaires d'accès de l'appareil et envoyées une seule fois:
+
+  - pour chaque utilisateur, les minutes autorisées de chaque jour (mêmes règles et même
+    priorité que restriction_rules.py) forment au plus 3 fenêtres; la k-ième fenêtre de
+    chaque jour va dans le k-ième fuseau (7 jours, une fenêtre par jour);
+  - les fuseaux identiques sont partagés, et les utilisateurs ayant les mêmes fuseaux
+    partagent un groupe d'accès (group_id de l'utilisateur, envoyé par set_user);
+  - seuls les fuseaux, groupes et utilisateurs qui ont changé depuis le dernier envoi
+    (fichier d'état) sont réécrits.
+
+L'appareil autorise un utilisateur si l'un des fuseaux de son groupe contient l'instant:
+c'est exactement l'ensemble des minutes autorisées par les règles day_* et time_*. Les
+règles par date restent appliquées par le script (suppression/recréation): la désactivation
+l'emportant toujours, la combinaison des deux donne le même résultat que restriction_rules.py.
+
+Repli sur la suppression/recréation (règles inexprimables): plus de 3 fenêtres dans un jour,
+fenêtre 00:00-00:00 (réservée au jour sans accès), ou capacité de l'appareil atteinte
+(fuseaux FIRST_TIME_ZONE..LAST_TIME_ZONE, groupes FIRST_GROUP..LAST_GROUP). Le fuseau 1 et
+le groupe 1 (accès permanent par défaut) ne sont jamais modifiés.
+
+Les commandes CMD_TZ_WRQ et CMD_GRPTZ_WRQ n'ont pas de méthode dans pyzk 0.9: elles sont
+envoyées par zk_protocol.send_raw_command (point d'envoi public de la connexion, ou fonction
+interne de pyzk). Leur format n'a été essayé qu'avec l'émulateur: voir zk_protocol.py.
+"""
+
+import json
+import os
+
+from restriction_rules import RestrictionRules, compile_rules
+from safe_io import atomic_write_json
+from zk_protocol import (
+    CMD_GRPTZ_WRQ,
+    CMD_TZ_WRQ,
+    RawCommandUnsupported,
+    pack_group_time_zones,
+    pack_time_zone,
+    raw_command_sender,
+    send_raw_command,
+)
+
+# Plages de numéros utilisables (1 = accès permanent par défaut de l'appareil)
+FIRST_TIME_ZONE = 2
+LAST_TIME_ZONE = 50
+FIRST_GROUP = 2
+LAST_GROUP = 99
+# Nombre de fuseaux par groupe d'accès
+TIME_ZONES_PER_GROUP = 3
+# Ordre des jours dans un fuseau de l'appareil (dimanche d'abord), en numérotation ISO
+DEVICE_WEEKDAYS = (7, 1, 2, 3, 4, 5, 6)
+# Fenêtre d'un jour sans accès
+NO_ACCESS = (0, 0, 0, 0)
+
+
+class DeviceAccessError(Exception):
+    """L'appareil a refusé une commande de fuseau ou de groupe"""
+
+
+def _intersect(intervals, others):
+    return [(max(s, os_), min(e, oe)) for s, e in intervals for os_, oe in others
+            if max(s, os_) <= min(e, oe)]
+
+
+def _subtract(intervals, others):
+    result = []
+    for start, end in intervals:
+        current = start
+        for other_start, other_end in sorted(others):
+            if other_end < current or other_start > end:
+                continue
+            if other_start > current:
+                result.append((current, other_start - 1))
+            current = max(current, other_end + 1)
+        if current <= end:
+            result.append((current, end))
+    return result
+
+
+def weekly_windows(rules):
+    """Minutes autorisées par les règles day_*/time_* -> {jour ISO: [(début, fin)]}
+
+    Retourne None si l'utilisateur n'a aucune règle par jour ni par plage horaire.
+    """
+    if rules.day_off is None and rules.day_on is None and rules.time_off is None and rules.time_on is None:
+        return None
+    windows = {}
+    for day in range(1, 8):
+        bit = 1 << day
+        if ((rules.day_off is not None and rules.day_off & bit) or
+                (rules.day_on is not None and not rules.day_on & bit)):
+            windows[day] = []
+            continue
+        intervals = [(0, 1439)]
+        if rules.time_on is not None:
+            intervals = _intersect(intervals, list(zip(*rules.time_on)))
+        if rules.time_off is not None:
+            intervals = _subtract(intervals, list(zip(*rules.time_off)))
+        windows[day] = intervals
+    return windows
+
+
+def _device_window(interval):
+    start, end = interval
+    return (start // 60, start % 60, end // 60, end % 60)
+
+
+def _uid_order(uid):
+    return (0, int(uid), '') if str(uid).isdigit() else (1, 0, str(uid))
+
+
+def compile_device_access(disabled_data):
+    """Traduire les règles day_*/time_* en fuseaux et groupes de l'appareil
+
+    Retourne {'time_zones': {index: [7 fenêtres]}, 'groups': {groupe: [3 fuseaux]},
+              'users': {uid: groupe}, 'fallback': {uid: raison}}
+    """
+    rules = compile_rules(disabled_data)
+    zone_index = {}
+    group_index = {}
+    users = {}
+    fallback = {}
+    for uid in sorted(rules.users, key=_uid_order):
+        windows = weekly_windows(rules.users[uid])
+        if windows is None:
+            continue
+        if any(len(day) > TIME_ZONES_PER_GROUP for day in windows.values()):
+            fallback[uid] = f"plus de {TIME_ZONES_PER_GROUP} plages dans un jour"
+            continue
+        if any(interval == (0, 0) for day in windows.values() for interval in day):
+            fallback[uid] = "plage 00:00-00:00"
+            continue
+
+        slots = []
+        for k in range(max(1, max(len(day) for day in windows.values()))):
+            slots.append(tuple(_device_window(windows[day][k]) if k < len(windows[day]) else NO_ACCESS
+                               for day in DEVICE_WEEKDAYS))
+        new_zones = {slot for slot in slots if slot not in zone_index}
+        if FIRST_TIME_ZONE + len(zone_index) + len(new_zones) - 1 > LAST_TIME_ZONE:
+            fallback[uid] = "plus de fuseaux horaires disponibles"
+            continue
+        for slot in slots:
+            if slot not in zone_index:
+                zone_index[slot] = FIRST_TIME_ZONE + len(zone_index)
+
+        zones = tuple(sorted({zone_index[slot] for slot in slots}))
+        zones += (0,) * (TIME_ZONES_PER_GROUP - len(zones))
+        if zones not in group_index:
+            if FIRST_GROUP + len(group_index) > LAST_GROUP:
+                fallback[uid] = "plus de groupes d'accès disponibles"
+                continue
+            group_index[zones] = FIRST_GROUP + len(group_index)
+        users[uid] = group_index[zones]
+
+    return {
+        'time_zones': {index: [list(window) for window in slot] for slot, index in zone_index.items()},
+        'groups': {group: list(zones) for zones, group in group_index.items()},
+        'users': users,
+        'fallback': fallback,
+    }
+
+
+def host_rules(disabled_data, native_uids):
+    """Règles restant à appliquer par le script quand l'appareil applique day_*/time_*"""
+    rules = compile_rules(disabled_data)
+    users = {}
+    for uid, user_rules in rules.users.items():
+        if uid in native_uids:
+            user_rules.day_off = user_rules.day_on = None
+            user_rules.time_off = user_rules.time_on = None
+            if user_rules.date_off is None and user_rules.date_on is None:
+                continue
+        users[uid] = user_rules
+    return RestrictionRules(users)
+
+
+def load_access_state(path):
+    """État du dernier envoi (vide s'il n'existe pas)"""
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {'serial': None, 'time_zones': {}, 'groups': {}, 'users': {}}
+
+
+def plan_upload(compiled, state, device_users, serial=None):
+    """Écritures nécessaires pour passer de l'état envoyé à l'état compilé
+
+    device_users: {uid (str): utilisateur} lu sur l'appareil
+    Retourne {'time_zones': {index: fenêtres}, 'groups': {groupe: fuseaux},
+              'users': [(utilisateur, group_id)]}
+    """
+    if state.get('serial') != serial:
+        # Autre appareil (ou premier envoi): tout est réécrit
+        state = {'time_zones': {}, 'groups': {}, 'users': {}}
+    time_zones = {index: windows for index, windows in compiled['time_zones'].items()
+                  if state['time_zones'].get(str(index)) != windows}
+    groups = {group: zones for group, zones in compiled['groups'].items()
+              if state['groups'].get(str(group)) != zones}
+
+    users = []
+    for uid, group in compiled['users'].items():
+        user = device_users.get(uid)
+        if user is not None and str(user.group_id) != str(group):
+            users.append((user, str(group)))
+    # Utilisateurs qui ne sont plus gérés par l'appareil: groupe d'origine
+    for uid, entry in state['users'].items():
+        user = device_users.get(uid)
+        if uid not in compiled['users'] and user is not None and str(user.group_id) == str(entry['group']):
+            users.append((user, entry['previous']))
+    return {'time_zones': time_zones, 'groups': groups, 'users': users}
+
+
+def supports_device_access(conn):
+    """True si la connexion peut envoyer les commandes de fuseaux et de groupes"""
+    return raw_command_sender(conn) is not None
+
+
+def _send(conn, command, data):
+    try:
+        response = send_raw_command(conn, command, data)
+    except RawCommandUnsupported as e:
+        raise DeviceAccessError(str(e)) from e
+    if not response['status']:
+        raise DeviceAccessError(f"commande {command} refusée par l'appareil")
+
+
+def upload(conn, plan, users=True):
+    """Envoyer les fuseaux, les groupes et (users) les groupes des utilisateurs"""
+    if (plan['time_zones'] or plan['groups']) and not supports_device_access(conn):
+        raise DeviceAccessError(f"{type(conn).__name__} ne permet pas l'envoi des fuseaux horaires")
+    for index, windows in sorted(plan['time_zones'].items()):
+        _send(conn, CMD_TZ_WRQ, pack_time_zone(int(index), windows))
+    for group, zones in sorted(plan['groups'].items()):
+        _send(conn, CMD_GRPTZ_WRQ, pack_group_time_zones(int(group), zones))
+    for user, group_id in plan['users'] if users else ():
+        conn.set_user(uid=user.uid, name=user.name, privilege=user.privilege, password=user.password,
+                      group_id=group_id, user_id=user.user_id, card=user.card)
+    if plan['time_zones'] or plan['groups']:
+        conn.refresh_data()
+
+
+def save_access_state(path, compiled, state, device_users, serial=None, users=True):
+    """Mémoriser ce qui a été envoyé (et le groupe d'origine des utilisateurs)
+
+    users=False: seuls les fuseaux et les groupes ont été envoyés (upload(..., users=False)),
+    les groupes des utilisateurs restent ceux de l'état précédent.
+    """
+    previous_users = state.get('users', {}) if state.get('serial') == serial else {}
+    if not users:
+        compiled = dict(compiled, users={uid: entry['group'] for uid, entry in previous_users.items()})
+    users = {}
+    for uid, group in compiled['users'].items():
+        entry = previous_users.get(uid)
+        if entry is None:
+            user = device_users.get(uid)
+            entry = {'previous': str(user.group_id) if user is not None else ''}
+        users[uid] = {'group': group, 'previous': entry['previous']}
+    atomic_write_json(path, {
+        'serial': serial,
+        'time_zones': {str(index): windows for index, windows in compiled['time_zones'].items()},
+        'groups': {str(group): zones for group, zones in compiled['groups'].items()},
+        'users': users,
+    })
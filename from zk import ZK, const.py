@@ -1,37 +1,300 @@
-from zk import ZK, const
-
-import json
 import os
 from datetime import datetime
 
+from attendance_export import export_rows, filter_rows, iter_store_export, parse_punch_types
+from attendance_sqlite import (
+    append_attendance_db,
+    iter_records_db,
+    load_attendance_db,
+    load_db_summary,
+    migrate_to_sqlite,
+    query_user_records_db,
+    write_attendance_db,
+)
+from attendance_store import (
+    MANIFEST_NAME,
+    append_attendance_records,
+    iter_store_records_since,
+    load_attendance_store,
+    load_store_summary,
+    migrate_legacy_attendance,
+    store_exists,
+    write_attendance_store,
+)
+from attendance_sync import (
+    AttendanceIndex,
+    connect_device,
+    device_key_for,
+    load_inventory,
+    load_sync_state,
+    merge_new_attendance,
+    read_new_attendance,
+    sync_fleet,
+)
+from device_access import (
+    DeviceAccessError,
+    compile_device_access,
+    host_rules,
+    load_access_state,
+    plan_upload,
+    save_access_state,
+    supports_device_access,
+    upload,
+)
+from live_ingest import LiveIngest
+from metrics import METRICS, STORE_DEVICE, InstrumentedConnection, start_http_server
+from restriction_rules import (
+    add_date_ranges,
+    compile_rules,
+    count_days,
+    format_date_ranges,
+    migrate_date_rules,
+)
+from restriction_scheduler import RestrictionScheduler
+from safe_io import load_json_versioned, save_json_versioned
+from template_cache import backup_templates, forget_templates, load_templates, restore_user
+from state_cache import CachedView, DocumentCache, file_signature, flush_all, register
+from user_cache import CachedConnection
+from user_reconcile import apply_plan, describe_plan, estimate_seconds, plan_changes
+
 # Fichier pour sauvegarder les données des utilisateurs désactivés
 DISABLED_USERS_FILE = "d:\\Desktop\\ZK\\disabled_users.json"
-# Fichier pour sauvegarder les pointages
+# Ancien fichier des pointages (importé une seule fois dans le stockage segmenté)
 ATTENDANCE_FILE = "d:\\Desktop\\ZK\\attendance.json"
+# Répertoire du stockage des pointages (segments JSONL en ajout seul + manifeste)
+ATTENDANCE_STORE_DIR = "d:\\Desktop\\ZK\\attendance_store"
+# Base SQLite des pointages (utilisée si ATTENDANCE_BACKEND = 'sqlite')
+ATTENDANCE_DB_FILE = "d:\\Desktop\\ZK\\attendance.db"
+# Stockage des pointages: 'json' (segments JSONL) ou 'sqlite'
+ATTENDANCE_BACKEND = 'json'
+# Fichier pour sauvegarder le curseur de synchronisation de chaque appareil
+SYNC_STATE_FILE = "d:\\Desktop\\ZK\\sync_state.json"
+# Sauvegarde compressée des empreintes des utilisateurs désactivés
+TEMPLATE_CACHE_FILE = "d:\\Desktop\\ZK\\templates.json.gz"
+# Règles par jour et par plage horaire appliquées par l'appareil (fuseaux horaires et groupes
+# d'accès) au lieu de supprimer/recréer les utilisateurs; les règles par date restent appliquées ici
+NATIVE_ACCESS_CONTROL = False
+# État des fuseaux et groupes envoyés à l'appareil (seules les différences sont renvoyées)
+ACCESS_STATE_FILE = "d:\\Desktop\\ZK\\device_access.json"
+# Inventaire des appareils pour la synchronisation du parc
+DEVICES_FILE = "d:\\Desktop\\ZK\\devices.json"
+# Nombre d'appareils synchronisés en parallèle
+FLEET_MAX_WORKERS = 8
+# Port local des mesures au format Prometheus (http://127.0.0.1:9108/metrics), None pour désactiver
+METRICS_PORT = 9108
+
+def _migrate_attendance():
+    """Importer les pointages existants dans le stockage configuré (une seule fois)"""
+    if ATTENDANCE_BACKEND == 'sqlite':
+        if not os.path.exists(ATTENDANCE_DB_FILE):
+            if store_exists(ATTENDANCE_STORE_DIR):
+                migrate_to_sqlite(ATTENDANCE_STORE_DIR, ATTENDANCE_DB_FILE)
+            elif os.path.exists(ATTENDANCE_FILE):
+                migrate_to_sqlite(ATTENDANCE_FILE, ATTENDANCE_DB_FILE)
+    else:
+        migrate_legacy_attendance(ATTENDANCE_FILE, ATTENDANCE_STORE_DIR)
+
+def _storage_size():
+    """Taille (octets) du stockage des pointages configuré"""
+    if ATTENDANCE_BACKEND == 'sqlite':
+        return os.path.getsize(ATTENDANCE_DB_FILE) if os.path.exists(ATTENDANCE_DB_FILE) else 0
+    total = 0
+    for root, _dirs, files in os.walk(ATTENDANCE_STORE_DIR):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+def _read_attendance_data():
+    with METRICS.timer(STORE_DEVICE, 'load_attendance_data') as timer:
+        if ATTENDANCE_BACKEND == 'sqlite':
+            data = load_attendance_db(ATTENDANCE_DB_FILE)
+        else:
+            data = load_attendance_store(ATTENDANCE_STORE_DIR)
+        timer.records = sum(len(entry['records']) for entry in data.values())
+        timer.nbytes = _storage_size()
+    return data
+
+def _attendance_signature():
+    # Le manifeste est réécrit à chaque ajout au stockage segmenté
+    if ATTENDANCE_BACKEND == 'sqlite':
+        return ('sqlite', ATTENDANCE_DB_FILE, file_signature(ATTENDANCE_DB_FILE))
+    manifest = os.path.join(ATTENDANCE_STORE_DIR, MANIFEST_NAME)
+    return ('json', manifest, file_signature(manifest))
+
+# Vue des pointages gardée en mémoire tant que le stockage ne change pas
+_attendance_view = CachedView(_read_attendance_data, _attendance_signature)
 
 def load_attendance_data():
-    """Charger les données de pointage depuis le fichier JSON"""
-    if os.path.exists(ATTENDANCE_FILE):
-        with open(ATTENDANCE_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    """Charger les données de pointage ({uid: {'name', 'records'}}) depuis le stockage
+    
+    La vue est gardée en mémoire et n'est relue que si le stockage a changé (ajout par ce
+    processus ou par un autre): elle est partagée et ne doit pas être modifiée.
+    """
+    _migrate_attendance()
+    return _attendance_view.get()
 
 def save_attendance_data(data):
-    """Sauvegarder les données de pointage dans le fichier JSON"""
-    with open(ATTENDANCE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    """Réécrire entièrement le stockage des pointages à partir du dictionnaire"""
+    with METRICS.timer(STORE_DEVICE, 'save_attendance_data') as timer:
+        if ATTENDANCE_BACKEND == 'sqlite':
+            write_attendance_db(ATTENDANCE_DB_FILE, data)
+        else:
+            write_attendance_store(ATTENDANCE_STORE_DIR, data)
+        _attendance_view.invalidate()
+        timer.records = sum(len(entry['records']) for entry in data.values())
+        timer.nbytes = _storage_size()
+
+def append_attendance_data(new_records, names):
+    """Ajouter uniquement les nouveaux pointages ({uid: [pointage, ...]}) au stockage"""
+    _migrate_attendance()
+    with METRICS.timer(STORE_DEVICE, 'append_attendance_data') as timer:
+        size_before = _storage_size()
+        if ATTENDANCE_BACKEND == 'sqlite':
+            added = append_attendance_db(ATTENDANCE_DB_FILE, new_records, names)
+        else:
+            added = append_attendance_records(ATTENDANCE_STORE_DIR, new_records, names)
+        _attendance_view.invalidate()
+        timer.records = added
+        timer.nbytes = max(_storage_size() - size_before, 0)
+    return added
+
+def attendance_index():
+    """Index de déduplication des pointages, chargé à la demande par fenêtre de temps
+    
+    Avec SQLite la clé primaire déduplique: l'index reste vide.
+    """
+    _migrate_attendance()
+    if ATTENDANCE_BACKEND == 'sqlite':
+        return AttendanceIndex()
+    return AttendanceIndex(lambda since: iter_store_records_since(ATTENDANCE_STORE_DIR, since))
+
+def load_attendance_summary():
+    """Charger le résumé des pointages {uid: {'name', 'count', 'first', 'last', 'tail'}}
+    
+    Le résumé est tenu à jour à chaque synchronisation: il évite de charger tout l'historique
+    pour les vues qui n'affichent que les totaux et les derniers pointages.
+    """
+    _migrate_attendance()
+    with METRICS.timer(STORE_DEVICE, 'load_attendance_summary') as timer:
+        if ATTENDANCE_BACKEND == 'sqlite':
+            summary = load_db_summary(ATTENDANCE_DB_FILE)
+        else:
+            summary = load_store_summary(ATTENDANCE_STORE_DIR)
+        timer.records = len(summary)
+    return summary
+
+def list_attendance_users():
+    """Liste [(uid, nom, nombre de pointages)] des utilisateurs du stockage"""
+    return [(uid, entry['name'], entry['count']) for uid, entry in load_attendance_summary().items()]
+
+def query_attendance(uid, date_debut=None, date_fin=None):
+    """Pointages d'un utilisateur entre deux dates incluses (None = sans borne), ou None si inconnu"""
+    _migrate_attendance()
+    if ATTENDANCE_BACKEND == 'sqlite':
+        if uid not in load_attendance_summary():
+            return None
+        with METRICS.timer(STORE_DEVICE, 'query_attendance') as timer:
+            records = query_user_records_db(ATTENDANCE_DB_FILE, uid, date_debut, date_fin)
+            timer.records = len(records)
+        return records
+    
+    attendance_data = load_attendance_data()
+    if uid not in attendance_data:
+        return None
+    return [
+        r for r in attendance_data[uid]['records']
+        if (not date_debut or r['date'] >= date_debut) and (not date_fin or r['date'] <= date_fin)
+    ]
+
+def export_attendance(output, fmt='csv', compress=False, date_debut=None, date_fin=None,
+                      uids=None, punch_codes=None):
+    """Exporter les pointages filtrés en flux (attendance_export.py); retourne le nombre exporté
+    
+    Les pointages sont lus et écrits un par un: la mémoire ne dépend pas de l'historique.
+    """
+    _migrate_attendance()
+    with METRICS.timer(STORE_DEVICE, 'export_attendance') as timer:
+        if ATTENDANCE_BACKEND == 'sqlite':
+            rows = filter_rows(iter_records_db(ATTENDANCE_DB_FILE, date_debut, date_fin, uids), punch_codes)
+        else:
+            rows = iter_store_export(ATTENDANCE_STORE_DIR, date_debut, date_fin, uids, punch_codes)
+        count = export_rows(rows, output, fmt, compress)
+        timer.records = count
+        timer.nbytes = os.path.getsize(output)
+    return count
+
+def export_attendance_interactive():
+    """Exporter les pointages pour la paie (CSV, CSV compressé ou NDJSON)"""
+    print("\n=== Exporter les pointages ===")
+    date_debut = input("Date de début (YYYY-MM-DD, vide = sans borne): ").strip() or None
+    date_fin = input("Date de fin (YYYY-MM-DD, vide = sans borne): ").strip() or None
+    uids = input("UID à exporter (séparés par des virgules, vide = tous): ").strip()
+    types = input("Types de pointage (codes ou noms séparés par des virgules, vide = tous): ").strip()
+    fmt = input("Format (csv/ndjson) [csv]: ").strip().lower() or 'csv'
+    output = input(f"Fichier de sortie [pointages.{fmt}.gz]: ").strip() or f"pointages.{fmt}.gz"
+    
+    try:
+        for value in (date_debut, date_fin):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+        punch_codes = parse_punch_types(types.split(',')) if types else None
+        count = export_attendance(output, fmt, date_debut=date_debut, date_fin=date_fin,
+                                  uids=[uid.strip() for uid in uids.split(',') if uid.strip()] or None,
+                                  punch_codes=punch_codes)
+        print(f"{count} pointage(s) exportés dans {output}")
+    except ValueError as e:
+        print(f"Saisie invalide: {e}")
+
+def _read_disabled_users_file():
+    if not os.path.exists(DISABLED_USERS_FILE):
+        return load_json_versioned(DISABLED_USERS_FILE), False
+    with METRICS.timer(STORE_DEVICE, 'load_disabled_users_data') as timer:
+        data = load_json_versioned(DISABLED_USERS_FILE)
+        timer.nbytes = os.path.getsize(DISABLED_USERS_FILE)
+    # Anciennes listes d'un jour par date: converties une fois en plages fusionnées
+    return data, migrate_date_rules(data)
+
+def _write_disabled_users_file(data):
+    # Écriture atomique et verrouillée; si un autre processus (planificateur, autre
+    # opérateur) a modifié le fichier depuis la lecture, ses modifications sont conservées
+    with METRICS.timer(STORE_DEVICE, 'save_disabled_users_data') as timer:
+        conflicts = save_json_versioned(DISABLED_USERS_FILE, data)
+        timer.nbytes = os.path.getsize(DISABLED_USERS_FILE)
+    if conflicts:
+        print(f"Attention: modifié en même temps par un autre processus, valeurs locales conservées "
+              f"pour: {', '.join(conflicts)}")
+
+# Documents gardés en mémoire, par chemin (DISABLED_USERS_FILE peut être redéfini)
+_documents = {}
+
+def _disabled_users_document():
+    document = _documents.get(DISABLED_USERS_FILE)
+    if document is None:
+        document = _documents[DISABLED_USERS_FILE] = register(
+            DocumentCache(DISABLED_USERS_FILE, _read_disabled_users_file, _write_disabled_users_file))
+    return document
 
 def load_disabled_users_data():
-    """Charger les données des utilisateurs désactivés"""
-    if os.path.exists(DISABLED_USERS_FILE):
-        with open(DISABLED_USERS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    """Charger les données des utilisateurs désactivés
+    
+    Le document est gardé en mémoire pour toute la session et relu seulement s'il a été
+    modifié par un autre processus. Chaque appel retourne une copie: les modifications ne
+    comptent qu'après save_disabled_users_data.
+    """
+    return _disabled_users_document().load()
 
-def save_disabled_users_data(data):
-    """Sauvegarder les données des utilisateurs désactivés"""
-    with open(DISABLED_USERS_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+def save_disabled_users_data(data, flush=False):
+    """Sauvegarder les données des utilisateurs désactivés
+    
+    Les écritures sont regroupées (voir state_cache.py): flush=True écrit immédiatement.
+    """
+    document = _disabled_users_document()
+    document.save(data)
+    if flush:
+        document.flush()
+
+def flush_state():
+    """Écrire toutes les modifications en attente"""
+    flush_all()
 
 def add_user_interactive(conn):
     """Ajouter un utilisateur de manière interactive"""
@@ -68,6 +331,8 @@ def list_users(conn):
     print(f"Nombre total d'utilisateurs: {len(users)}\n")
     print("-"*50)
     
+    from zk import const
+    
     for user in users:
         privilege = 'User'
         if user.privilege == const.USER_ADMIN:
@@ -133,9 +398,17 @@ def disable_user_interactive(conn):
         'card': target_user.card
     }
     
-    # Sauvegarder dans le fichier JSON
+    # Sauvegarder dans le fichier JSON (écrit tout de suite: la fiche doit être sur disque
+    # avant la suppression sur l'appareil)
     disabled_data[str(uid)] = user_data
-    save_disabled_users_data(disabled_data)
+    save_disabled_users_data(disabled_data, flush=True)
+    
+    # Sauvegarder les empreintes (supprimées avec l'utilisateur)
+    try:
+        fingers = backup_templates(conn, [uid], TEMPLATE_CACHE_FILE)
+        print(f"{fingers} empreinte(s) sauvegardée(s).")
+    except Exception as e:
+        print(f"Attention: empreintes non sauvegardées ({e})")
     
     # Supprimer l'utilisateur de l'appareil (bloque l'accès)
     conn.delete_user(uid=uid)
@@ -241,23 +514,27 @@ def enable_user_interactive(conn):
         print(f"Card: {int(user_data['card']) if user_data['card'] else 0} (type: {type(int(user_data['card']) if user_data['card'] else 0).__name__})")
         print("-----------------------------------\n")
         
-        # Restaurer l'utilisateur sur l'appareil
-        result = conn.set_user(
-            uid=int(uid),
-            name=str(user_data['name']),
-            privilege=int(user_data['privilege']),
-            password=str(user_data['password']) if user_data['password'] else "",
-            group_id=group_id,
-            user_id=str(user_data['user_id']),
-            card=int(user_data['card']) if user_data['card'] else 0
-        )
+        # Restaurer l'utilisateur sur l'appareil, avec ses empreintes si elles sont sauvegardées
+        fingers = restore_user(conn, {
+            'uid': int(uid),
+            'name': str(user_data['name']),
+            'privilege': int(user_data['privilege']),
+            'password': str(user_data['password']) if user_data['password'] else "",
+            'group_id': group_id,
+            'user_id': str(user_data['user_id']),
+            'card': int(user_data['card']) if user_data['card'] else 0
+        }, load_templates(TEMPLATE_CACHE_FILE))
         
-        print(f"Résultat de set_user(): {result}")
+        print(f"Empreintes restaurées: {fingers}")
         
         # Vérifier que l'utilisateur a bien été restauré
         import time
         time.sleep(1)  # Attendre un peu que le device traite la commande
         
+        # Relire la table depuis l'appareil (et non depuis le cache)
+        if hasattr(conn, 'invalidate_users'):
+            conn.invalidate_users()
+        
         users = conn.get_users()
         user_found = False
         restored_user = None
@@ -274,11 +551,13 @@ def enable_user_interactive(conn):
             print(f"✓ Nom: {restored_user.name}")
             print(f"✓ User ID: {restored_user.user_id}")
             print(f"✓ L'utilisateur peut maintenant accéder à l'appareil.")
-            print("\nNOTE: Les empreintes doivent être réenregistrées manuellement.")
+            if not fingers:
+                print("\nNOTE: Aucune empreinte sauvegardée: elles doivent être réenregistrées manuellement.")
             
             # Supprimer l'utilisateur de la liste des désactivés
             del disabled_data[uid]
             save_disabled_users_data(disabled_data)
+            forget_templates(TEMPLATE_CACHE_FILE, [uid])
         else:
             print(f"\n✗ ERREUR: L'utilisateur n'a pas pu être restauré sur le device.")
             print(f"\nUtilisateurs actuellement sur le device:")
@@ -385,6 +664,23 @@ def disable_user_by_day_interactive(conn):
     except ValueError:
         print("Format invalide. Utilisez des chiffres séparés par des virgules.")
 
+def plan_user_changes(conn, disabled_data, users_to_disable, users_to_enable):
+    """Plan minimal (user_reconcile.plan_changes) d'après une seule lecture de la table"""
+    device_users = {str(user.uid): user for user in conn.get_users()}
+    return plan_changes(device_users, disabled_data, users_to_disable, users_to_enable)
+
+def apply_user_changes(conn, disabled_data, users_to_disable, users_to_enable):
+    """Désactiver/réactiver un lot d'utilisateurs en une seule passe
+    
+    La table des utilisateurs est lue une seule fois et comparée à l'état voulu: seules les
+    commandes nécessaires sont envoyées, dans une même fenêtre où l'appareil est désactivé.
+    Retourne (nombre de désactivés, nombre de réactivés).
+    """
+    plan = plan_user_changes(conn, disabled_data, users_to_disable, users_to_enable)
+    # Fiches écrites sur disque avant toute suppression sur l'appareil
+    return apply_plan(conn, plan, disabled_data, TEMPLATE_CACHE_FILE,
+                      persist=lambda data: save_disabled_users_data(data, flush=True))
+
 def apply_day_restrictions(conn):
     """Appliquer les restrictions basées sur le jour actuel"""
     import datetime
@@ -404,73 +700,11 @@ def apply_day_restrictions(conn):
         print("Aucune restriction de jour configurée.")
         return
     
-    users_to_disable = []
-    users_to_enable = []
-    
-    day_activations = disabled_data.get('day_activations', {})
-    
-    for uid, jours_desactives in day_restrictions.items():
-        if jour_actuel in jours_desactives:
-            users_to_disable.append(uid)
-        else:
-            users_to_enable.append(uid)
-    
-    # Traiter les activations par jour (l'utilisateur est actif SEULEMENT ces jours)
-    for uid, jours_actifs in day_activations.items():
-        if jour_actuel not in jours_actifs:
-            if uid not in users_to_disable:
-                users_to_disable.append(uid)
-        else:
-            if uid not in users_to_enable:
-                users_to_enable.append(uid)
-    
-    # Désactiver les utilisateurs pour aujourd'hui
-    for uid in users_to_disable:
-        # Vérifier si l'utilisateur est sur l'appareil
-        users = conn.get_users()
-        for user in users:
-            if str(user.uid) == uid:
-                # Sauvegarder et désactiver
-                user_data = {
-                    'uid': user.uid,
-                    'name': user.name,
-                    'privilege': user.privilege,
-                    'password': user.password,
-                    'group_id': user.group_id,
-                    'user_id': user.user_id,
-                    'card': user.card,
-                    'temp_disabled': True
-                }
-                disabled_data[uid] = user_data
-                conn.delete_user(uid=int(uid))
-                print(f"  Désactivé: {user.name} (UID #{uid})")
-                break
+    rules = compile_rules(disabled_data, sections=('day_restrictions', 'day_activations'))
+    users_to_disable, users_to_enable = rules.evaluate()
     
-    # Réactiver les utilisateurs qui ne doivent pas être désactivés aujourd'hui
-    for uid in users_to_enable:
-        if uid in disabled_data and disabled_data[uid].get('temp_disabled'):
-            user_data = disabled_data[uid]
-            try:
-                # Convertir group_id correctement
-                group_id = user_data['group_id']
-                if isinstance(group_id, str) and group_id.strip() == '':
-                    group_id = 0
-                else:
-                    group_id = int(group_id) if group_id else 0
-                
-                conn.set_user(
-                    uid=int(uid),
-                    name=user_data['name'],
-                    privilege=int(user_data['privilege']),
-                    password=user_data['password'],
-                    group_id=group_id,
-                    user_id=user_data['user_id'],
-                    card=int(user_data['card']) if user_data['card'] else 0
-                )
-                del disabled_data[uid]
-                print(f"  Réactivé: {user_data['name']} (UID #{uid})")
-            except Exception as e:
-                print(f"  ERREUR - Impossible de réactiver {user_data['name']}: {str(e)}")
+    # Appliquer en une seule passe (une lecture de la table, une fenêtre désactivée)
+    apply_user_changes(conn, disabled_data, users_to_disable, users_to_enable)
     
     save_disabled_users_data(disabled_data)
     print("\nRestrictions du jour appliquées.")
@@ -510,7 +744,7 @@ def view_day_restrictions():
     if date_restrictions:
         print("\n[DATES SPÉCIFIQUES - DÉSACTIVÉS]:")
         for uid, dates in date_restrictions.items():
-            print(f"  UID #{uid}: Désactivé les {', '.join(dates)}")
+            print(f"  UID #{uid}: Désactivé les {format_date_ranges(dates)}")
     
     if time_restrictions:
         print("\n[PLAGES HORAIRES - DÉSACTIVÉS]:")
@@ -522,7 +756,7 @@ def view_day_restrictions():
     if date_activations:
         print("\n[DATES SPÉCIFIQUES - ACTIFS uniquement]:")
         for uid, dates in date_activations.items():
-            print(f"  UID #{uid}: Actif uniquement les {', '.join(dates)}")
+            print(f"  UID #{uid}: Actif uniquement les {format_date_ranges(dates)}")
     
     if time_activations:
         print("\n[PLAGES HORAIRES - ACTIFS uniquement]:")
@@ -564,7 +798,7 @@ def disable_user_by_date_interactive(conn):
     
     existing_dates = disabled_data['date_restrictions'].get(uid, [])
     if existing_dates:
-        print(f"\nDates actuellement désactivées: {', '.join(existing_dates)}")
+        print(f"\nDates actuellement désactivées: {format_date_ranges(existing_dates)}")
     
     print(f"\nConfiguration pour '{target_user.name}':")
     print("Options:")
@@ -587,27 +821,19 @@ def disable_user_by_date_interactive(conn):
         date_fin = input("Date fin: ").strip()
         
         try:
-            from datetime import datetime, timedelta
+            from datetime import datetime
             d1 = datetime.strptime(date_debut, '%Y-%m-%d')
             d2 = datetime.strptime(date_fin, '%Y-%m-%d')
+            if d1 > d2:
+                raise ValueError
             
-            nouvelles_dates = []
-            current = d1
-            while current <= d2:
-                nouvelles_dates.append(current.strftime('%Y-%m-%d'))
-                current += timedelta(days=1)
-            
-            if uid not in disabled_data['date_restrictions']:
-                disabled_data['date_restrictions'][uid] = []
-            
-            for d in nouvelles_dates:
-                if d not in disabled_data['date_restrictions'][uid]:
-                    disabled_data['date_restrictions'][uid].append(d)
-            
-            disabled_data['date_restrictions'][uid].sort()
+            # La plage est enregistrée telle quelle (début, fin), fusionnée avec l'existant
+            plage = {'debut': date_debut, 'fin': date_fin}
+            disabled_data['date_restrictions'][uid] = add_date_ranges(
+                'date_restrictions', uid, disabled_data['date_restrictions'].get(uid, []), [plage])
             save_disabled_users_data(disabled_data)
             
-            print(f"\n{len(nouvelles_dates)} dates ajoutées pour '{target_user.name}'.")
+            print(f"\n{count_days([plage])} dates ajoutées pour '{target_user.name}'.")
             return
             
         except ValueError:
@@ -629,14 +855,8 @@ def disable_user_by_date_interactive(conn):
             datetime.strptime(d, '%Y-%m-%d')
             dates_valides.append(d)
         
-        if uid not in disabled_data['date_restrictions']:
-            disabled_data['date_restrictions'][uid] = []
-        
-        for d in dates_valides:
-            if d not in disabled_data['date_restrictions'][uid]:
-                disabled_data['date_restrictions'][uid].append(d)
-        
-        disabled_data['date_restrictions'][uid].sort()
+        disabled_data['date_restrictions'][uid] = add_date_ranges(
+            'date_restrictions', uid, disabled_data['date_restrictions'].get(uid, []), dates_valides)
         save_disabled_users_data(disabled_data)
         
         print(f"\nUtilisateur '{target_user.name}' sera désactivé les:")
@@ -729,8 +949,11 @@ def disable_user_by_time_interactive(conn):
     except ValueError:
         print("Format d'heure invalide. Utilisez HH:MM.")
 
-def apply_all_restrictions(conn):
-    """Appliquer toutes les restrictions (jour, date, heure)"""
+def apply_all_restrictions(conn, dry_run=False):
+    """Appliquer toutes les restrictions (jour, date, heure)
+    
+    Avec dry_run, affiche les opérations prévues et le temps estimé sans rien modifier.
+    """
     from datetime import datetime
     
     print("\n=== Appliquer toutes les restrictions ===")
@@ -746,116 +969,133 @@ def apply_all_restrictions(conn):
     print(f"Heure: {heure_actuelle}")
     
     disabled_data = load_disabled_users_data()
-    day_restrictions = disabled_data.get('day_restrictions', {})
-    day_activations = disabled_data.get('day_activations', {})
-    date_restrictions = disabled_data.get('date_restrictions', {})
-    date_activations = disabled_data.get('date_activations', {})
-    time_restrictions = disabled_data.get('time_restrictions', {})
-    time_activations = disabled_data.get('time_activations', {})
-    
-    users_to_disable = set()
-    users_to_enable = set()
-    
-    # Vérifier restrictions par jour de semaine
-    for uid, jours_desactives in day_restrictions.items():
-        if jour_actuel in jours_desactives:
-            users_to_disable.add(uid)
-        else:
-            users_to_enable.add(uid)
-    
-    # Vérifier activations par jour (actif SEULEMENT ces jours)
-    for uid, jours_actifs in day_activations.items():
-        if jour_actuel not in jours_actifs:
-            users_to_disable.add(uid)
-        else:
-            users_to_enable.add(uid)
-    
-    # Vérifier restrictions par date
-    for uid, dates in date_restrictions.items():
-        if date_actuelle in dates:
-            users_to_disable.add(uid)
-            users_to_enable.discard(uid)
-    
-    # Vérifier activations par date (actif SEULEMENT ces dates)
-    for uid, dates in date_activations.items():
-        if date_actuelle not in dates:
-            users_to_disable.add(uid)
-            users_to_enable.discard(uid)
-        else:
-            users_to_enable.add(uid)
-    
-    # Vérifier restrictions par heure
-    for uid, horaires in time_restrictions.items():
-        for h in horaires:
-            if h['debut'] <= heure_actuelle <= h['fin']:
-                users_to_disable.add(uid)
-                users_to_enable.discard(uid)
-                break
-    
-    # Vérifier activations par heure (actif SEULEMENT pendant ces plages)
-    for uid, horaires in time_activations.items():
-        is_active_time = False
-        for h in horaires:
-            if h['debut'] <= heure_actuelle <= h['fin']:
-                is_active_time = True
-                break
-        if not is_active_time:
-            users_to_disable.add(uid)
-            users_to_enable.discard(uid)
-        else:
-            users_to_enable.add(uid)
-    
-    # Enlever de enable ceux qui doivent être disabled
-    users_to_enable -= users_to_disable
-    
-    # Désactiver les utilisateurs
-    for uid in users_to_disable:
-        users = conn.get_users()
-        for user in users:
-            if str(user.uid) == uid:
-                user_data = {
-                    'uid': user.uid,
-                    'name': user.name,
-                    'privilege': user.privilege,
-                    'password': user.password,
-                    'group_id': user.group_id,
-                    'user_id': user.user_id,
-                    'card': user.card,
-                    'temp_disabled': True
-                }
-                disabled_data[uid] = user_data
-                conn.delete_user(uid=int(uid))
-                print(f"  Désactivé: {user.name} (UID #{uid})")
-                break
-    
-    # Réactiver les utilisateurs qui ne doivent pas être désactivés
-    for uid in users_to_enable:
-        if uid in disabled_data and disabled_data[uid].get('temp_disabled'):
-            user_data = disabled_data[uid]
-            try:
-                # Convertir group_id correctement
-                group_id = user_data['group_id']
-                if isinstance(group_id, str) and group_id.strip() == '':
-                    group_id = 0
-                else:
-                    group_id = int(group_id) if group_id else 0
-                
-                conn.set_user(
-                    uid=int(uid),
-                    name=user_data['name'],
-                    privilege=int(user_data['privilege']),
-                    password=user_data['password'],
-                    group_id=group_id,
-                    user_id=user_data['user_id'],
-                    card=int(user_data['card']) if user_data['card'] else 0
-                )
-                del disabled_data[uid]
-                print(f"  Réactivé: {user_data['name']} (UID #{uid})")
-            except Exception as e:
-                print(f"  ERREUR - Impossible de réactiver {user_data['name']}: {str(e)}")
+    native = native_access_enabled(conn)
+    device_access = None
+    if native and not dry_run:
+        # Fuseaux et groupes envoyés avant le calcul du plan: en cas d'échec, toutes les
+        # règles sont appliquées par le script dans cette même passe
+        device_access = push_device_access(conn, disabled_data, users=False)
+        if 'error' in device_access:
+            print("  Toutes les restrictions sont appliquées par le script.")
+            native = False
+    
+    # Règles compilées: priorité documentée dans restriction_rules.py (la désactivation l'emporte)
+    users_to_disable, users_to_enable = desired_changes(
+        disabled_data, compile_restriction_rules(disabled_data, native), now)
+    
+    # Appliquer en une seule passe (une lecture de la table, une fenêtre désactivée)
+    if dry_run:
+        plan = plan_user_changes(conn, disabled_data, users_to_disable, users_to_enable)
+        print("\nSimulation (aucune modification):")
+        for line in describe_plan(plan, disabled_data):
+            print(line)
+        result = {'dry_run': True, 'disable': [str(user.uid) for user in plan['delete']],
+                  'enable': plan['create'], 'forget': plan['forget'], 'unchanged': plan['unchanged'],
+                  'estimated_seconds': round(estimate_seconds(plan), 3)}
+        if native:
+            result['device_access'] = push_device_access(conn, disabled_data, dry_run=True)
+        return result
+    
+    disabled, enabled = apply_user_changes(conn, disabled_data, users_to_disable, users_to_enable)
     
     save_disabled_users_data(disabled_data)
+    result = {'disabled': disabled, 'enabled': enabled}
+    if device_access is not None:
+        result['device_access'] = device_access
+    # Après la réconciliation: les utilisateurs recréés reçoivent aussi leur groupe d'accès
+    if native:
+        device_access['users_written'] = push_device_access(conn, disabled_data)['users_written']
     print("\nRestrictions appliquées.")
+    return result
+
+def desired_changes(disabled_data, rules, now=None):
+    """Utilisateurs à désactiver et à réactiver d'après les règles compilées"""
+    users_to_disable, users_to_enable = rules.evaluate(now)
+    # Utilisateurs désactivés par des règles supprimées depuis: l'état voulu est actif
+    users_to_enable |= {uid for uid, record in disabled_data.items()
+                        if isinstance(record, dict) and record.get('temp_disabled') and uid not in rules.users}
+    return users_to_disable, users_to_enable
+
+def native_access_enabled(conn):
+    """NATIVE_ACCESS_CONTROL, si la connexion peut envoyer les fuseaux horaires"""
+    if not NATIVE_ACCESS_CONTROL:
+        return False
+    if not supports_device_access(conn):
+        print("Attention: cette connexion ne permet pas l'envoi des fuseaux horaires; "
+              "toutes les restrictions sont appliquées par le script.")
+        return False
+    return True
+
+def compile_restriction_rules(disabled_data, native=False):
+    """Règles appliquées par le script (sans celles confiées à l'appareil si native)"""
+    if not native:
+        return compile_rules(disabled_data)
+    return host_rules(disabled_data, set(compile_device_access(disabled_data)['users']))
+
+def push_device_access(conn, disabled_data=None, dry_run=False, users=True):
+    """Envoyer les fuseaux horaires et groupes d'accès (device_access.py) à l'appareil
+    
+    Seuls les fuseaux, groupes et utilisateurs modifiés depuis le dernier envoi sont écrits.
+    users=False: seuls les fuseaux et les groupes sont envoyés (les groupes des utilisateurs
+    sont écrits par un second appel, après la réconciliation).
+    """
+    if disabled_data is None:
+        disabled_data = load_disabled_users_data()
+    compiled = compile_device_access(disabled_data)
+    state = load_access_state(ACCESS_STATE_FILE)
+    serial = conn.get_serialnumber()
+    device_users = {str(user.uid): user for user in conn.get_users()}
+    plan = plan_upload(compiled, state, device_users, serial)
+    
+    print(f"\nContrôle d'accès par l'appareil: {len(compiled['users'])} utilisateur(s), "
+          f"{len(compiled['time_zones'])} fuseau(x), {len(compiled['groups'])} groupe(s)")
+    for uid, reason in compiled['fallback'].items():
+        print(f"  UID #{uid} appliqué par le script: {reason}")
+    print(f"  À écrire: {len(plan['time_zones'])} fuseau(x), {len(plan['groups'])} groupe(s), "
+          f"{len(plan['users']) if users else 0} utilisateur(s)")
+    result = {'users': len(compiled['users']), 'fallback': sorted(compiled['fallback']),
+              'time_zones_written': len(plan['time_zones']), 'groups_written': len(plan['groups']),
+              'users_written': len(plan['users']) if users else 0}
+    if dry_run:
+        return result
+    
+    try:
+        upload(conn, plan, users)
+    except DeviceAccessError as e:
+        print(f"  ERREUR - Fuseaux non envoyés: {e}")
+        result['error'] = str(e)
+        return result
+    save_access_state(ACCESS_STATE_FILE, compiled, state, device_users, serial, users)
+    return result
+
+def run_restriction_scheduler(conn):
+    """Appliquer les restrictions automatiquement à chaque transition (Ctrl+C pour arrêter)"""
+    print("\n=== Planificateur des restrictions ===")
+    print("Les utilisateurs sont activés/désactivés à l'heure exacte de chaque transition.")
+    print("Appuyez sur Ctrl+C pour arrêter.\n")
+    
+    # Écriture immédiate: le planificateur surveille la date de modification du fichier
+    scheduler = RestrictionScheduler(
+        conn, DISABLED_USERS_FILE, load_disabled_users_data,
+        lambda data: save_disabled_users_data(data, flush=True), apply_user_changes,
+        compile=lambda data: compile_scheduled_rules(conn, data)
+    )
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        print("\nPlanificateur arrêté.")
+        print(f"  - Transitions appliquées: {scheduler.stats['transitions']}")
+        print(f"  - Rechargements de la configuration: {scheduler.stats['reloads']}")
+
+def compile_scheduled_rules(conn, disabled_data):
+    """Règles du planificateur; avec NATIVE_ACCESS_CONTROL, les fuseaux sont d'abord renvoyés
+    
+    Si l'envoi échoue, toutes les règles restent appliquées par le planificateur.
+    """
+    native = native_access_enabled(conn)
+    if native and 'error' in push_device_access(conn, disabled_data):
+        native = False
+    return compile_restriction_rules(disabled_data, native)
 
 def enable_user_by_day_interactive(conn):
     """Réactiver un utilisateur pour certains jours de la semaine uniquement"""
@@ -1009,7 +1249,7 @@ def enable_user_by_date_interactive(conn):
     
     existing_dates = disabled_data['date_activations'].get(uid, [])
     if existing_dates:
-        print(f"\nDates actuellement actives: {', '.join(existing_dates)}")
+        print(f"\nDates actuellement actives: {format_date_ranges(existing_dates)}")
     
     print(f"\nConfiguration pour '{user_name}':")
     print("L'utilisateur sera ACTIF UNIQUEMENT ces dates.")
@@ -1036,24 +1276,16 @@ def enable_user_by_date_interactive(conn):
         date_fin = input("Date fin: ").strip()
         
         try:
-            from datetime import datetime, timedelta
+            from datetime import datetime
             d1 = datetime.strptime(date_debut, '%Y-%m-%d')
             d2 = datetime.strptime(date_fin, '%Y-%m-%d')
+            if d1 > d2:
+                raise ValueError
             
-            nouvelles_dates = []
-            current = d1
-            while current <= d2:
-                nouvelles_dates.append(current.strftime('%Y-%m-%d'))
-                current += timedelta(days=1)
-            
-            if uid not in disabled_data['date_activations']:
-                disabled_data['date_activations'][uid] = []
-            
-            for d in nouvelles_dates:
-                if d not in disabled_data['date_activations'][uid]:
-                    disabled_data['date_activations'][uid].append(d)
-            
-            disabled_data['date_activations'][uid].sort()
+            # La plage est enregistrée telle quelle (début, fin), fusionnée avec l'existant
+            plage = {'debut': date_debut, 'fin': date_fin}
+            disabled_data['date_activations'][uid] = add_date_ranges(
+                'date_activations', uid, disabled_data['date_activations'].get(uid, []), [plage])
             
             # Supprimer les restrictions de désactivation
             if 'date_restrictions' in disabled_data and uid in disabled_data['date_restrictions']:
@@ -1061,7 +1293,7 @@ def enable_user_by_date_interactive(conn):
             
             save_disabled_users_data(disabled_data)
             
-            print(f"\n{len(nouvelles_dates)} dates ajoutées. '{user_name}' sera ACTIF uniquement ces jours.")
+            print(f"\n{count_days([plage])} dates ajoutées. '{user_name}' sera ACTIF uniquement ces jours.")
             return
             
         except ValueError:
@@ -1083,14 +1315,8 @@ def enable_user_by_date_interactive(conn):
             datetime.strptime(d, '%Y-%m-%d')
             dates_valides.append(d)
         
-        if uid not in disabled_data['date_activations']:
-            disabled_data['date_activations'][uid] = []
-        
-        for d in dates_valides:
-            if d not in disabled_data['date_activations'][uid]:
-                disabled_data['date_activations'][uid].append(d)
-        
-        disabled_data['date_activations'][uid].sort()
+        disabled_data['date_activations'][uid] = add_date_ranges(
+            'date_activations', uid, disabled_data['date_activations'].get(uid, []), dates_valides)
         
         # Supprimer les restrictions de désactivation
         if 'date_restrictions' in disabled_data and uid in disabled_data['date_restrictions']:
@@ -1292,80 +1518,96 @@ def get_device_info(conn):
     print(f"Adresse MAC       : {conn.get_mac()}")
     print("="*50)
 
-def sync_attendance_to_json(conn):
-    """Synchroniser tous les pointages de l'appareil vers le fichier JSON"""
+def sync_attendance_to_json(conn, full=False):
+    """Synchroniser les pointages de l'appareil vers le fichier JSON
+    
+    Par défaut la synchronisation est incrémentale: un curseur (nombre de pointages et
+    dernier pointage connu) est conservé par appareil dans SYNC_STATE_FILE, et seuls les
+    pointages au-delà de ce curseur sont traités. Si le journal de l'appareil a été effacé
+    ou a tourné, on revient automatiquement à une synchronisation complète.
+    Retourne {'total', 'processed', 'new'}.
+    """
     print("\n=== Synchronisation des pointages ===")
     
-    # Récupérer tous les pointages de l'appareil
-    attendance = conn.get_attendance()
-    
-    if not attendance:
+    # Même lecture, même déduplication et même clé d'appareil que le parc et le temps réel
+    sync_state = load_sync_state(SYNC_STATE_FILE)
+    result = read_new_attendance(conn, sync_state, full, default_serial=device_key_for(*device_target()))
+    if result['records'] is None:
+        print("Aucun nouveau pointage sur l'appareil.")
+        return {'total': result['total'], 'processed': 0, 'new': 0}
+    if not result['total']:
         print("Aucun pointage trouvé sur l'appareil.")
-        return
-    
-    # Récupérer les utilisateurs pour avoir les noms
-    users = conn.get_users()
-    user_map = {str(user.uid): user.name for user in users}
-    
-    # Charger les données existantes
-    attendance_data = load_attendance_data()
+    elif result['resync']:
+        print("Journal de l'appareil effacé ou remplacé: synchronisation complète.")
+    
+    # Index de déduplication limité aux pointages enregistrés depuis le plus ancien
+    # pointage à traiter: recherche en O(1) sans charger tout l'historique
+    with METRICS.timer(result['serial'], 'merge_new_attendance') as timer:
+        new_records = merge_new_attendance(result, sync_state, SYNC_STATE_FILE,
+                                           append_attendance_data, attendance_index())
+        timer.records = len(result['records'])
+    if not result['total']:
+        return {'total': 0, 'processed': 0, 'new': 0}
     
-    new_records = 0
+    print(f"Synchronisation terminée!")
+    print(f"  - Total pointages sur l'appareil: {result['total']}")
+    print(f"  - Pointages traités: {len(result['records'])}")
+    print(f"  - Nouveaux pointages ajoutés: {new_records}")
+    print(f"  - Stockage: {ATTENDANCE_DB_FILE if ATTENDANCE_BACKEND == 'sqlite' else ATTENDANCE_STORE_DIR}")
+    return {'total': result['total'], 'processed': len(result['records']), 'new': new_records}
+
+def _connect_instrumented(device):
+    """Connexion à un appareil de l'inventaire dont les commandes sont mesurées"""
+    with METRICS.timer(device['name'], 'connect'):
+        conn = connect_device(device)
+    return InstrumentedConnection(conn, device['name'])
+
+def sync_fleet_attendance(full=False):
+    """Synchroniser en parallèle tous les appareils de l'inventaire DEVICES_FILE
     
-    for record in attendance:
-        uid = str(record.user_id)
-        
-        # Initialiser la liste pour cet utilisateur si nécessaire
-        if uid not in attendance_data:
-            attendance_data[uid] = {
-                'name': user_map.get(uid, f'Utilisateur #{uid}'),
-                'records': []
-            }
-        
-        # Créer l'enregistrement de pointage
-        timestamp = record.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Types de pointage ZK
-        punch_types = {
-            0: 'Entrée',
-            1: 'Sortie',
-            2: 'Pause début',
-            3: 'Pause fin',
-            4: 'HS entrée',
-            5: 'HS sortie'
-        }
-        punch_type = punch_types.get(record.punch, f'Type {record.punch}')
-        
-        pointage = {
-            'timestamp': timestamp,
-            'date': record.timestamp.strftime('%Y-%m-%d'),
-            'heure': record.timestamp.strftime('%H:%M:%S'),
-            'type': punch_type,
-            'type_code': record.punch,
-            'status': record.status
-        }
-        
-        # Vérifier si ce pointage existe déjà
-        exists = any(
-            p['timestamp'] == timestamp 
-            for p in attendance_data[uid]['records']
-        )
-        
-        if not exists:
-            attendance_data[uid]['records'].append(pointage)
-            new_records += 1
+    Retourne le rapport de chaque appareil, ou None si l'inventaire est introuvable.
+    """
+    print("\n=== Synchronisation du parc d'appareils ===")
     
-    # Trier les enregistrements par date/heure
-    for uid in attendance_data:
-        attendance_data[uid]['records'].sort(key=lambda x: x['timestamp'])
+    if not os.path.exists(DEVICES_FILE):
+        print(f"Inventaire introuvable: {DEVICES_FILE}")
+        return
+    devices = load_inventory(DEVICES_FILE)
+    print(f"{len(devices)} appareil(s), {FLEET_MAX_WORKERS} en parallèle...")
+    
+    index = attendance_index()
+    reports = sync_fleet(devices, SYNC_STATE_FILE, append_attendance_data, index=index,
+                         max_workers=FLEET_MAX_WORKERS, full=full, connect=_connect_instrumented)
+    
+    for report in reports:
+        ligne = f"  {report['device']:<20} {report['status']:<14} +{report['new']} ({report['duration']:.1f}s)"
+        if report['error']:
+            ligne += f" - {report['error']}"
+        print(ligne)
+    print(f"Total nouveaux pointages: {sum(r['new'] for r in reports)}")
+    return reports
+
+def stream_attendance(conn=None):
+    """Ajouter les pointages au stockage en temps réel (Ctrl+C pour arrêter)
     
-    # Sauvegarder
-    save_attendance_data(attendance_data)
+    Les pointages manqués pendant une coupure sont rattrapés à chaque reconnexion.
+    """
+    print("\n=== Pointages en temps réel ===")
+    print("Appuyez sur Ctrl+C pour arrêter.\n")
     
-    print(f"Synchronisation terminée!")
-    print(f"  - Total pointages sur l'appareil: {len(attendance)}")
-    print(f"  - Nouveaux pointages ajoutés: {new_records}")
-    print(f"  - Fichier: {ATTENDANCE_FILE}")
+    index = attendance_index()
+    ingest = LiveIngest(open_connection, SYNC_STATE_FILE, append_attendance_data, index,
+                        address=device_key_for(*device_target()))
+    try:
+        ingest.run(conn)
+    except KeyboardInterrupt:
+        pass
+    print("\nCapture arrêtée.")
+    print(f"  - Pointages reçus en direct: {ingest.stats['received']}")
+    print(f"  - Pointages rattrapés: {ingest.stats['caught_up']}")
+    print(f"  - Pointages ajoutés: {ingest.stats['written']} ({ingest.stats['batches']} lot(s))")
+    print(f"  - Reconnexions: {ingest.stats['reconnects']}")
+    return ingest.stats
 
 def get_user_attendance(conn):
     """Afficher les pointages d'un utilisateur spécifique"""
@@ -1375,30 +1617,28 @@ def get_user_attendance(conn):
     print("Synchronisation des données...")
     sync_attendance_to_json(conn)
     
-    # Charger les données
-    attendance_data = load_attendance_data()
+    # Lister les utilisateurs (le nombre de pointages est calculé par le stockage)
+    attendance_users = list_attendance_users()
     
-    if not attendance_data:
+    if not attendance_users:
         print("Aucun pointage enregistré.")
         return
     
     # Afficher les utilisateurs disponibles
     print("\nUtilisateurs avec pointages:")
-    for uid, data in attendance_data.items():
-        nb_records = len(data['records'])
-        print(f"  UID #{uid} - {data['name']} ({nb_records} pointages)")
+    user_names = {}
+    for uid, name, nb_records in attendance_users:
+        user_names[uid] = name
+        print(f"  UID #{uid} - {name} ({nb_records} pointages)")
     
     uid = input("\nEntrez l'UID de l'utilisateur: ").strip()
     
-    if uid not in attendance_data:
+    if uid not in user_names:
         print(f"Aucun pointage trouvé pour l'UID #{uid}.")
         return
     
-    user_data = attendance_data[uid]
-    records = user_data['records']
-    
     print(f"\n" + "="*60)
-    print(f"  POINTAGES DE: {user_data['name']} (UID #{uid})")
+    print(f"  POINTAGES DE: {user_names[uid]} (UID #{uid})")
     print("="*60)
     
     # Option de filtrage par date
@@ -1412,25 +1652,23 @@ def get_user_attendance(conn):
     filtre = input("Choix [1]: ").strip() or '1'
     
     today = datetime.now().strftime('%Y-%m-%d')
-    filtered_records = []
     
-    if filtre == '1':
-        filtered_records = records
-    elif filtre == '2':
-        filtered_records = [r for r in records if r['date'] == today]
+    # Les filtres sont des bornes de dates appliquées par le stockage (requête SQL avec SQLite)
+    if filtre == '2':
+        date_debut, date_fin = today, today
     elif filtre == '3':
         from datetime import timedelta
-        date_limite = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-        filtered_records = [r for r in records if r['date'] >= date_limite]
+        date_debut, date_fin = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d'), None
     elif filtre == '4':
         date_spec = input("Entrez la date (YYYY-MM-DD): ").strip()
-        filtered_records = [r for r in records if r['date'] == date_spec]
+        date_debut, date_fin = date_spec, date_spec
     elif filtre == '5':
         date_debut = input("Date début (YYYY-MM-DD): ").strip()
         date_fin = input("Date fin (YYYY-MM-DD): ").strip()
-        filtered_records = [r for r in records if date_debut <= r['date'] <= date_fin]
     else:
-        filtered_records = records
+        date_debut, date_fin = None, None
+    
+    filtered_records = query_attendance(uid, date_debut, date_fin) or []
     
     if not filtered_records:
         print("\nAucun pointage trouvé pour ce filtre.")
@@ -1450,31 +1688,31 @@ def view_all_attendance_from_json():
     """Voir tous les pointages depuis le fichier JSON (sans connexion)"""
     print("\n=== Tous les pointages (depuis JSON) ===")
     
-    attendance_data = load_attendance_data()
+    # Le résumé suffit: nombre de pointages et 10 derniers pointages par utilisateur
+    summary = load_attendance_summary()
     
-    if not attendance_data:
+    if not summary:
         print("Aucun pointage enregistré dans le fichier JSON.")
-        print(f"Fichier: {ATTENDANCE_FILE}")
+        print(f"Stockage: {ATTENDANCE_STORE_DIR}")
         return
     
-    print(f"\nUtilisateurs enregistrés: {len(attendance_data)}\n")
+    print(f"\nUtilisateurs enregistrés: {len(summary)}\n")
     
-    for uid, data in attendance_data.items():
-        records = data['records']
+    for uid, entry in summary.items():
         print(f"\n{'='*60}")
-        print(f"  {data['name']} (UID #{uid}) - {len(records)} pointage(s)")
+        print(f"  {entry['name']} (UID #{uid}) - {entry['count']} pointage(s)")
         print("="*60)
         
-        if records:
+        if entry['count']:
             # Afficher les 10 derniers pointages
-            derniers = records[-10:]
+            derniers = entry['tail'][-10:]
             print(f"{'Date':<12} {'Heure':<10} {'Type':<15}")
             print("-"*40)
             for record in derniers:
                 print(f"{record['date']:<12} {record['heure']:<10} {record['type']:<15}")
             
-            if len(records) > 10:
-                print(f"\n... et {len(records) - 10} autres pointages")
+            if entry['count'] > 10:
+                print(f"\n... et {entry['count'] - 10} autres pointages")
 
 def main_menu():
     print("\n" + "="*50)
@@ -1495,79 +1733,137 @@ def main_menu():
     print("12. Réactiver par plage horaire")
     print("13. Appliquer toutes les restrictions")
     print("14. Voir toutes les restrictions")
+    print("20. Planificateur automatique des restrictions")
+    print("23. Envoyer les fuseaux horaires à l'appareil")
     print("--- POINTAGES ---")
     print("15. Pointages d'un utilisateur")
     print("16. Voir tous les pointages (JSON)")
     print("17. Synchroniser pointages")
+    print("21. Synchroniser tous les appareils (inventaire)")
+    print("22. Pointages en temps réel")
+    print("24. Exporter les pointages (paie)")
     print("--- AUTRES ---")
     print("18. Informations du dispositif")
     print("19. Quitter")
     print("="*50)
     return input("Choisissez une option: ")
 
-conn = None
-zk = ZK('10.0.22.56', port=4370, timeout=5, password=0, force_udp=False, ommit_ping=False)
+def device_target():
+    """Adresse (ip, port) de l'appareil du menu
+    
+    ZK_IP/ZK_PORT permettent de viser un autre appareil, par exemple l'émulateur local
+    (python zk_emulator.py) pour les tests de performance.
+    """
+    return os.environ.get('ZK_IP', '10.0.22.56'), int(os.environ.get('ZK_PORT', 4370))
+
+def open_connection():
+    """Se connecter à l'appareil (pyzk n'est importé qu'ici)
+    
+    Chaque commande envoyée à l'appareil est mesurée et la table des utilisateurs est mise
+    en cache pour toute la session.
+    """
+    from zk import ZK
+    
+    device_ip, device_port = device_target()
+    zk = ZK(device_ip, port=device_port, timeout=5,
+            password=0, force_udp=False, ommit_ping=os.environ.get('ZK_IP') is not None)
+    with METRICS.timer(device_ip, 'connect'):
+        device_conn = zk.connect()
+    return CachedConnection(InstrumentedConnection(device_conn, device_ip))
+
+def main():
+    """Connexion à l'appareil puis boucle du menu principal"""
+    conn = None
+    if METRICS_PORT:
+        try:
+            start_http_server(METRICS_PORT)
+            print(f"Mesures Prometheus: http://127.0.0.1:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"Mesures Prometheus indisponibles (port {METRICS_PORT}): {e}")
 
-try:
-    conn = zk.connect()
-    conn.disable_device()
-    print("Connexion réussie au dispositif ZK!")
+    try:
+        conn = open_connection()
+        conn.disable_device()
+        print("Connexion réussie au dispositif ZK!")
     
-    while True:
-        choice = main_menu()
+        while True:
+            choice = main_menu()
         
-        if choice == '1':
-            add_user_interactive(conn)
-        elif choice == '2':
-            list_users(conn)
-        elif choice == '3':
-            modify_user_interactive(conn)
-        elif choice == '4':
-            delete_user_interactive(conn)
-        elif choice == '5':
-            disable_user_interactive(conn)
-        elif choice == '6':
-            enable_user_interactive(conn)
-        elif choice == '7':
-            disable_user_by_day_interactive(conn)
-        elif choice == '8':
-            enable_user_by_day_interactive(conn)
-        elif choice == '9':
-            disable_user_by_date_interactive(conn)
-        elif choice == '10':
-            enable_user_by_date_interactive(conn)
-        elif choice == '11':
-            disable_user_by_time_interactive(conn)
-        elif choice == '12':
-            enable_user_by_time_interactive(conn)
-        elif choice == '13':
-            apply_all_restrictions(conn)
-        elif choice == '14':
-            view_day_restrictions()
-        elif choice == '15':
-            get_user_attendance(conn)
-        elif choice == '16':
-            view_all_attendance_from_json()
-        elif choice == '17':
-            sync_attendance_to_json(conn)
-        elif choice == '18':
-            get_device_info(conn)
-        elif choice == '19':
-            print("Au revoir!")
-            break
-        else:
-            print("Option invalide, veuillez réessayer.")
+            if choice == '1':
+                add_user_interactive(conn)
+            elif choice == '2':
+                list_users(conn)
+            elif choice == '3':
+                modify_user_interactive(conn)
+            elif choice == '4':
+                delete_user_interactive(conn)
+            elif choice == '5':
+                disable_user_interactive(conn)
+            elif choice == '6':
+                enable_user_interactive(conn)
+            elif choice == '7':
+                disable_user_by_day_interactive(conn)
+            elif choice == '8':
+                enable_user_by_day_interactive(conn)
+            elif choice == '9':
+                disable_user_by_date_interactive(conn)
+            elif choice == '10':
+                enable_user_by_date_interactive(conn)
+            elif choice == '11':
+                disable_user_by_time_interactive(conn)
+            elif choice == '12':
+                enable_user_by_time_interactive(conn)
+            elif choice == '13':
+                choix = input("Simulation seulement? (oui/non) [non]: ").strip().lower()
+                apply_all_restrictions(conn, dry_run=(choix == 'oui'))
+            elif choice == '14':
+                view_day_restrictions()
+            elif choice == '15':
+                get_user_attendance(conn)
+            elif choice == '16':
+                view_all_attendance_from_json()
+            elif choice == '17':
+                choix = input("Resynchronisation complète? (oui/non) [non]: ").strip().lower()
+                sync_attendance_to_json(conn, full=(choix == 'oui'))
+            elif choice == '18':
+                get_device_info(conn)
+            elif choice == '21':
+                choix = input("Resynchronisation complète? (oui/non) [non]: ").strip().lower()
+                sync_fleet_attendance(full=(choix == 'oui'))
+            elif choice == '20':
+                run_restriction_scheduler(conn)
+            elif choice == '22':
+                stream_attendance(conn)
+            elif choice == '24':
+                export_attendance_interactive()
+            elif choice == '23':
+                choix = input("Simulation seulement? (oui/non) [non]: ").strip().lower()
+                push_device_access(conn, dry_run=(choix == 'oui'))
+            elif choice == '19':
+                print("Au revoir!")
+                break
+            else:
+                print("Option invalide, veuillez réessayer.")
         
-        # Retour au menu après chaque option (sauf Quitter)
-        if choice != '19':
-            input("\n" + "="*50 + "\nAppuyez sur ENTRÉE pour revenir au menu principal...")
+            # Modifications de l'option écrites avant de revenir au menu
+            flush_state()
+            
+            # Retour au menu après chaque option (sauf Quitter)
+            if choice != '19':
+                input("\n" + "="*50 + "\nAppuyez sur ENTRÉE pour revenir au menu principal...")
 
     
-    conn.test_voice()
-    conn.enable_device()
+        conn.test_voice()
+        conn.enable_device()
     
-except Exception as e:
-    print(f"Erreur: {e}")
-finally:
-    if conn:
-        conn.disconnect()
\ No newline at end of file
+    except Exception as e:
+        print(f"Erreur: {e}")
+    finally:
+        flush_state()
+        if conn:
+            conn.disconnect()
+        print("\n=== Mesures de la session ===")
+        print(METRICS.summary())
+
+if __name__ == '__main__':
+    main()
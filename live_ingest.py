@@ -0,0 +1,164 @@
+"""Ingestion des pointages en temps réel (événements live_capture de l'appareil).
+
+Au lieu de retélécharger périodiquement tout le journal, la connexion s'abonne aux
+événements de pointage de l'appareil (pyzk live_capture) et chaque pointage reçu est ajouté
+au stockage par micro-lots: le lot est écrit dès qu'il atteint LIVE_BATCH_SIZE pointages ou
+que LIVE_FLUSH_SECONDS se sont écoulées depuis le premier pointage en attente. L'appareil
+reste activé pendant la capture.
+
+Rien n'est perdu aux reconnexions: à chaque (re)connexion, une synchronisation
+incrémentale (curseur de l'appareil) rattrape les pointages faits pendant la coupure avant de
+reprendre la capture. Le curseur avance avec chaque lot écrit. La capture est aussi
+relancée toutes les LIVE_CATCHUP_SECONDS avec un rattrapage, pour couvrir le court instant
+entre la lecture du journal et l'abonnement aux événements.
+"""
+
+import time
+
+from attendance_sync import (
+    advance_cursor,
+    load_sync_state,
+    merge_new_attendance,
+    read_new_attendance,
+    save_sync_state,
+    select_new_records,
+)
+
+# Nombre maximal de pointages par écriture
+LIVE_BATCH_SIZE = 50
+# Délai maximal (secondes) avant l'écriture d'un lot incomplet
+LIVE_FLUSH_SECONDS = 2
+# Intervalle (secondes) entre deux rattrapages incrémentaux pendant la capture
+LIVE_CATCHUP_SECONDS = 600
+# Délais (secondes) entre deux tentatives de reconnexion
+RECONNECT_DELAYS = (1, 2, 5, 10, 30, 60)
+
+
+class LiveIngest:
+    """Capture les pointages en direct et les écrit au stockage par micro-lots"""
+
+    def __init__(self, connect, state_path, append, index, address=None, batch_size=LIVE_BATCH_SIZE,
+                 flush_seconds=LIVE_FLUSH_SECONDS, catchup_seconds=LIVE_CATCHUP_SECONDS,
+                 clock=time.monotonic, sleep=time.sleep):
+        """
+        connect: fonction sans argument retournant une connexion à l'appareil
+        state_path: fichier des curseurs de synchronisation (SYNC_STATE_FILE)
+        append: fonction (new_records, names) qui ajoute les pointages au stockage
+        index: index de déduplication (AttendanceIndex)
+        address: clé de l'appareil s'il n'a pas de numéro de série (device_key_for), la même
+                 que pour les synchronisations du menu et du parc
+        """
+        self.connect = connect
+        self.state_path = state_path
+        self.append = append
+        self.index = index
+        self.address = address
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.catchup_seconds = catchup_seconds
+        self.clock = clock
+        self.sleep = sleep
+        self.sync_state = load_sync_state(state_path)
+        self.serial = None
+        self.names = {}
+        self._received = []
+        self._pending_since = None
+        self.stats = {'received': 0, 'written': 0, 'batches': 0, 'caught_up': 0, 'reconnects': 0}
+
+    def catch_up(self, conn):
+        """Synchronisation incrémentale: ajoute les pointages manqués depuis le curseur"""
+        result = read_new_attendance(conn, self.sync_state, default_serial=self.address)
+        self.serial = result['serial']
+        added = merge_new_attendance(result, self.sync_state, self.state_path, self.append, self.index)
+        self.stats['caught_up'] += added
+        self.stats['written'] += added
+        return added
+
+    def flush(self):
+        """Écrire le lot en attente et avancer le curseur de l'appareil"""
+        if not self._received:
+            return 0
+        records, self._received, self._pending_since = self._received, [], None
+        pending = select_new_records(records, self.index, self.serial)
+        added = self.append(pending, self.names) if pending else 0
+        self.sync_state[self.serial] = advance_cursor(self.sync_state.get(self.serial), records)
+        save_sync_state(self.state_path, self.sync_state)
+        self.stats['written'] += added
+        self.stats['batches'] += 1
+        return added
+
+    def _flush_due(self):
+        return (len(self._received) >= self.batch_size or
+                (self._pending_since is not None and
+                 self.clock() - self._pending_since >= self.flush_seconds))
+
+    def capture(self, conn):
+        """Rattrapage puis capture jusqu'au prochain rattrapage périodique
+
+        Retourne True si la capture doit reprendre (rattrapage périodique), False si elle a
+        été interrompue (Ctrl+C reçu pendant l'attente d'un événement).
+        """
+        self.catch_up(conn)
+        self.names = {str(user.uid): user.name for user in conn.get_users()}
+        started = self.clock()
+        restart = False
+        print(f"Capture en direct ({self.serial})...")
+
+        events = conn.live_capture(new_timeout=max(1, int(self.flush_seconds)))
+        try:
+            for record in events:
+                if record is not None:
+                    self._received.append(record)
+                    self.stats['received'] += 1
+                    if self._pending_since is None:
+                        self._pending_since = self.clock()
+                    print(f"  {record.timestamp:%Y-%m-%d %H:%M:%S}  UID {record.user_id}")
+                if self._flush_due():
+                    self.flush()
+                if not restart and self.clock() - started >= self.catchup_seconds:
+                    # pyzk termine proprement la capture (désabonnement) au prochain événement
+                    # ou délai d'attente
+                    restart = True
+                    _stop_capture(conn)
+        finally:
+            # Le lot reçu est écrit avant toute coupure
+            self.flush()
+        return restart
+
+    def run(self, conn=None, max_sessions=None):
+        """Boucle principale avec reconnexion automatique (Ctrl+C pour arrêter)
+
+        conn: connexion déjà ouverte à utiliser pour la première session (sinon connect())
+        """
+        sessions = 0
+        failures = 0
+        while max_sessions is None or sessions < max_sessions:
+            sessions += 1
+            try:
+                if conn is None:
+                    conn = self.connect()
+                    if sessions > 1:
+                        self.stats['reconnects'] += 1
+                if not self.capture(conn):
+                    return
+                failures = 0
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception as e:
+                delay = RECONNECT_DELAYS[min(failures, len(RECONNECT_DELAYS) - 1)]
+                failures += 1
+                print(f"Connexion perdue ({e}); nouvelle tentative dans {delay}s")
+                try:
+                    if conn is not None:
+                        conn.disconnect()
+                except Exception:
+                    pass
+                conn = None
+                self.sleep(delay)
+
+
+def _stop_capture(conn):
+    """Demander la fin de live_capture à la connexion pyzk (sous les enveloppes éventuelles)"""
+    while '_conn' in vars(conn):
+        conn = vars(conn)['_conn']
+    conn.end_live_capture = True
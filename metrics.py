@@ -0,0 +1,233 @@
+"""Mesures de latence par commande et export au format texte Prometheus.
+
+Chaque commande envoyée à un appareil (InstrumentedConnection) et chaque lecture/écriture
+du stockage (METRICS.timer) est chronométrée. Pour chaque couple (appareil, opération) on
+conserve un histogramme des durées, le volume d'octets, le nombre d'enregistrements et le
+nombre d'erreurs.
+
+Les mesures sont exposées au format texte Prometheus sur http://127.0.0.1:<port>/metrics
+(start_http_server) et résumées en fin de session (summary).
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+# Bornes (secondes) des histogrammes de durée
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Appareil utilisé pour les opérations sur le stockage local
+STORE_DEVICE = 'store'
+
+
+class Histogram:
+    """Histogramme cumulatif des durées d'une opération"""
+
+    __slots__ = ('counts', 'count', 'sum', 'max', 'bytes', 'records', 'errors')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.bytes = 0
+        self.records = 0
+        self.errors = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+
+class _Timer:
+    """Mesure en cours (voir MetricsRegistry.timer): records et nbytes peuvent être renseignés"""
+
+    def __init__(self, registry, device, operation):
+        self.registry = registry
+        self.device = device
+        self.operation = operation
+        self.records = None
+        self.nbytes = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.device, self.operation, time.perf_counter() - self.start,
+                              nbytes=self.nbytes, records=self.records, error=exc_type is not None)
+        return False
+
+
+class MetricsRegistry:
+    """Histogrammes par (appareil, opération), partagés entre threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, device, operation, seconds, nbytes=None, records=None, error=False):
+        with self._lock:
+            series = self._series.get((device, operation))
+            if series is None:
+                series = self._series[(device, operation)] = Histogram()
+            series.observe(seconds)
+            series.bytes += nbytes or 0
+            series.records += records or 0
+            series.errors += 1 if error else 0
+
+    def timer(self, device, operation):
+        """Contexte chronométrant une opération: with METRICS.timer('store', 'load') as t: ..."""
+        return _Timer(self, device, operation)
+
+    def mean(self, operation, device=None):
+        """Durée moyenne (secondes) d'une opération, sur un appareil ou tous; None sans mesure"""
+        with self._lock:
+            series = [h for (d, op), h in self._series.items()
+                      if op == operation and (device is None or d == device) and h.count]
+            count = sum(h.count for h in series)
+            return sum(h.sum for h in series) / count if count else None
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        """Mesures au format texte Prometheus (version 0.0.4)"""
+        with self._lock:
+            series = sorted(self._series.items())
+            lines = [
+                '# HELP zk_operation_duration_seconds Durée des commandes appareil et des accès au stockage',
+                '# TYPE zk_operation_duration_seconds histogram',
+            ]
+            for (device, operation), h in series:
+                labels = f'device="{_escape(device)}",operation="{_escape(operation)}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, h.counts):
+                    cumulative += count
+                    lines.append(f'zk_operation_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'zk_operation_duration_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+                lines.append(f'zk_operation_duration_seconds_sum{{{labels}}} {h.sum:.6f}')
+                lines.append(f'zk_operation_duration_seconds_count{{{labels}}} {h.count}')
+
+            for name, attribute, description in (
+                ('zk_operation_bytes_total', 'bytes', "Octets échangés avec l'appareil ou le stockage"),
+                ('zk_operation_records_total', 'records', 'Enregistrements lus ou écrits'),
+                ('zk_operation_errors_total', 'errors', 'Opérations terminées par une erreur'),
+            ):
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} counter')
+                for (device, operation), h in series:
+                    labels = f'device="{_escape(device)}",operation="{_escape(operation)}"'
+                    lines.append(f'{name}{{{labels}}} {getattr(h, attribute)}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Résumé lisible des mesures (affiché en fin de session)"""
+        with self._lock:
+            series = sorted(self._series.items())
+        if not series:
+            return "Aucune mesure."
+        lines = [f"{'Appareil':<16} {'Opération':<24} {'Appels':>7} {'Total (s)':>10} "
+                 f"{'Moy. (ms)':>10} {'Max (ms)':>9} {'Octets':>11} {'Enreg.':>8} {'Err.':>5}"]
+        for (device, operation), h in series:
+            lines.append(f"{device[:16]:<16} {operation[:24]:<24} {h.count:>7} {h.sum:>10.3f} "
+                         f"{h.sum / h.count * 1000:>10.1f} {h.max * 1000:>9.1f} {h.bytes:>11} "
+                         f"{h.records:>8} {h.errors:>5}")
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Registre partagé par le script
+METRICS = MetricsRegistry()
+
+
+class _CountingSocket:
+    """Socket de pyzk qui compte les octets envoyés et reçus"""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.bytes = 0
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+    def send(self, data, *args):
+        self.bytes += len(data)
+        return self._sock.send(data, *args)
+
+    def sendto(self, data, *args):
+        self.bytes += len(data)
+        return self._sock.sendto(data, *args)
+
+    def recv(self, *args):
+        data = self._sock.recv(*args)
+        self.bytes += len(data)
+        return data
+
+
+class InstrumentedConnection:
+    """Connexion ZK dont chaque commande est chronométrée dans le registre
+
+    Les octets sont comptés sur la socket de pyzk (quand elle est accessible) et le nombre
+    d'enregistrements est celui des listes retournées (get_users, get_attendance...).
+    """
+
+    def __init__(self, conn, device, registry=METRICS):
+        self._conn = conn
+        self._device = device
+        self._registry = registry
+
+    def _socket(self):
+        # Socket privée de zk.base.ZK (recréée à chaque connexion)
+        sock = getattr(self._conn, '_ZK__sock', None)
+        if sock is not None and not isinstance(sock, _CountingSocket):
+            sock = _CountingSocket(sock)
+            self._conn._ZK__sock = sock
+        return sock
+
+    def __getattr__(self, name):
+        attribute = getattr(self._conn, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            sock = self._socket()
+            sent_before = sock.bytes if sock is not None else None
+            with self._registry.timer(self._device, name) as timer:
+                result = attribute(*args, **kwargs)
+                if isinstance(result, list):
+                    timer.records = len(result)
+                if sent_before is not None:
+                    timer.nbytes = sock.bytes - sent_before
+            return result
+
+        return call
+
+
+def start_http_server(port, registry=METRICS, host='127.0.0.1'):
+    """Servir registry.render() sur http://host:port/metrics dans un thread; retourne le serveur"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/metrics', '/'):
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,302 @@
+"""Moteur de règles de restriction compilé.
+
+Les six sections de disabled_users.json sont chargées une seule fois dans des structures
+par utilisateur:
+
+  day_restrictions / day_activations   -> masque de bits des jours (bit 1 = lundi ... 7 = dimanche)
+  date_restrictions / date_activations -> intervalles de jours (ordinaux) triés et fusionnés
+  time_restrictions / time_activations -> intervalles de minutes de la journée triés et fusionnés
+
+Une recherche coûte O(1) pour les jours et O(log n) (bisect) pour les dates et les heures.
+
+Ordre de priorité (identique pour toutes les familles):
+  1. Chaque famille configurée pour l'utilisateur vote:
+       - restriction : « inactif » si elle s'applique maintenant, sinon « actif »
+       - activation  : « actif » si elle s'applique maintenant, sinon « inactif »
+  2. Un seul vote « inactif » suffit: la désactivation l'emporte toujours.
+  3. Un utilisateur sans aucune règle n'est pas concerné (ni désactivé ni réactivé).
+
+Les plages horaires sont inclusives (début <= HH:MM <= fin), comme dans le menu; une plage
+dont le début est après la fin ne correspond à aucune heure.
+
+Les dates sont enregistrées comme plages inclusives fusionnées
+[{'debut': 'YYYY-MM-DD', 'fin': 'YYYY-MM-DD'}, ...] (un jour isolé: début = fin). Les
+anciennes listes d'un jour par date ('YYYY-MM-DD') sont toujours acceptées et converties par
+migrate_date_rules. Une entrée illisible est signalée et n'est jamais supprimée: la liste
+d'origine est alors conservée telle quelle.
+"""
+
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+
+RULE_SECTIONS = (
+    'day_restrictions', 'day_activations',
+    'date_restrictions', 'date_activations',
+    'time_restrictions', 'time_activations',
+)
+
+
+def _day_mask(days):
+    mask = 0
+    for day in days:
+        day = int(day)
+        if 1 <= day <= 7:
+            mask |= 1 << day
+    return mask
+
+
+def _merge_intervals(intervals):
+    """Trier et fusionner des intervalles [début, fin] inclusifs; retourne (débuts, fins)"""
+    starts, ends = [], []
+    for start, end in sorted(intervals):
+        if start > end:
+            continue
+        if ends and start <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+def _date_ordinal(value):
+    return datetime.strptime(value, '%Y-%m-%d').toordinal()
+
+
+def _date_intervals(dates, rejected=None):
+    """Dates 'YYYY-MM-DD' ou plages {'debut', 'fin'} -> intervalles d'ordinaux fusionnés
+
+    rejected: liste qui reçoit les entrées illisibles (ignorées pour le calcul)
+    """
+    intervals = []
+    for d in dates:
+        try:
+            if isinstance(d, dict):
+                intervals.append((_date_ordinal(d['debut']), _date_ordinal(d['fin'])))
+            else:
+                ordinal = _date_ordinal(d)
+                intervals.append((ordinal, ordinal))
+        except (KeyError, TypeError, ValueError):
+            if rejected is not None:
+                rejected.append(d)
+    return _merge_intervals(intervals)
+
+
+def normalize_date_ranges(dates, rejected=None):
+    """Dates et plages (mélangées) -> plages {'debut', 'fin'} triées et fusionnées
+
+    rejected: liste qui reçoit les entrées illisibles (absentes du résultat)
+    """
+    starts, ends = _date_intervals(dates, rejected)
+    return [{'debut': date.fromordinal(start).isoformat(), 'fin': date.fromordinal(end).isoformat()}
+            for start, end in zip(starts, ends)]
+
+
+def _warn_rejected(section, uid, entries):
+    for entry in entries:
+        print(f"Attention: {section}, UID #{uid}: date illisible conservée telle quelle: {entry!r}")
+
+
+def add_date_ranges(section, uid, existing, new):
+    """Ajouter des dates/plages à la liste d'un utilisateur (fusionnées)
+
+    Les entrées illisibles de la liste existante sont signalées et conservées à la fin.
+    """
+    rejected = []
+    ranges = normalize_date_ranges(list(existing) + list(new), rejected)
+    _warn_rejected(section, uid, rejected)
+    return ranges + rejected
+
+
+def count_days(ranges):
+    """Nombre de jours couverts par des plages normalisées"""
+    starts, ends = _date_intervals(ranges)
+    return sum(end - start + 1 for start, end in zip(starts, ends))
+
+
+def format_date_ranges(ranges):
+    """Affichage des plages: '2026-12-25, 2026-07-01 au 2026-07-31'"""
+    return ', '.join(r['debut'] if r['debut'] == r['fin'] else f"{r['debut']} au {r['fin']}"
+                     for r in normalize_date_ranges(ranges))
+
+
+def migrate_date_rules(disabled_data):
+    """Convertir les listes de dates en plages fusionnées; retourne True si quelque chose a changé
+
+    Une liste contenant une entrée illisible n'est pas convertie (rien n'est perdu): chaque
+    entrée rejetée est signalée.
+    """
+    changed = False
+    for section in ('date_restrictions', 'date_activations'):
+        for uid, dates in disabled_data.get(section, {}).items():
+            rejected = []
+            ranges = normalize_date_ranges(dates, rejected)
+            if rejected:
+                _warn_rejected(section, uid, rejected)
+                continue
+            if ranges != dates:
+                disabled_data[section][uid] = ranges
+                changed = True
+    return changed
+
+
+def _minute(value):
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def _time_intervals(ranges):
+    """Plages {'debut': 'HH:MM', 'fin': 'HH:MM'} -> intervalles de minutes fusionnés"""
+    intervals = []
+    for r in ranges:
+        try:
+            intervals.append((_minute(r['debut']), _minute(r['fin'])))
+        except (KeyError, ValueError, AttributeError):
+            continue
+    return _merge_intervals(intervals)
+
+
+def _contains(intervals, value):
+    starts, ends = intervals
+    i = bisect_right(starts, value) - 1
+    return i >= 0 and value <= ends[i]
+
+
+def _edges(intervals):
+    """Points où l'appartenance à des intervalles inclusifs change (débuts et fins + 1)"""
+    starts, ends = intervals
+    return sorted(set(starts) | {end + 1 for end in ends})
+
+
+class UserRules:
+    """Règles compilées d'un utilisateur (None = famille non configurée)"""
+
+    __slots__ = ('day_off', 'day_on', 'date_off', 'date_on', 'time_off', 'time_on')
+
+    def __init__(self):
+        self.day_off = self.day_on = None
+        self.date_off = self.date_on = None
+        self.time_off = self.time_on = None
+
+    def is_active(self, weekday_bit, day_ordinal, minute):
+        """True si l'utilisateur doit être actif, False s'il doit être désactivé"""
+        if self.day_off is not None and self.day_off & weekday_bit:
+            return False
+        if self.day_on is not None and not self.day_on & weekday_bit:
+            return False
+        if self.date_off is not None and _contains(self.date_off, day_ordinal):
+            return False
+        if self.date_on is not None and not _contains(self.date_on, day_ordinal):
+            return False
+        if self.time_off is not None and _contains(self.time_off, minute):
+            return False
+        if self.time_on is not None and not _contains(self.time_on, minute):
+            return False
+        return True
+
+    def next_boundary(self, day_ordinal, minute):
+        """Prochain instant (ordinal, minute) après celui donné où une règle peut changer d'état"""
+        candidates = []
+        if self.day_off is not None or self.day_on is not None:
+            candidates.append((day_ordinal + 1, 0))
+        for intervals in (self.date_off, self.date_on):
+            if intervals is not None:
+                edges = _edges(intervals)
+                i = bisect_right(edges, day_ordinal)
+                if i < len(edges):
+                    candidates.append((edges[i], 0))
+        for intervals in (self.time_off, self.time_on):
+            if intervals is not None:
+                # Minute 1440 = minuit du lendemain
+                edges = _edges(intervals)
+                if not edges:
+                    continue
+                i = bisect_right(edges, minute)
+                if i < len(edges) and edges[i] < 1440:
+                    candidates.append((day_ordinal, edges[i]))
+                else:
+                    candidates.append((day_ordinal + 1, min(edge % 1440 for edge in edges)))
+        return min(candidates) if candidates else None
+
+
+class RestrictionRules:
+    """Ensemble des règles compilées, indexées par UID"""
+
+    def __init__(self, users):
+        self.users = users
+
+    def __len__(self):
+        return len(self.users)
+
+    def status(self, uid, now=None):
+        """True (actif), False (désactivé) ou None (aucune règle) pour un utilisateur"""
+        rules = self.users.get(str(uid))
+        if rules is None:
+            return None
+        weekday_bit, day_ordinal, minute = _moment(now)
+        return rules.is_active(weekday_bit, day_ordinal, minute)
+
+    def next_transition(self, uid, now=None, horizon_days=400):
+        """Prochain instant (datetime) où l'état de l'utilisateur change, ou None
+
+        Seuls les instants où une règle peut changer sont examinés; au-delà de
+        horizon_days jours sans changement, l'utilisateur est considéré comme stable.
+        """
+        rules = self.users.get(str(uid))
+        if rules is None:
+            return None
+        weekday_bit, day_ordinal, minute = _moment(now)
+        state = rules.is_active(weekday_bit, day_ordinal, minute)
+        limit = day_ordinal + horizon_days
+        while True:
+            boundary = rules.next_boundary(day_ordinal, minute)
+            if boundary is None or boundary[0] > limit:
+                return None
+            day_ordinal, minute = boundary
+            weekday_bit = 1 << date.fromordinal(day_ordinal).isoweekday()
+            if rules.is_active(weekday_bit, day_ordinal, minute) != state:
+                return datetime.fromordinal(day_ordinal) + timedelta(minutes=minute)
+
+    def evaluate(self, now=None):
+        """Retourne (users_to_disable, users_to_enable) pour l'instant donné"""
+        weekday_bit, day_ordinal, minute = _moment(now)
+        users_to_disable = set()
+        users_to_enable = set()
+        for uid, rules in self.users.items():
+            if rules.is_active(weekday_bit, day_ordinal, minute):
+                users_to_enable.add(uid)
+            else:
+                users_to_disable.add(uid)
+        return users_to_disable, users_to_enable
+
+
+def _moment(now):
+    """Instant -> (bit du jour de la semaine, ordinal du jour, minute de la journée)"""
+    now = now or datetime.now()
+    return 1 << now.isoweekday(), now.toordinal(), now.hour * 60 + now.minute
+
+
+def compile_rules(disabled_data, sections=RULE_SECTIONS):
+    """Compiler les sections de règles de disabled_users.json (une seule fois par chargement)"""
+    users = {}
+
+    def rules_for(uid):
+        uid = str(uid)
+        if uid not in users:
+            users[uid] = UserRules()
+        return users[uid]
+
+    compilers = {
+        'day_restrictions': ('day_off', _day_mask),
+        'day_activations': ('day_on', _day_mask),
+        'date_restrictions': ('date_off', _date_intervals),
+        'date_activations': ('date_on', _date_intervals),
+        'time_restrictions': ('time_off', _time_intervals),
+        'time_activations': ('time_on', _time_intervals),
+    }
+    for section in sections:
+        attribute, compiler = compilers[section]
+        for uid, values in disabled_data.get(section, {}).items():
+            setattr(rules_for(uid), attribute, compiler(values))
+
+    return RestrictionRules(users)
@@ -0,0 +1,128 @@
+"""Planificateur des restrictions piloté par les transitions.
+
+Au lieu d'appliquer toutes les restrictions chaque minute, le planificateur calcule pour
+chaque utilisateur le prochain instant où son état (actif/désactivé) change, d'après les
+règles compilées (restriction_rules.py). Ces instants sont rangés dans un tas binaire:
+le processus dort jusqu'à la prochaine transition et n'applique que les utilisateurs
+concernés.
+
+Le fichier de configuration est surveillé (date de modification): s'il change, les règles
+sont recompilées, l'état complet est réappliqué et le tas est reconstruit.
+"""
+
+import heapq
+import os
+import time
+from datetime import datetime
+
+from restriction_rules import compile_rules
+
+# Intervalle maximal (secondes) entre deux vérifications du fichier de configuration
+CONFIG_POLL_SECONDS = 30
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class RestrictionScheduler:
+    """Applique les restrictions au moment exact de leurs transitions"""
+
+    def __init__(self, conn, config_path, load_data, save_data, apply_changes,
+                 poll_seconds=CONFIG_POLL_SECONDS, clock=datetime.now, sleep=time.sleep,
+                 compile=compile_rules):
+        """
+        conn: connexion à l'appareil
+        config_path: fichier disabled_users.json surveillé
+        load_data/save_data: lecture et écriture de disabled_users.json
+        apply_changes: fonction (conn, disabled_data, users_to_disable, users_to_enable)
+        compile: fonction (disabled_data) -> règles à appliquer (RestrictionRules)
+        """
+        self.conn = conn
+        self.config_path = config_path
+        self.load_data = load_data
+        self.save_data = save_data
+        self.apply_changes = apply_changes
+        self.compile = compile
+        self.poll_seconds = poll_seconds
+        self.clock = clock
+        self.sleep = sleep
+        self.rules = None
+        self.heap = []
+        self._config_mtime = None
+        self.stats = {'reloads': 0, 'wakeups': 0, 'transitions': 0}
+
+    def _schedule(self, uid, now):
+        instant = self.rules.next_transition(uid, now)
+        if instant is not None:
+            heapq.heappush(self.heap, (instant, uid))
+
+    def _apply(self, uids, now):
+        """Appliquer l'état courant des utilisateurs donnés"""
+        users_to_disable = set()
+        users_to_enable = set()
+        for uid in uids:
+            if self.rules.status(uid, now):
+                users_to_enable.add(uid)
+            else:
+                users_to_disable.add(uid)
+        disabled_data = self.load_data()
+        self.apply_changes(self.conn, disabled_data, users_to_disable, users_to_enable)
+        self.save_data(disabled_data)
+        # Notre propre écriture ne doit pas déclencher un rechargement
+        self._config_mtime = _mtime(self.config_path)
+
+    def reload(self):
+        """Recompiler les règles, appliquer l'état complet et reconstruire le tas"""
+        now = self.clock()
+        self.rules = self.compile(self.load_data())
+        self._apply(list(self.rules.users), now)
+        self.heap = []
+        for uid in self.rules.users:
+            self._schedule(uid, now)
+        self.stats['reloads'] += 1
+        print(f"[{now:%Y-%m-%d %H:%M}] Règles chargées: {len(self.rules)} utilisateur(s), "
+              f"{len(self.heap)} transition(s) planifiée(s)")
+
+    def run_pending(self):
+        """Appliquer les transitions échues; retourne le nombre d'utilisateurs traités"""
+        now = self.clock()
+        due = set()
+        while self.heap and self.heap[0][0] <= now:
+            due.add(heapq.heappop(self.heap)[1])
+        if not due:
+            return 0
+        print(f"[{now:%Y-%m-%d %H:%M}] Transition: {len(due)} utilisateur(s)")
+        self._apply(due, now)
+        for uid in due:
+            self._schedule(uid, now)
+        self.stats['transitions'] += len(due)
+        return len(due)
+
+    def next_wakeup(self):
+        """Prochaine transition planifiée (datetime) ou None"""
+        return self.heap[0][0] if self.heap else None
+
+    def config_changed(self):
+        return _mtime(self.config_path) != self._config_mtime
+
+    def run(self, max_wakeups=None):
+        """Boucle principale (Ctrl+C pour arrêter)"""
+        self.reload()
+        while max_wakeups is None or self.stats['wakeups'] < max_wakeups:
+            # Dormir jusqu'à la prochaine transition, en vérifiant régulièrement la configuration
+            delay = self.poll_seconds
+            next_instant = self.next_wakeup()
+            if next_instant is not None:
+                delay = min(delay, max((next_instant - self.clock()).total_seconds(), 0))
+            if delay > 0:
+                self.sleep(delay)
+            self.stats['wakeups'] += 1
+
+            if self.config_changed():
+                self.reload()
+            else:
+                self.run_pending()
@@ -0,0 +1,180 @@
+"""Écritures sûres des fichiers de données partagés entre plusieurs processus.
+
+- atomic_write_json: écriture dans un fichier temporaire du même répertoire, fsync, puis
+  renommage (os.replace): un arrêt brutal laisse l'ancien fichier ou le nouveau, jamais un
+  fichier tronqué.
+- FileLock: verrou consultatif inter-processus (fichier <chemin>.lock, fcntl sous Unix,
+  msvcrt sous Windows) tenu uniquement pendant la relecture et l'écriture.
+- load_json_versioned / save_json_versioned: contrôle de version optimiste. La version est
+  l'empreinte (SHA-256) du fichier lu. À l'enregistrement, si un autre processus a modifié le
+  fichier entre-temps, les modifications des deux côtés sont fusionnées clé par clé (sur deux
+  niveaux: utilisateurs et sections de règles) au lieu d'écraser celles de l'autre processus.
+  Si la même clé a été modifiée des deux côtés, la modification locale l'emporte et le
+  conflit est signalé.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Délai maximal (secondes) d'attente d'un verrou
+LOCK_TIMEOUT = 30
+# Intervalle (secondes) entre deux tentatives de prise du verrou
+LOCK_POLL = 0.05
+
+_MISSING = object()
+# Dernière version lue ou écrite par ce processus, par fichier: (empreinte, contenu)
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+class LockTimeout(Exception):
+    """Le verrou n'a pas pu être obtenu dans le délai imparti"""
+
+
+class FileLock:
+    """Verrou consultatif exclusif sur <path>.lock (with FileLock(path): ...)"""
+
+    def __init__(self, path, timeout=LOCK_TIMEOUT):
+        self.lock_path = path + '.lock'
+        self.timeout = timeout
+        self._file = None
+
+    def _try_lock(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def __enter__(self):
+        directory = os.path.dirname(self.lock_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.lock_path, 'a+b')
+        deadline = time.monotonic() + self.timeout
+        while not self._try_lock():
+            if time.monotonic() >= deadline:
+                self._file.close()
+                self._file = None
+                raise LockTimeout(f"verrou {self.lock_path} non obtenu après {self.timeout}s")
+            time.sleep(LOCK_POLL)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+        return False
+
+
+def atomic_write_bytes(path, data):
+    """Remplacer le contenu d'un fichier de façon atomique"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_json(path, data, indent=2):
+    """Écrire un document JSON de façon atomique; retourne sa version (empreinte)"""
+    raw = json.dumps(data, indent=indent, ensure_ascii=False).encode('utf-8')
+    atomic_write_bytes(path, raw)
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _read(path):
+    """Contenu brut et version (empreinte) d'un fichier; (None, None) s'il n'existe pas"""
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return None, None
+    return raw, hashlib.sha256(raw).hexdigest()
+
+
+def merge_changes(base, ours, theirs, depth=2):
+    """Fusion à trois voies de dictionnaires; retourne (fusion, [chemins des clés en conflit])"""
+    merged = {}
+    conflicts = []
+    for key in list(theirs) + [k for k in ours if k not in theirs]:
+        b = base.get(key, _MISSING)
+        o = ours.get(key, _MISSING)
+        t = theirs.get(key, _MISSING)
+        if o == b:
+            value = t
+        elif t == b or t == o:
+            value = o
+        elif depth > 1 and isinstance(o, dict) and isinstance(t, dict) and (b is _MISSING or isinstance(b, dict)):
+            value, sub_conflicts = merge_changes({} if b is _MISSING else b, o, t, depth - 1)
+            conflicts.extend(f"{key}/{sub}" for sub in sub_conflicts)
+        else:
+            value = o
+            conflicts.append(str(key))
+        if value is not _MISSING:
+            merged[key] = value
+    return merged, conflicts
+
+
+def load_json_versioned(path, default=None):
+    """Charger un document JSON et retenir sa version pour le prochain enregistrement"""
+    raw, version = _read(path)
+    data = json.loads(raw.decode('utf-8')) if raw is not None else ({} if default is None else default)
+    with _snapshots_lock:
+        _snapshots[path] = (version, copy.deepcopy(data))
+    return data
+
+
+def save_json_versioned(path, data, indent=2):
+    """Enregistrer un document JSON lu par load_json_versioned (verrou, contrôle de version)
+
+    Si le fichier a changé depuis la lecture, les modifications des deux processus sont
+    fusionnées et data est mis à jour avec le résultat. Retourne la liste des clés en conflit
+    (modifiées des deux côtés; la valeur de data a été conservée).
+    """
+    with FileLock(path):
+        raw, version = _read(path)
+        with _snapshots_lock:
+            base_version, base = _snapshots.get(path, (_MISSING, None))
+
+        conflicts = []
+        if raw is not None and version != base_version:
+            theirs = json.loads(raw.decode('utf-8'))
+            # Sans lecture préalable, l'enregistrement remplace le fichier (comme avant)
+            merged, conflicts = merge_changes(theirs if base is None else base, data, theirs)
+            data.clear()
+            data.update(merged)
+
+        new_version = atomic_write_json(path, data, indent)
+        with _snapshots_lock:
+            _snapshots[path] = (new_version, copy.deepcopy(data))
+    return conflicts
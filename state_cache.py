@@ -0,0 +1,193 @@
+"""Cache en mémoire des fichiers de données pour toute la durée du processus.
+
+Les fonctions du menu chargent et enregistrent disabled_users.json à chaque opération.
+DocumentCache garde le document en mémoire: load() ne relit le fichier que s'il a été
+modifié par un autre processus (taille, date de modification et inode comparés à chaque
+appel), et save() ne fait que marquer le document comme modifié. Les écritures sont
+regroupées: le fichier est écrit sur appel explicite de flush(), à la sortie normale du
+processus (atexit), ou par le premier save() qui survient STATE_FLUSH_SECONDS ou plus après
+la première modification non enregistrée. Il n'y a pas de minuterie: sans nouveau save(),
+rien n'est écrit avant le prochain flush(). Une modification qui doit survivre à un arrêt
+brutal (fiche sauvegardée avant une suppression sur l'appareil) doit donc être suivie de
+flush(). Seules les sections de premier niveau (utilisateurs, sections de règles)
+réellement modifiées sont comptées, et rien n'est écrit si aucune n'a changé.
+
+load() retourne une copie du document: une fonction qui modifie sa copie puis s'arrête
+sans save() (saisie annulée, erreur) ne laisse aucune trace dans le document en mémoire, qui
+reste identique au fichier. Seul save(data) remplace le document.
+
+CachedView garde le résultat d'une lecture coûteuse (vue des pointages) tant que la
+signature des fichiers sous-jacents ne change pas.
+"""
+
+import atexit
+import copy
+import json
+import os
+import threading
+import time
+
+# Délai (secondes) après lequel un save() écrit le document au lieu de regrouper
+STATE_FLUSH_SECONDS = 5
+
+
+def file_signature(path):
+    """(inode, taille, date de modification en ns) d'un fichier, None s'il n'existe pas"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _encode_sections(data):
+    return {key: json.dumps(value, sort_keys=True, ensure_ascii=False) for key, value in data.items()}
+
+
+class DocumentCache:
+    """Document JSON gardé en mémoire, écritures regroupées (load/save/flush)"""
+
+    def __init__(self, path, read, write, flush_seconds=STATE_FLUSH_SECONDS, clock=time.monotonic):
+        """
+        path: fichier surveillé
+        read: fonction sans argument qui lit le fichier et retourne (document, modifié) où
+              modifié indique une conversion à enregistrer (migration)
+        write: fonction (document) qui écrit le fichier
+        """
+        self.path = path
+        self.read = read
+        self.write = write
+        self.flush_seconds = flush_seconds
+        self.clock = clock
+        self._lock = threading.RLock()
+        self._data = None
+        self._signature = None
+        self._persisted = {}
+        self._dirty_since = None
+        self.stats = {'loads': 0, 'reads': 0, 'external_reloads': 0, 'saves': 0,
+                      'writes': 0, 'skipped_writes': 0, 'sections_written': 0}
+
+    @property
+    def dirty(self):
+        return self._dirty_since is not None
+
+    def _read(self):
+        data, changed = self.read()
+        self._data = data
+        self._signature = file_signature(self.path)
+        self._persisted = _encode_sections(data)
+        self.stats['reads'] += 1
+        if changed:
+            self._mark_dirty()
+
+    def load(self):
+        """Copie du document en mémoire, relu si le fichier a été modifié par un autre processus"""
+        with self._lock:
+            self.stats['loads'] += 1
+            if self._data is None:
+                self._read()
+            elif not self.dirty and file_signature(self.path) != self._signature:
+                # Modifications locales en attente: elles seront fusionnées à l'écriture
+                self.stats['external_reloads'] += 1
+                self._read()
+            return copy.deepcopy(self._data)
+
+    def _mark_dirty(self):
+        if self._dirty_since is None:
+            self._dirty_since = self.clock()
+
+    def save(self, data):
+        """Marquer le document comme modifié; l'écrire si le délai de regroupement est écoulé"""
+        with self._lock:
+            self.stats['saves'] += 1
+            if data is not self._data:
+                self._data = data
+            self._mark_dirty()
+            if self.clock() - self._dirty_since >= self.flush_seconds:
+                self.flush()
+
+    def changed_sections(self):
+        """Sections de premier niveau différentes de la dernière version écrite"""
+        with self._lock:
+            if self._data is None:
+                return []
+            current = _encode_sections(self._data)
+            return sorted(
+                [key for key, value in current.items() if self._persisted.get(key) != value] +
+                [key for key in self._persisted if key not in current])
+
+    def flush(self):
+        """Écrire le document s'il a changé; retourne les sections écrites"""
+        with self._lock:
+            if not self.dirty:
+                return []
+            self._dirty_since = None
+            sections = self.changed_sections()
+            if not sections and self._signature is not None:
+                self.stats['skipped_writes'] += 1
+                return []
+            self.write(self._data)
+            self._signature = file_signature(self.path)
+            self._persisted = _encode_sections(self._data)
+            self.stats['writes'] += 1
+            self.stats['sections_written'] += len(sections)
+            return sections
+
+    def invalidate(self):
+        """Oublier le document (relu au prochain load); les modifications en attente sont écrites"""
+        with self._lock:
+            self.flush()
+            self._data = None
+            self._signature = None
+            self._persisted = {}
+
+
+class CachedView:
+    """Résultat d'une lecture gardé tant que la signature de ses fichiers ne change pas"""
+
+    def __init__(self, read, signature):
+        """
+        read: fonction sans argument qui construit la vue
+        signature: fonction sans argument qui retourne la signature des fichiers lus
+        """
+        self.read = read
+        self.signature = signature
+        self._lock = threading.Lock()
+        self._value = None
+        self._key = None
+        self.stats = {'hits': 0, 'reads': 0}
+
+    def get(self):
+        with self._lock:
+            key = self.signature()
+            if self._value is None or key is None or key != self._key:
+                self._value = self.read()
+                self._key = key
+                self.stats['reads'] += 1
+            else:
+                self.stats['hits'] += 1
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._key = None
+
+
+_caches = []
+
+
+def register(cache):
+    """Enregistrer un cache pour flush_all (et l'écriture automatique à la sortie)"""
+    _caches.append(cache)
+    return cache
+
+
+def flush_all():
+    """Écrire toutes les modifications en attente des caches enregistrés"""
+    for cache in list(_caches):
+        if isinstance(cache, DocumentCache):
+            cache.flush()
+
+
+atexit.register(flush_all)
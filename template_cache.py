@@ -0,0 +1,103 @@
+"""Sauvegarde locale des gabarits d'empreinte des utilisateurs désactivés.
+
+delete_user supprime aussi les empreintes de l'utilisateur sur l'appareil. Avant une
+désactivation, les gabarits de tous les utilisateurs concernés sont lus en une seule
+lecture en tampon (get_templates) et rangés par UID dans un fichier JSON compressé (gzip).
+À la réactivation, l'utilisateur et ses gabarits sont renvoyés en une seule écriture
+(save_user_template) au lieu de set_user, et la sauvegarde est retirée: aucun
+réenregistrement des empreintes n'est nécessaire.
+
+Format du fichier: {uid: [{'fid', 'valid', 'template' (base64)}, ...]}
+"""
+
+import base64
+import gzip
+import json
+import os
+
+from safe_io import FileLock, atomic_write_bytes
+from user_cache import make_user
+from zk_protocol import Finger as ProtocolFinger
+
+
+def load_templates(path):
+    """Charger la sauvegarde des gabarits ({} si elle n'existe pas)"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'rb') as f:
+        return json.loads(gzip.decompress(f.read()).decode('utf-8'))
+
+
+def save_templates(path, templates):
+    """Enregistrer la sauvegarde des gabarits (compressée, écriture atomique)"""
+    raw = json.dumps(templates, separators=(',', ':')).encode('utf-8')
+    atomic_write_bytes(path, gzip.compress(raw))
+
+
+def backup_templates(conn, uids, path):
+    """Sauvegarder les gabarits des utilisateurs donnés (une seule lecture de l'appareil)
+
+    Retourne le nombre de gabarits sauvegardés.
+    """
+    uids = {str(uid) for uid in uids}
+    if not uids:
+        return 0
+    fingers = {}
+    for finger in conn.get_templates():
+        uid = str(finger.uid)
+        if uid in uids:
+            fingers.setdefault(uid, []).append({
+                'fid': finger.fid,
+                'valid': finger.valid,
+                'template': base64.b64encode(finger.template).decode('ascii'),
+            })
+
+    with FileLock(path):
+        templates = load_templates(path)
+        for uid in uids:
+            # Sans gabarit sur l'appareil, une ancienne sauvegarde est obsolète
+            if uid in fingers:
+                templates[uid] = fingers[uid]
+            else:
+                templates.pop(uid, None)
+        save_templates(path, templates)
+    return sum(len(entries) for entries in fingers.values())
+
+
+def forget_templates(path, uids):
+    """Retirer les sauvegardes des utilisateurs donnés (après leur restauration)"""
+    uids = {str(uid) for uid in uids}
+    if not uids or not os.path.exists(path):
+        return
+    with FileLock(path):
+        templates = load_templates(path)
+        if uids & templates.keys():
+            for uid in uids:
+                templates.pop(uid, None)
+            save_templates(path, templates)
+
+
+def make_fingers(uid, entries):
+    """Gabarits sauvegardés -> objets Finger de pyzk"""
+    # pyzk n'est importé qu'ici: les commandes sans appareil n'en dépendent pas
+    try:
+        from zk.finger import Finger
+    except ImportError:  # pyzk absent (zk_async.py, connexion simulée)
+        Finger = ProtocolFinger
+    return [Finger(uid=int(uid), fid=entry['fid'], valid=entry['valid'],
+                   template=base64.b64decode(entry['template']))
+            for entry in entries]
+
+
+def restore_user(conn, user_arguments, templates):
+    """Recréer un utilisateur (arguments de set_user), avec ses gabarits s'ils sont sauvegardés
+
+    Retourne le nombre de gabarits restaurés (0 si l'utilisateur a été recréé par set_user).
+    """
+    entries = templates.get(str(user_arguments['uid']))
+    if not entries:
+        conn.set_user(**user_arguments)
+        return 0
+    user = make_user(**user_arguments)
+    conn.save_user_template(user, make_fingers(user_arguments['uid'], entries))
+    return len(entries)
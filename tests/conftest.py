@@ -0,0 +1,6 @@
+"""Les modules du script sont à la racine du dépôt (pas de paquet installable)"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,66 @@
+"""Export des pointages: filtres, segments lus, formats CSV et NDJSON"""
+
+import csv
+import gzip
+import json
+
+import attendance_export
+import attendance_store
+from attendance_export import export_rows, iter_store_export, parse_punch_types
+
+
+def pointage(timestamp, type_code=0):
+    return {'timestamp': timestamp, 'date': timestamp[:10], 'heure': timestamp[11:],
+            'type': attendance_store.PUNCH_TYPES[type_code], 'type_code': type_code, 'status': 1}
+
+
+def make_store(tmp_path, monkeypatch):
+    """Trois segments: janvier, février, mars"""
+    monkeypatch.setattr(attendance_store, 'SEGMENT_MAX_RECORDS', 2)
+    store = str(tmp_path / 'store')
+    for month in ('01', '02', '03'):
+        attendance_store.append_attendance_records(store, {'1': [
+            pointage(f'2026-{month}-10 08:00:00', 0),
+            pointage(f'2026-{month}-10 17:00:00', 1),
+        ]}, {'1': 'Alice'})
+    return store
+
+
+def test_date_filter_skips_segments_out_of_range(tmp_path, monkeypatch):
+    store = make_store(tmp_path, monkeypatch)
+    read = []
+    original = attendance_export.iter_segment
+
+    def spy(store_dir, segment):
+        read.append(segment['file'])
+        return original(store_dir, segment)
+    monkeypatch.setattr(attendance_export, 'iter_segment', spy)
+
+    rows = list(iter_store_export(store, date_debut='2026-02-01', date_fin='2026-02-28'))
+    assert [r['timestamp'] for _, _, r in rows] == ['2026-02-10 08:00:00', '2026-02-10 17:00:00']
+    assert read == ['segment-000002.jsonl']
+
+
+def test_uid_and_punch_filters(tmp_path, monkeypatch):
+    store = make_store(tmp_path, monkeypatch)
+    rows = list(iter_store_export(store, uids=['1'], punch_codes=parse_punch_types(['Sortie'])))
+    assert len(rows) == 3 and all(r['type_code'] == 1 for _, _, r in rows)
+    assert list(iter_store_export(store, uids=['2'])) == []
+
+
+def test_export_csv_gzip_and_ndjson(tmp_path):
+    rows = [('1', 'Alice', dict(pointage('2026-01-10 08:00:00'), device='EMU1'))]
+
+    csv_path = str(tmp_path / 'paie.csv.gz')
+    assert export_rows(iter(rows), csv_path, 'csv') == 1
+    with gzip.open(csv_path, 'rt', encoding='utf-8', newline='') as f:
+        assert list(csv.reader(f)) == [
+            ['uid', 'name', 'timestamp', 'type', 'type_code', 'status', 'device'],
+            ['1', 'Alice', '2026-01-10 08:00:00', 'Entrée', '0', '1', 'EMU1'],
+        ]
+
+    ndjson_path = str(tmp_path / 'paie.ndjson')
+    assert export_rows(iter(rows), ndjson_path, 'ndjson') == 1
+    with open(ndjson_path, encoding='utf-8') as f:
+        assert json.loads(f.readline())['name'] == 'Alice'
+    assert not list(tmp_path.glob('*.tmp'))
@@ -0,0 +1,82 @@
+"""Base SQLite: clé primaire (uid, timestamp, type_code) et migration des anciennes bases"""
+
+import sqlite3
+
+from attendance_sqlite import UNKNOWN_PUNCH, append_attendance_db, connect_db, load_attendance_db
+
+# Schéma d'origine: clé (uid, timestamp), type_code facultatif, sans numéro de série
+OLD_SCHEMA = """
+CREATE TABLE users (uid TEXT PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE attendance (
+    uid TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    date TEXT NOT NULL,
+    heure TEXT NOT NULL,
+    type TEXT NOT NULL,
+    type_code INTEGER,
+    status INTEGER,
+    PRIMARY KEY (uid, timestamp)
+) WITHOUT ROWID;
+CREATE INDEX idx_attendance_date ON attendance (date, uid);
+"""
+
+
+def pointage(timestamp, type_code, device=None):
+    record = {'timestamp': timestamp, 'date': timestamp[:10], 'heure': timestamp[11:],
+              'type': {0: 'Entrée', 1: 'Sortie', 2: 'Pause début'}[type_code], 'type_code': type_code,
+              'status': 1}
+    if device:
+        record['device'] = device
+    return record
+
+
+def make_old_db(path):
+    db = sqlite3.connect(path)
+    db.executescript(OLD_SCHEMA)
+    db.execute("INSERT INTO users VALUES ('1', 'Alice')")
+    db.executemany("INSERT INTO attendance VALUES (?, ?, ?, ?, ?, ?, ?)", [
+        ('1', '2026-03-02 08:00:00', '2026-03-02', '08:00:00', 'Entrée', None, 1),
+        ('1', '2026-03-02 12:00:00', '2026-03-02', '12:00:00', 'Pause début', 2, 1),
+        ('1', '2026-03-02 13:00:00', '2026-03-02', '13:00:00', 'Type 9', None, 1),
+    ])
+    db.commit()
+    db.close()
+
+
+def test_old_database_is_migrated(tmp_path):
+    path = str(tmp_path / 'attendance.db')
+    make_old_db(path)
+
+    db = connect_db(path)
+    try:
+        columns = sorted(db.execute("PRAGMA table_info(attendance)"), key=lambda r: r['pk'])
+        assert [row['name'] for row in columns if row['pk']] == ['uid', 'timestamp', 'type_code']
+        assert 'device' in {row['name'] for row in columns}
+        codes = [row['type_code'] for row in db.execute("SELECT type_code FROM attendance ORDER BY timestamp")]
+        assert codes == [0, 2, UNKNOWN_PUNCH]
+        assert db.execute("SELECT name FROM sqlite_master WHERE name = 'attendance_old'").fetchone() is None
+        assert db.execute("SELECT name FROM sqlite_master WHERE name = 'idx_attendance_date'").fetchone()
+    finally:
+        db.close()
+
+    records = load_attendance_db(path)['1']['records']
+    assert [r.get('type_code') for r in records] == [0, 2, None]
+    assert records[2]['type'] == 'Type 9'
+
+
+def test_primary_key_dedup_after_migration(tmp_path):
+    path = str(tmp_path / 'attendance.db')
+    make_old_db(path)
+    names = {'1': 'Alice'}
+
+    # Même seconde, autre type: conservé
+    assert append_attendance_db(path, {'1': [pointage('2026-03-02 08:00:00', 1, 'EMU0001')]}, names) == 1
+    # Doublon d'un ancien pointage sans code (type déduit du libellé) et doublon exact: ignorés
+    assert append_attendance_db(path, {'1': [pointage('2026-03-02 08:00:00', 0),
+                                             pointage('2026-03-02 12:00:00', 2)]}, names) == 0
+    assert append_attendance_db(path, {'1': [pointage('2026-03-02 08:00:00', 1)]}, names) == 0
+
+    records = load_attendance_db(path)['1']['records']
+    assert [(r['timestamp'], r.get('type_code'), r.get('device')) for r in records][:2] == [
+        ('2026-03-02 08:00:00', 0, None), ('2026-03-02 08:00:00', 1, 'EMU0001')]
+    assert len(records) == 4
@@ -0,0 +1,35 @@
+"""Stockage segmenté: ajout, bornes des segments, compaction"""
+
+from attendance_store import (
+    append_attendance_records,
+    compact_attendance_store,
+    iter_store_records,
+    record_punch_code,
+)
+
+
+def pointage(timestamp, type_code=0, type_name='Entrée', **extra):
+    record = {'timestamp': timestamp, 'date': timestamp[:10], 'heure': timestamp[11:],
+              'type': type_name, 'status': 1, **extra}
+    if type_code is not None:
+        record['type_code'] = type_code
+    return record
+
+
+def test_record_punch_code_legacy_labels():
+    assert record_punch_code({'type_code': 4}) == 4
+    assert record_punch_code({'type': 'Sortie'}) == 1
+    assert record_punch_code({'type': '3'}) == 3
+    assert record_punch_code({'type': 'Type 9'}) is None
+
+
+def test_compaction_dedupes_legacy_label_and_code(tmp_path):
+    store = str(tmp_path / 'store')
+    append_attendance_records(store, {'1': [pointage('2026-01-05 08:00:00', type_code=None)]}, {'1': 'A'})
+    append_attendance_records(store, {'1': [
+        pointage('2026-01-05 08:00:00'),                                     # même pointage
+        pointage('2026-01-05 08:00:00', type_code=1, type_name='Sortie'),    # autre type
+    ]}, {})
+
+    assert compact_attendance_store(store) == (3, 2)
+    assert sorted(record_punch_code(r) for r in iter_store_records(store)) == [0, 1]
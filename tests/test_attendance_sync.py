@@ -0,0 +1,141 @@
+"""Synchronisation: curseurs, index de déduplication, lecture d'un appareil émulé"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import attendance_store
+from attendance_sync import (
+    AttendanceIndex,
+    advance_cursor,
+    find_new_attendance,
+    load_sync_state,
+    make_cursor,
+    merge_new_attendance,
+    read_new_attendance,
+    select_new_records,
+)
+from zk_async import AsyncZK, BlockingConnection
+from zk_emulator import DeviceEmulator, DeviceState, generate_dataset, run_in_thread
+from zk_protocol import Attendance
+
+START = datetime(2026, 3, 2, 8, 0)
+
+
+def journal(n, start=START, first=0):
+    return [Attendance(str(i % 3 + 1), start + timedelta(minutes=i), 1, i % 2, i % 3 + 1)
+            for i in range(first, first + n)]
+
+
+def test_cursor_returns_only_appended_records():
+    attendance = journal(5)
+    cursor = make_cursor(attendance[:3])
+    assert cursor['count'] == 3 and cursor['last_timestamp'] == '2026-03-02 08:02:00'
+    assert find_new_attendance(attendance, cursor) == attendance[3:]
+    assert find_new_attendance(attendance[:3], cursor) == []
+
+
+def test_cursor_after_rotation_and_wipe():
+    attendance = journal(6)
+    cursor = make_cursor(attendance[:4])
+    # Journal plein: les deux plus anciens pointages ont été supprimés
+    assert find_new_attendance(attendance[2:], cursor) == attendance[4:]
+    # Journal effacé puis remplacé: resynchronisation complète
+    assert find_new_attendance(journal(6, first=100), cursor) is None
+    assert find_new_attendance(attendance, None) is None
+
+
+def test_advance_cursor_matches_make_cursor():
+    attendance = journal(5)
+    cursor = advance_cursor(make_cursor(attendance[:3]), attendance[3:])
+    assert {k: v for k, v in cursor.items() if k != 'updated_at'} == \
+        {k: v for k, v in make_cursor(attendance).items() if k != 'updated_at'}
+    assert advance_cursor(None, attendance[:2])['count'] == 2
+
+
+def test_index_loads_window_once_and_widens():
+    stored = [
+        {'uid': '1', 'timestamp': '2026-03-01 08:00:00', 'type': 'Entrée'},
+        {'uid': '1', 'timestamp': '2026-03-02 08:00:00', 'type_code': 0},
+    ]
+    calls = []
+
+    def load(since):
+        calls.append(since)
+        return [r for r in stored if r['timestamp'] >= since]
+
+    index = AttendanceIndex(load)
+    index.cover('2026-03-02 00:00:00')
+    index.cover('2026-03-02 12:00:00')
+    assert calls == ['2026-03-02 00:00:00']
+    assert ('1', '2026-03-02 08:00:00', 0) in index
+    assert ('1', '2026-03-01 08:00:00', 0) not in index
+    index.cover('2026-03-01 00:00:00')
+    assert calls[-1] == '2026-03-01 00:00:00'
+    # Ancien pointage sans code: retrouvé par son libellé
+    assert ('1', '2026-03-01 08:00:00', 0) in index
+
+
+def test_select_new_records_dedups_by_uid_timestamp_and_type():
+    index = AttendanceIndex()
+    index.add(('1', '2026-03-02 08:00:00', 0))
+    # Ancien enregistrement dont le type n'a pas pu être déterminé
+    index.add(('2', '2026-03-02 08:01:00', None))
+    records = [
+        Attendance('1', START, 1, 0, 1),                           # doublon exact
+        Attendance('1', START, 1, 2, 1),                           # même seconde, autre type
+        Attendance('2', START + timedelta(minutes=1), 1, 1, 2),    # doublon d'un ancien pointage
+        Attendance('3', START + timedelta(minutes=2), 1, 0, 3),
+        Attendance('3', START + timedelta(minutes=2), 1, 0, 3),    # répété dans le même lot
+    ]
+    pending = select_new_records(records, index, 'EMU0001')
+    assert sorted(pending) == ['1', '3']
+    assert [(r['timestamp'], r['type_code'], r['device']) for r in pending['1']] == \
+        [('2026-03-02 08:00:00', 2, 'EMU0001')]
+    assert len(pending['3']) == 1
+
+
+@pytest.fixture
+def device():
+    users, records = generate_dataset(5, 20)
+    emulator = run_in_thread(DeviceEmulator(DeviceState(users, records), port=0))
+    conn = BlockingConnection(AsyncZK('127.0.0.1', port=emulator.port, timeout=5)).connect()
+    yield emulator.state, conn
+    conn.disconnect()
+    emulator.loop.call_soon_threadsafe(emulator.stop)
+
+
+def test_sync_with_emulated_device(device, tmp_path):
+    state, conn = device
+    store = str(tmp_path / 'store')
+    state_path = str(tmp_path / 'sync_state.json')
+    sync_state = {}
+
+    def append(new_records, names):
+        return attendance_store.append_attendance_records(store, new_records, names)
+
+    def index():
+        return AttendanceIndex(lambda since: attendance_store.iter_store_records_since(store, since))
+
+    result = read_new_attendance(conn, sync_state, default_serial='127.0.0.1:4370')
+    assert result['serial'] == 'EMU0001' and not result['resync']
+    assert merge_new_attendance(result, sync_state, state_path, append, index()) == 20
+    assert load_sync_state(state_path)['EMU0001']['count'] == 20
+
+    # Journal inchangé: rien n'est téléchargé
+    result = read_new_attendance(conn, sync_state)
+    assert result['records'] is None
+    assert merge_new_attendance(result, sync_state, state_path, append, index()) == 0
+
+    # Deux nouveaux pointages: seuls ceux-ci sont lus et ajoutés
+    state.add_live_record(1)
+    state.add_live_record(2)
+    result = read_new_attendance(conn, sync_state)
+    assert len(result['records']) == 2
+    assert merge_new_attendance(result, sync_state, state_path, append, index()) == 2
+
+    # Resynchronisation complète: tout est relu, rien n'est ajouté en double
+    result = read_new_attendance(conn, sync_state, full=True)
+    assert len(result['records']) == 22
+    assert merge_new_attendance(result, sync_state, state_path, append, index()) == 0
+    assert sum(1 for _ in attendance_store.iter_store_records(store)) == 22
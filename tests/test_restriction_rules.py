@@ -0,0 +1,97 @@
+"""Règles de restriction: migration des dates, évaluation, transitions, plan de réconciliation"""
+
+from datetime import datetime
+
+from restriction_rules import add_date_ranges, compile_rules, migrate_date_rules, normalize_date_ranges
+from user_reconcile import plan_changes
+
+# Lundi 2 mars 2026
+MONDAY = datetime(2026, 3, 2, 10, 0)
+
+
+def test_normalize_merges_days_and_ranges():
+    dates = ['2026-03-02', {'debut': '2026-03-03', 'fin': '2026-03-05'}, '2026-03-10', '2026-03-01']
+    assert normalize_date_ranges(dates) == [
+        {'debut': '2026-03-01', 'fin': '2026-03-05'},
+        {'debut': '2026-03-10', 'fin': '2026-03-10'},
+    ]
+
+
+def test_migrate_converts_valid_lists():
+    data = {'date_restrictions': {'1': ['2026-03-02', '2026-03-01']}}
+    assert migrate_date_rules(data) is True
+    assert data['date_restrictions']['1'] == [{'debut': '2026-03-01', 'fin': '2026-03-02'}]
+
+
+def test_migrate_keeps_list_with_unreadable_entry(capsys):
+    original = ['2026-03-02', '2026-02-30', {'debut': '2026-04-01'}]
+    data = {'date_activations': {'7': list(original)}}
+    assert migrate_date_rules(data) is False
+    assert data['date_activations']['7'] == original
+    output = capsys.readouterr().out
+    assert "'2026-02-30'" in output and "'debut': '2026-04-01'" in output
+
+
+def test_add_date_ranges_keeps_unreadable_entries(capsys):
+    ranges = add_date_ranges('date_restrictions', '1', ['2026-03-01', 'demain'], ['2026-03-02'])
+    assert ranges == [{'debut': '2026-03-01', 'fin': '2026-03-02'}, 'demain']
+    assert "'demain'" in capsys.readouterr().out
+
+
+def test_evaluation_deny_overrides():
+    rules = compile_rules({
+        # 1: inactif le lundi
+        'day_restrictions': {'1': [1]},
+        # 2: actif du lundi au vendredi, mais jamais entre 09:00 et 11:00
+        'day_activations': {'2': [1, 2, 3, 4, 5]},
+        'time_restrictions': {'2': [{'debut': '09:00', 'fin': '11:00'}]},
+        # 3: actif seulement pendant ses plages de dates
+        'date_activations': {'3': [{'debut': '2026-03-01', 'fin': '2026-03-05'}]},
+        # 4: plage horaire inversée (début après la fin): ne correspond à aucune heure
+        'time_activations': {'4': [{'debut': '18:00', 'fin': '08:00'}]},
+    })
+    assert len(rules) == 4
+    assert rules.evaluate(MONDAY) == ({'1', '2', '4'}, {'3'})
+    assert rules.status('2', MONDAY.replace(hour=11, minute=1)) is True
+    assert rules.status('3', datetime(2026, 3, 6, 10, 0)) is False
+    assert rules.status('99', MONDAY) is None
+
+
+def test_time_ranges_are_inclusive():
+    rules = compile_rules({'time_activations': {'1': [{'debut': '08:00', 'fin': '17:30'}]}})
+    assert rules.status('1', MONDAY.replace(hour=8, minute=0)) is True
+    assert rules.status('1', MONDAY.replace(hour=17, minute=30)) is True
+    assert rules.status('1', MONDAY.replace(hour=17, minute=31)) is False
+
+
+def test_next_transition():
+    rules = compile_rules({
+        'time_activations': {'1': [{'debut': '08:00', 'fin': '17:30'}]},
+        'date_restrictions': {'2': [{'debut': '2026-03-10', 'fin': '2026-03-12'}]},
+        'day_restrictions': {'3': [6, 7]},
+        'date_activations': {'4': [{'debut': '2026-01-01', 'fin': '2026-01-31'}]},
+    })
+    assert rules.next_transition('1', MONDAY) == datetime(2026, 3, 2, 17, 31)
+    assert rules.next_transition('1', MONDAY.replace(hour=18)) == datetime(2026, 3, 3, 8, 0)
+    assert rules.next_transition('2', MONDAY) == datetime(2026, 3, 10)
+    assert rules.next_transition('2', datetime(2026, 3, 11)) == datetime(2026, 3, 13)
+    assert rules.next_transition('3', MONDAY) == datetime(2026, 3, 7)
+    # Plus aucun changement: stable
+    assert rules.next_transition('4', MONDAY) is None
+    assert rules.next_transition('99', MONDAY) is None
+
+
+def test_plan_changes_touches_only_users_that_change():
+    device_users = {'1': 'utilisateur 1', '2': 'utilisateur 2', '3': 'utilisateur 3'}
+    disabled_data = {
+        '3': {'temp_disabled': True},
+        '4': {'temp_disabled': True},
+        '5': {'temp_disabled': False},
+    }
+    plan = plan_changes(device_users, disabled_data, {'10', '2'}, {'1', '3', '4', '5'})
+    assert plan == {
+        'delete': ['utilisateur 2'],   # '10' n'est déjà plus sur l'appareil
+        'create': ['4'],               # désactivé temporairement, à recréer
+        'forget': ['3'],               # déjà présent: seule la sauvegarde est oubliée
+        'unchanged': 3,
+    }
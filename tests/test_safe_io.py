@@ -0,0 +1,31 @@
+"""Écritures concurrentes: fusion à trois voies et enregistrement versionné"""
+
+import json
+
+from safe_io import load_json_versioned, merge_changes, save_json_versioned
+
+
+def test_merge_keeps_both_sides_and_reports_conflicts():
+    base = {'day_restrictions': {'1': [6]}, 'time_restrictions': {}, 'old': 1}
+    ours = {'day_restrictions': {'1': [6, 7], '2': [1]}, 'time_restrictions': {}, 'old': 1}
+    theirs = {'day_restrictions': {'1': [5]}, 'time_restrictions': {'3': []}}
+    merged, conflicts = merge_changes(base, ours, theirs)
+    assert merged == {'day_restrictions': {'1': [6, 7], '2': [1]}, 'time_restrictions': {'3': []}}
+    assert conflicts == ['day_restrictions/1']
+
+
+def test_save_merges_changes_made_by_another_process(tmp_path):
+    path = str(tmp_path / 'disabled_users.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'day_restrictions': {}, 'time_restrictions': {}}, f)
+
+    data = load_json_versioned(path)
+    # Un autre processus enregistre entre la lecture et l'écriture
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'day_restrictions': {}, 'time_restrictions': {'2': []}}, f)
+    data['day_restrictions']['1'] = [6, 7]
+
+    assert save_json_versioned(path, data) == []
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f) == {'day_restrictions': {'1': [6, 7]}, 'time_restrictions': {'2': []}}
+    assert data['time_restrictions'] == {'2': []}
@@ -0,0 +1,43 @@
+"""Cache des documents: copie au chargement, écritures regroupées"""
+
+import json
+
+from state_cache import DocumentCache
+
+
+def make_cache(path):
+    def read():
+        with open(path, encoding='utf-8') as f:
+            return json.load(f), False
+
+    def write(data):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+    return DocumentCache(str(path), read, write, flush_seconds=3600)
+
+
+def test_unsaved_changes_do_not_leak_into_cache(tmp_path):
+    path = tmp_path / 'disabled_users.json'
+    path.write_text(json.dumps({'day_restrictions': {'1': [6, 7]}}), encoding='utf-8')
+    cache = make_cache(path)
+
+    data = cache.load()
+    data['day_restrictions']['1'].append(1)
+    data['day_activations'] = {}          # saisie abandonnée: pas de save()
+
+    assert cache.load() == {'day_restrictions': {'1': [6, 7]}}
+    assert cache.flush() == []
+
+
+def test_saved_changes_are_written_on_flush(tmp_path):
+    path = tmp_path / 'disabled_users.json'
+    path.write_text(json.dumps({'day_restrictions': {}}), encoding='utf-8')
+    cache = make_cache(path)
+
+    data = cache.load()
+    data['day_restrictions']['2'] = [1]
+    cache.save(data)
+    assert json.loads(path.read_text(encoding='utf-8')) == {'day_restrictions': {}}
+
+    assert cache.flush() == ['day_restrictions']
+    assert json.loads(path.read_text(encoding='utf-8')) == {'day_restrictions': {'2': [1]}}
@@ -0,0 +1,58 @@
+"""Feuilles de temps: chargement des tableaux (texte, stockage, archive) et totaux"""
+
+import attendance_store
+from attendance_archive import write_archive
+from timesheet import arrays_from_archive, arrays_from_attendance_data, arrays_from_store, compute_timesheet
+
+
+def pointage(timestamp, type_code=0):
+    return {'timestamp': timestamp, 'date': timestamp[:10], 'heure': timestamp[11:],
+            'type': attendance_store.PUNCH_TYPES[type_code], 'type_code': type_code, 'status': 1}
+
+
+ATTENDANCE = {
+    '7': {'name': 'Alice', 'records': [
+        pointage('2026-03-02 08:00:00', 0), pointage('2026-03-02 12:00:00', 2),
+        pointage('2026-03-02 13:00:00', 3), pointage('2026-03-02 18:00:00', 1),
+        pointage('2026-03-03 09:00:00', 0),
+    ]},
+    '12': {'name': 'Bob', 'records': [
+        # Libellé inconnu, sans code: punch -1
+        {'timestamp': '2026-03-02 08:30:00', 'date': '2026-03-02', 'type': 'Type 9', 'status': 1},
+        pointage('2026-03-04 08:00:00', 0),
+    ]},
+}
+
+
+def test_arrays_from_attendance_data_filters_dates():
+    arrays = arrays_from_attendance_data(ATTENDANCE, '2026-03-02', '2026-03-02')
+    assert list(arrays['uid']) == ['7', '7', '7', '7', '12']
+    assert list(arrays['punch']) == [0, 2, 3, 1, -1]
+    assert arrays['epoch'][0] == 1772438400
+    assert arrays['epoch'].dtype.kind == 'i'
+
+
+def test_text_store_and_archive_give_same_timesheet(tmp_path):
+    store = str(tmp_path / 'store')
+    attendance_store.append_attendance_records(
+        store, {uid: data['records'] for uid, data in ATTENDANCE.items()},
+        {uid: data['name'] for uid, data in ATTENDANCE.items()})
+    archive = str(tmp_path / 'pointages.zka')
+    write_archive(archive, ATTENDANCE)
+
+    feuilles = [compute_timesheet(arrays) for arrays in (
+        arrays_from_attendance_data(ATTENDANCE), arrays_from_store(store), arrays_from_archive(archive))]
+    for feuille in feuilles[1:]:
+        for key in ('uid', 'date', 'travail', 'pause', 'pointages', 'incomplet'):
+            assert list(feuille[key]) == list(feuilles[0][key])
+
+    alice = [i for i, uid in enumerate(feuilles[0]['uid']) if uid == '7']
+    assert [int(feuilles[0]['travail'][i]) for i in alice] == [9 * 3600, 0]
+    assert [int(feuilles[0]['pause'][i]) for i in alice] == [3600, 0]
+    assert [bool(feuilles[0]['incomplet'][i]) for i in alice] == [False, True]
+
+
+def test_empty_range():
+    arrays = arrays_from_attendance_data(ATTENDANCE, '2027-01-01')
+    assert len(arrays['epoch']) == 0
+    assert len(compute_timesheet(arrays)['uid']) == 0
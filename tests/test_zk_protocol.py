@@ -0,0 +1,48 @@
+"""Formats des fuseaux horaires et des groupes d'accès (CMD_TZ_WRQ, CMD_GRPTZ_WRQ).
+
+Les octets attendus sont écrits à la main d'après la documentation du SDK autonome, et non
+produits par zk_protocol: l'émulateur utilise les mêmes fonctions, un aller-retour avec lui
+ne vérifie donc pas le format. Ces tests figent le format documenté; seul un essai sur un
+appareil réel confirme que le firmware l'accepte.
+"""
+
+from zk_protocol import pack_group_time_zones, pack_time_zone, unpack_group_time_zones, unpack_time_zone
+
+# Fuseau 2: lundi-vendredi 08:00-17:30, samedi 09:15-12:00, dimanche sans accès
+TZ_WINDOWS = [(0, 0, 0, 0)] + [(8, 0, 17, 30)] * 5 + [(9, 15, 12, 0)]
+TZ_BYTES = bytes.fromhex(
+    '02000000'      # index (entier 32 bits, petit-boutiste)
+    '00000000'      # dimanche: heure/minute de début, heure/minute de fin
+    '0800111e'      # lundi 08:00-17:30
+    '0800111e'
+    '0800111e'
+    '0800111e'
+    '0800111e'      # vendredi
+    '090f0c00'      # samedi 09:15-12:00
+)
+# Groupe 3: fuseaux 2, 5 et aucun, vérification par défaut, sans jours fériés
+GROUP_BYTES = bytes.fromhex(
+    '03000000'      # groupe (entier 32 bits)
+    '0200' '0500' '0000'  # 3 fuseaux (entiers 16 bits)
+    '00'            # mode de vérification
+    '00'            # jours fériés
+)
+
+
+def test_pack_time_zone_layout():
+    assert len(TZ_BYTES) == 32
+    assert pack_time_zone(2, TZ_WINDOWS) == TZ_BYTES
+
+
+def test_unpack_time_zone_layout():
+    assert unpack_time_zone(TZ_BYTES) == (2, TZ_WINDOWS)
+
+
+def test_pack_group_time_zones_layout():
+    assert len(GROUP_BYTES) == 12
+    assert pack_group_time_zones(3, [2, 5, 0]) == GROUP_BYTES
+    assert pack_group_time_zones(3, [2, 5, 0], holidays=True)[-1] == 1
+
+
+def test_unpack_group_time_zones_layout():
+    assert unpack_group_time_zones(GROUP_BYTES) == (3, [2, 5, 0])
@@ -0,0 +1,195 @@
+"""Feuilles de temps (heures travaillées, pauses, heures sup.) calculées avec NumPy.
+
+Les pointages sont convertis en tableaux (uid, secondes epoch, code de pointage), triés
+par utilisateur puis par horodatage. Chaque pointage fixe l'état de l'utilisateur jusqu'au
+pointage suivant du même jour:
+
+    0 Entrée      -> travail       1 Sortie     -> absent
+    2 Pause début -> pause         3 Pause fin  -> travail
+    4 HS entrée   -> heures sup.   5 HS sortie  -> absent
+
+La durée entre deux pointages consécutifs est attribuée à l'état courant, puis sommée
+par utilisateur et par jour, sans boucle Python sur les pointages.
+
+Dépendance: numpy >= 1.23 (pip install "numpy>=1.23")
+"""
+
+import numpy as np
+
+from attendance_store import iter_store_records, record_punch_code
+
+SECONDS_PER_DAY = 86400
+
+# États après chaque code de pointage
+STATE_ABSENT = 0
+STATE_TRAVAIL = 1
+STATE_PAUSE = 2
+STATE_HEURES_SUP = 3
+
+# Table code de pointage -> état (codes inconnus: absent)
+PUNCH_STATE = np.array(
+    [STATE_TRAVAIL, STATE_ABSENT, STATE_PAUSE, STATE_TRAVAIL, STATE_HEURES_SUP, STATE_ABSENT],
+    dtype=np.int8
+)
+
+
+# Pointage tel que lu depuis le texte (uid ZKTeco: 24 caractères au plus)
+RECORD_DTYPE = np.dtype([('uid', 'U24'), ('epoch', 'datetime64[s]'), ('punch', np.int16)])
+
+
+def _in_range(record, date_debut, date_fin):
+    return not ((date_debut and record['date'] < date_debut) or (date_fin and record['date'] > date_fin))
+
+
+def _to_arrays(rows):
+    """Remplir un tableau structuré depuis des tuples (uid, horodatage, punch), sans liste intermédiaire"""
+    records = np.fromiter(rows, dtype=RECORD_DTYPE)
+    return {
+        'uid': records['uid'],
+        'epoch': records['epoch'].astype(np.int64),
+        'punch': records['punch'],
+    }
+
+
+def _row(uid, record):
+    punch = record_punch_code(record)
+    return str(uid), record['timestamp'], -1 if punch is None else punch
+
+
+def arrays_from_attendance_data(attendance_data, date_debut=None, date_fin=None):
+    """Tableaux de pointages depuis la vue {uid: {'name', 'records'}} (dates incluses)"""
+    return _to_arrays(_row(uid, record)
+                      for uid, data in attendance_data.items()
+                      for record in data['records']
+                      if _in_range(record, date_debut, date_fin))
+
+
+def arrays_from_store(store_dir, date_debut=None, date_fin=None):
+    """Tableaux de pointages lus directement dans les segments du stockage"""
+    return _to_arrays(_row(record['uid'], record)
+                      for record in iter_store_records(store_dir)
+                      if _in_range(record, date_debut, date_fin))
+
+
+def arrays_from_archive(archive_path, date_debut=None, date_fin=None):
+    """Tableaux de pointages depuis l'archive binaire, sans analyse de texte"""
+    from attendance_archive import open_archive, range_scan
+
+    archive = open_archive(archive_path)
+    if date_debut or date_fin:
+        archive = range_scan(archive, date_debut or '1970-01-01', date_fin or '2999-12-31')
+    punch = archive['punch'].astype(np.int16)
+    return {
+        'uid': archive['uid'].astype(str),
+        'epoch': np.asarray(archive['epoch'], dtype=np.int64),
+        # 255 = type inconnu dans l'archive
+        'punch': np.where(punch == 255, -1, punch),
+    }
+
+
+def compute_timesheet(arrays, standard_hours=8):
+    """Totaux par utilisateur et par jour
+
+    Retourne un dictionnaire de tableaux alignés (une ligne par utilisateur et par jour):
+      uid, date, travail, pause, heures_sup, depassement (secondes), pointages, incomplet
+    'depassement' est le temps de travail au-delà de standard_hours; 'incomplet' signale
+    une journée qui ne se termine pas par une sortie (pointage manquant).
+    """
+    uid = arrays['uid']
+    epoch = arrays['epoch']
+    punch = arrays['punch']
+
+    if len(epoch) == 0:
+        empty_i = np.zeros(0, dtype=np.int64)
+        return {
+            'uid': np.zeros(0, dtype=str), 'date': np.zeros(0, dtype='datetime64[D]'),
+            'travail': empty_i, 'pause': empty_i, 'heures_sup': empty_i,
+            'depassement': empty_i, 'pointages': empty_i, 'incomplet': np.zeros(0, dtype=bool),
+        }
+
+    # Trier par utilisateur, jour puis horodatage
+    user_codes, user_idx = np.unique(uid, return_inverse=True)
+    day = epoch // SECONDS_PER_DAY
+    order = np.lexsort((epoch, day, user_idx))
+    user_idx, day, epoch, punch = user_idx[order], day[order], epoch[order], punch[order]
+
+    # Un groupe par (utilisateur, jour)
+    new_group = np.ones(len(epoch), dtype=bool)
+    new_group[1:] = (user_idx[1:] != user_idx[:-1]) | (day[1:] != day[:-1])
+    group = np.cumsum(new_group) - 1
+    n_groups = group[-1] + 1
+
+    # État après chaque pointage et durée jusqu'au pointage suivant du même groupe
+    known = (punch >= 0) & (punch < len(PUNCH_STATE))
+    state = np.where(known, PUNCH_STATE[np.clip(punch, 0, len(PUNCH_STATE) - 1)], STATE_ABSENT)
+    duration = np.zeros(len(epoch), dtype=np.int64)
+    same_group = ~new_group[1:]
+    duration[:-1] = np.where(same_group, epoch[1:] - epoch[:-1], 0)
+
+    def total(wanted_state):
+        return np.bincount(group, weights=np.where(state == wanted_state, duration, 0),
+                           minlength=n_groups).astype(np.int64)
+
+    travail = total(STATE_TRAVAIL)
+    pause = total(STATE_PAUSE)
+    heures_sup = total(STATE_HEURES_SUP)
+    depassement = np.maximum(travail - int(standard_hours * 3600), 0)
+
+    # Dernier pointage de chaque groupe: la journée est incomplète s'il ne s'agit pas d'une sortie
+    last = np.ones(len(epoch), dtype=bool)
+    last[:-1] = new_group[1:]
+    incomplet = state[last] != STATE_ABSENT
+
+    first = new_group
+    return {
+        'uid': user_codes[user_idx[first]],
+        'date': day[first].astype('datetime64[D]'),
+        'travail': travail,
+        'pause': pause,
+        'heures_sup': heures_sup,
+        'depassement': depassement,
+        'pointages': np.bincount(group, minlength=n_groups),
+        'incomplet': incomplet,
+    }
+
+
+def format_duration(seconds):
+    """Formater une durée en HH:MM"""
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}"
+
+
+def timesheet_rows(timesheet):
+    """Parcourir la feuille de temps ligne par ligne (dictionnaires)"""
+    for i in range(len(timesheet['uid'])):
+        yield {
+            'uid': str(timesheet['uid'][i]),
+            'date': str(timesheet['date'][i]),
+            'travail': format_duration(timesheet['travail'][i]),
+            'pause': format_duration(timesheet['pause'][i]),
+            'heures_sup': format_duration(timesheet['heures_sup'][i]),
+            'depassement': format_duration(timesheet['depassement'][i]),
+            'pointages': int(timesheet['pointages'][i]),
+            'incomplet': bool(timesheet['incomplet'][i]),
+        }
+
+
+if __name__ == '__main__':
+    import csv
+    import sys
+
+    if len(sys.argv) not in (2, 4):
+        print("Usage: python timesheet.py <attendance_store|archive.zka> [date_debut date_fin]")
+        sys.exit(1)
+
+    date_debut, date_fin = (sys.argv[2], sys.argv[3]) if len(sys.argv) == 4 else (None, None)
+    if sys.argv[1].endswith('.zka'):
+        arrays = arrays_from_archive(sys.argv[1], date_debut, date_fin)
+    else:
+        arrays = arrays_from_store(sys.argv[1], date_debut, date_fin)
+    feuille = compute_timesheet(arrays)
+
+    writer = csv.DictWriter(sys.stdout, fieldnames=['uid', 'date', 'travail', 'pause', 'heures_sup',
+                                                    'depassement', 'pointages', 'incomplet'])
+    writer.writeheader()
+    writer.writerows(timesheet_rows(feuille))
@@ -0,0 +1,101 @@
+"""Cache de la table des utilisateurs de l'appareil pour la durée d'une session.
+
+CachedConnection enveloppe la connexion pyzk: get_users() est servi depuis la mémoire,
+set_user()/save_user_template()/delete_user() mettent le cache à jour sans retélécharger la
+table, et le cache est revalidé à moindre coût en comparant le nombre d'utilisateurs annoncé
+par read_sizes() (un seul petit paquet) au nombre d'utilisateurs en cache.
+
+Toutes les autres méthodes sont transmises telles quelles à la connexion.
+"""
+
+import time
+from types import SimpleNamespace
+
+
+class CachedConnection:
+    """Connexion ZK avec cache de la table des utilisateurs"""
+
+    def __init__(self, conn, ttl=30, max_age=600):
+        """
+        conn: connexion pyzk (ou compatible)
+        ttl: délai (secondes) pendant lequel le cache est servi sans revalidation
+        max_age: âge maximal (secondes) avant un rechargement complet de la table
+        """
+        self._conn = conn
+        self._ttl = ttl
+        self._max_age = max_age
+        self._users = None
+        self._loaded_at = 0
+        self._checked_at = 0
+        self.stats = {'hits': 0, 'revalidations': 0, 'downloads': 0}
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def invalidate_users(self):
+        """Oublier la table en cache (le prochain get_users() la retélécharge)"""
+        self._users = None
+
+    def _download(self):
+        self._users = list(self._conn.get_users())
+        self._loaded_at = self._checked_at = time.monotonic()
+        self.stats['downloads'] += 1
+
+    def get_users(self):
+        """Table des utilisateurs, depuis le cache si elle est toujours valide"""
+        now = time.monotonic()
+        if self._users is None or now - self._loaded_at > self._max_age:
+            self._download()
+        elif now - self._checked_at > self._ttl:
+            # Revalidation: le nombre d'utilisateurs a-t-il changé sur l'appareil?
+            self._conn.read_sizes()
+            self.stats['revalidations'] += 1
+            if self._conn.users != len(self._users):
+                self._download()
+            else:
+                self._checked_at = now
+                self.stats['hits'] += 1
+        else:
+            self.stats['hits'] += 1
+        return list(self._users)
+
+    def set_user(self, uid=None, name='', privilege=0, password='', group_id='', user_id='', card=0):
+        """Créer/modifier un utilisateur sur l'appareil et dans le cache"""
+        result = self._conn.set_user(uid=uid, name=name, privilege=privilege, password=password,
+                                     group_id=group_id, user_id=user_id, card=card)
+        if self._users is not None:
+            if uid is None:
+                # UID attribué par l'appareil: inconnu ici
+                self.invalidate_users()
+            else:
+                user = make_user(uid, name, privilege, password, group_id, user_id or str(uid), card)
+                self._users = [u for u in self._users if u.uid != uid] + [user]
+        return result
+
+    def save_user_template(self, user, fingers=[]):
+        """Créer/modifier un utilisateur avec ses gabarits d'empreinte, sur l'appareil et dans le cache"""
+        result = self._conn.save_user_template(user, fingers)
+        if self._users is not None:
+            self._users = [u for u in self._users if u.uid != user.uid] + [user]
+        return result
+
+    def delete_user(self, uid=0, user_id=''):
+        """Supprimer un utilisateur de l'appareil et du cache"""
+        result = self._conn.delete_user(uid=uid, user_id=user_id)
+        if self._users is not None:
+            if uid:
+                self._users = [u for u in self._users if u.uid != uid]
+            else:
+                self._users = [u for u in self._users if u.user_id != str(user_id)]
+        return result
+
+
+def make_user(uid, name, privilege, password, group_id, user_id, card):
+    """Construire un utilisateur au format pyzk pour le cache"""
+    # pyzk n'est importé qu'ici: les commandes sans appareil n'en dépendent pas
+    try:
+        from zk.user import User
+    except ImportError:  # pyzk absent (connexion simulée)
+        return SimpleNamespace(uid=uid, name=name, privilege=privilege, password=str(password),
+                               group_id=str(group_id), user_id=user_id, card=int(card))
+    return User(uid, name, privilege, password, group_id, user_id, card)
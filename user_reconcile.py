@@ -0,0 +1,177 @@
+"""Réconciliation de la table des utilisateurs de l'appareil avec l'état voulu.
+
+À partir des règles (utilisateurs à désactiver / à réactiver), des fiches sauvegardées
+dans disabled_users.json et de la table de l'appareil (lue une seule fois), plan_changes
+calcule le plus petit ensemble d'opérations:
+
+  - delete : utilisateur à désactiver encore présent sur l'appareil (fiche sauvegardée
+             puis delete_user)
+  - create : utilisateur à réactiver absent de l'appareil, recréé depuis sa fiche (set_user)
+  - forget : utilisateur à réactiver déjà présent sur l'appareil (réinscrit entre-temps):
+             la fiche obsolète est retirée, sans commande à l'appareil
+
+Les utilisateurs déjà dans l'état voulu ne génèrent aucune commande. Les empreintes des
+utilisateurs supprimés sont sauvegardées en une seule lecture et restaurées avec eux
+(template_cache.py). Le plan peut être
+affiché sans être appliqué (simulation), avec une estimation du temps passé sur l'appareil.
+"""
+
+from metrics import METRICS
+from template_cache import backup_templates, forget_templates, load_templates, restore_user
+
+# Durées (secondes) par commande utilisées tant qu'aucune mesure n'est disponible
+DEFAULT_COMMAND_SECONDS = {
+    'delete_user': 0.05,
+    'get_templates': 0.5,
+    'set_user': 0.08,
+    'disable_device': 0.02,
+    'enable_device': 0.02,
+}
+
+
+def saved_user_record(user, temp_disabled=True):
+    """Fiche sauvegardée (disabled_users.json) d'un utilisateur de l'appareil"""
+    record = {
+        'uid': user.uid,
+        'name': user.name,
+        'privilege': user.privilege,
+        'password': user.password,
+        'group_id': user.group_id,
+        'user_id': user.user_id,
+        'card': user.card,
+    }
+    if temp_disabled:
+        record['temp_disabled'] = True
+    return record
+
+
+def set_user_arguments(uid, record):
+    """Arguments de set_user pour recréer un utilisateur depuis sa fiche sauvegardée"""
+    # pyzk attend group_id sous forme de chaîne (vide si aucun groupe)
+    group_id = str(record['group_id'] or '').strip()
+    if not group_id.isdigit():
+        group_id = ''
+    return {
+        'uid': int(uid),
+        'name': str(record['name']),
+        'privilege': int(record['privilege']),
+        'password': str(record['password']) if record['password'] else '',
+        'group_id': str(int(group_id)) if group_id else '',
+        'user_id': str(record['user_id']),
+        'card': int(record['card']) if record['card'] else 0,
+    }
+
+
+def _uid_order(uid):
+    return (0, int(uid), '') if str(uid).isdigit() else (1, 0, str(uid))
+
+
+def plan_changes(device_users, disabled_data, users_to_disable, users_to_enable):
+    """Opérations minimales pour atteindre l'état voulu
+
+    device_users: {uid (str): utilisateur} lu sur l'appareil
+    Retourne {'delete': [utilisateur], 'create': [uid], 'forget': [uid], 'unchanged': n}
+    """
+    delete = [device_users[uid] for uid in sorted(users_to_disable, key=_uid_order)
+              if uid in device_users]
+    create = []
+    forget = []
+    for uid in sorted(users_to_enable, key=_uid_order):
+        record = disabled_data.get(uid)
+        if not record or not record.get('temp_disabled'):
+            continue
+        if uid in device_users:
+            forget.append(uid)
+        else:
+            create.append(uid)
+    changed = len(delete) + len(create) + len(forget)
+    return {
+        'delete': delete,
+        'create': create,
+        'forget': forget,
+        'unchanged': len(users_to_disable) + len(users_to_enable) - changed,
+    }
+
+
+def command_seconds(operation, registry=METRICS):
+    """Durée moyenne mesurée d'une commande (toutes connexions), ou la valeur par défaut"""
+    seconds = registry.mean(operation)
+    return DEFAULT_COMMAND_SECONDS[operation] if seconds is None else seconds
+
+
+def estimate_seconds(plan, registry=METRICS):
+    """Temps estimé passé sur l'appareil pour appliquer le plan"""
+    if not plan['delete'] and not plan['create']:
+        return 0.0
+    backup = command_seconds('get_templates', registry) if plan['delete'] else 0.0
+    return (backup + len(plan['delete']) * command_seconds('delete_user', registry) +
+            len(plan['create']) * command_seconds('set_user', registry) +
+            command_seconds('disable_device', registry) + command_seconds('enable_device', registry))
+
+
+def describe_plan(plan, disabled_data, registry=METRICS):
+    """Lignes lisibles décrivant le plan (simulation)"""
+    lines = [f"  Supprimer: {user.name} (UID #{user.uid})" for user in plan['delete']]
+    lines += [f"  Recréer: {disabled_data[uid]['name']} (UID #{uid})" for uid in plan['create']]
+    lines += [f"  Fiche obsolète retirée (déjà sur l'appareil): UID #{uid}" for uid in plan['forget']]
+    lines.append(f"  {len(plan['delete'])} suppression(s), {len(plan['create'])} recréation(s), "
+                 f"{plan['unchanged']} utilisateur(s) déjà dans l'état voulu")
+    lines.append(f"  Temps estimé sur l'appareil: {estimate_seconds(plan, registry):.2f} s")
+    return lines
+
+
+def apply_plan(conn, plan, disabled_data, template_path=None, persist=None):
+    """Appliquer le plan dans une seule fenêtre où l'appareil est désactivé
+
+    disabled_data est mis à jour (fiches ajoutées/retirées). Avec template_path, les
+    empreintes sont sauvegardées avant les suppressions et restaurées avec les utilisateurs.
+    persist: fonction (disabled_data) qui écrit les fiches sur disque; appelée avant la
+    première suppression pour qu'un arrêt brutal ne perde aucune fiche.
+    Retourne (désactivés, réactivés).
+    """
+    for uid in plan['forget']:
+        del disabled_data[uid]
+    if not plan['delete'] and not plan['create']:
+        return 0, 0
+
+    # Une seule fenêtre désactivée pour tout le lot (si l'appareil n'est pas déjà désactivé)
+    was_enabled = getattr(conn, 'is_enabled', True)
+    if was_enabled:
+        conn.disable_device()
+    restored = 0
+    with_templates = []
+    try:
+        if template_path and plan['delete']:
+            try:
+                count = backup_templates(conn, [user.uid for user in plan['delete']], template_path)
+                print(f"  {count} empreinte(s) sauvegardée(s)")
+            except Exception as e:
+                print(f"  Attention: empreintes non sauvegardées ({e})")
+        templates = load_templates(template_path) if template_path and plan['create'] else {}
+
+        for user in plan['delete']:
+            disabled_data[str(user.uid)] = saved_user_record(user)
+        if persist is not None and plan['delete']:
+            persist(disabled_data)
+
+        for user in plan['delete']:
+            conn.delete_user(uid=user.uid)
+            print(f"  Désactivé: {user.name} (UID #{user.uid})")
+
+        for uid in plan['create']:
+            record = disabled_data[uid]
+            try:
+                fingers = restore_user(conn, set_user_arguments(uid, record), templates)
+                del disabled_data[uid]
+                restored += 1
+                if fingers:
+                    with_templates.append(uid)
+                print(f"  Réactivé: {record['name']} (UID #{uid}, {fingers} empreinte(s))")
+            except Exception as e:
+                print(f"  ERREUR - Impossible de réactiver {record['name']}: {str(e)}")
+    finally:
+        if was_enabled:
+            conn.enable_device()
+        if with_templates:
+            forget_templates(template_path, with_templates)
+    return len(plan['delete']), restored
@@ -0,0 +1,464 @@
+"""Client asyncio du protocole ZK (port 4370, TCP ou UDP).
+
+AsyncZK expose sous forme de coroutines les opérations de la connexion pyzk utilisées par
+le script: connect/disconnect, enable_device/disable_device, refresh_data, test_voice,
+read_sizes, get_serialnumber, get_platform, get_mac, get_device_name,
+get_firmware_version, get_time, get_users, get_attendance, set_user, delete_user,
+get_templates et save_user_template, ainsi que send_command (commande brute, utilisée pour
+les fuseaux horaires: voir zk_protocol.send_raw_command). Une seule boucle d'événements peut
+piloter des centaines d'appareils en parallèle.
+
+Non pris en charge: live_capture/end_live_capture (pointages en temps réel, live_ingest.py),
+qui nécessitent pyzk.
+
+Chaque réponse attendue est bornée par le délai de la connexion. Une commande annulée ou
+expirée en cours d'échange laisse le flux dans un état inconnu: la connexion est alors
+fermée (les appels suivants échouent proprement au lieu de lire une réponse décalée).
+
+BlockingConnection enveloppe un AsyncZK dans une boucle en arrière-plan et présente ces
+opérations avec l'interface synchrone de pyzk: elle peut remplacer `conn` dans les fonctions
+du menu, sauf les pointages en temps réel (option 22, zk_cli.py stream).
+"""
+
+import asyncio
+import threading
+from struct import pack, unpack
+
+from zk_protocol import (
+    CMD_ACK_OK,
+    CMD_ACK_UNAUTH,
+    CMD_ATTLOG_RRQ,
+    CMD_AUTH,
+    CMD_CONNECT,
+    CMD_DATA,
+    CMD_DB_RRQ,
+    CMD_DELETE_USER,
+    CMD_DISABLEDEVICE,
+    CMD_ENABLEDEVICE,
+    CMD_EXIT,
+    CMD_FREE_DATA,
+    CMD_GET_FREE_SIZES,
+    CMD_GET_TIME,
+    CMD_GET_VERSION,
+    CMD_OPTIONS_RRQ,
+    CMD_PREPARE_BUFFER,
+    CMD_PREPARE_DATA,
+    CMD_READ_BUFFER,
+    CMD_REFRESHDATA,
+    CMD_SAVE_USERTEMPS,
+    CMD_TESTVOICE,
+    CMD_USER_WRQ,
+    CMD_USERTEMP_RRQ,
+    FCT_FINGERTMP,
+    FCT_USER,
+    TCP_TOP_SIZE,
+    USHRT_MAX,
+    decode_time,
+    make_commkey,
+    make_packet,
+    option_value,
+    parse_packet,
+    pack_user_templates,
+    parse_sizes,
+    tcp_frame,
+    tcp_frame_length,
+    unpack_attendance,
+    unpack_templates,
+    unpack_users,
+    user_wrq_payload,
+)
+
+OK_CODES = (CMD_ACK_OK, CMD_PREPARE_DATA, CMD_DATA)
+# Taille maximale d'un paquet CMD_DATA envoyé à l'appareil (comme pyzk)
+SEND_CHUNK = 1024
+
+
+class ZKNetworkError(Exception):
+    """Erreur réseau ou délai dépassé (la connexion est fermée)"""
+
+
+class ZKErrorResponse(Exception):
+    """L'appareil a refusé la commande"""
+
+
+class _TcpTransport:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    def send(self, packet):
+        self.writer.write(tcp_frame(packet))
+
+    async def recv(self):
+        top = await self.reader.readexactly(TCP_TOP_SIZE)
+        length = tcp_frame_length(top)
+        if length is None:
+            raise ZKNetworkError("TCP packet invalid")
+        return await self.reader.readexactly(length)
+
+    def close(self):
+        self.writer.close()
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.queue = asyncio.Queue()
+
+    def datagram_received(self, data, addr):
+        self.queue.put_nowait(data)
+
+    def error_received(self, exc):
+        self.queue.put_nowait(exc)
+
+
+class _UdpTransport:
+    def __init__(self, transport, protocol):
+        self.transport = transport
+        self.protocol = protocol
+
+    @classmethod
+    async def open(cls, host, port):
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.create_datagram_endpoint(_UdpProtocol, remote_addr=(host, port))
+        return cls(transport, protocol)
+
+    def send(self, packet):
+        self.transport.sendto(packet)
+
+    async def recv(self):
+        item = await self.protocol.queue.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncZK:
+    """Connexion asynchrone à un appareil ZK"""
+
+    def __init__(self, ip, port=4370, timeout=60, password=0, force_udp=False, encoding='UTF-8'):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.password = password
+        self.tcp = not force_udp
+        self.encoding = encoding
+        self.is_connect = False
+        self.is_enabled = True
+        self.user_packet_size = 72 if self.tcp else 28
+        self.next_uid = 1
+        self.users = self.fingers = self.records = self.cards = 0
+        self.users_cap = self.fingers_cap = self.rec_cap = 0
+        self.users_av = self.fingers_av = self.rec_av = 0
+        self.faces = self.faces_cap = 0
+        self._transport = None
+        self._session_id = 0
+        self._reply_id = USHRT_MAX - 1
+        self._lock = asyncio.Lock()
+
+    def __repr__(self):
+        return f"AsyncZK {'tcp' if self.tcp else 'udp'}://{self.ip}:{self.port}"
+
+    # --- Échanges de paquets ---
+
+    def _abort(self):
+        """Fermer la connexion après une erreur ou une annulation en cours d'échange"""
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        self.is_connect = False
+
+    async def _recv(self):
+        return parse_packet(await asyncio.wait_for(self._transport.recv(), self.timeout))
+
+    async def _request(self, command, data=b''):
+        """Envoyer une commande et lire la réponse -> (code, données)"""
+        self._transport.send(make_packet(command, self._session_id, self._reply_id, data))
+        code, session_id, reply_id, payload = await self._recv()
+        self._reply_id = reply_id
+        if command == CMD_CONNECT:
+            self._session_id = session_id
+        return code, payload
+
+    async def _receive_data(self, code, payload):
+        """Données d'une réponse CMD_DATA, ou reçues en paquets après CMD_PREPARE_DATA"""
+        if code == CMD_DATA:
+            return payload
+        if code != CMD_PREPARE_DATA:
+            raise ZKErrorResponse(f"Invalid response {code}")
+        chunks = []
+        while True:
+            code, _session_id, _reply_id, payload = await self._recv()
+            if code == CMD_DATA:
+                chunks.append(payload)
+            elif code == CMD_ACK_OK:
+                return b''.join(chunks)
+            else:
+                raise ZKErrorResponse(f"Invalid response {code}")
+
+    async def _read_with_buffer(self, command, fct=0, ext=0):
+        """Lecture en tampon (1503/1504) d'un bloc de données complet"""
+        max_chunk = 0xFFC0 if self.tcp else 16 * 1024
+        code, payload = await self._request(CMD_PREPARE_BUFFER, pack('<bhii', 1, command, fct, ext))
+        if code == CMD_DATA:
+            return payload
+        if code not in OK_CODES:
+            raise ZKErrorResponse("RWB Not supported")
+        size = unpack('<I', payload[1:5])[0]
+        chunks = []
+        start = 0
+        while start < size:
+            length = min(max_chunk, size - start)
+            code, payload = await self._request(CMD_READ_BUFFER, pack('<ii', start, length))
+            chunks.append(await self._receive_data(code, payload))
+            start += length
+        await self._request(CMD_FREE_DATA)
+        return b''.join(chunks)
+
+    async def _send_with_buffer(self, buffer):
+        """Envoyer un bloc de données à l'appareil (CMD_PREPARE_DATA puis paquets CMD_DATA)"""
+        await self._simple(CMD_FREE_DATA, error="can't free data")
+        await self._simple(CMD_PREPARE_DATA, pack('<I', len(buffer)), "Can't prepare data")
+        for start in range(0, len(buffer), SEND_CHUNK):
+            await self._simple(CMD_DATA, buffer[start:start + SEND_CHUNK], "Can't send chunk")
+
+    async def _simple(self, command, data=b'', error="Command failed"):
+        code, payload = await self._request(command, data)
+        if code not in OK_CODES:
+            raise ZKErrorResponse(error)
+        return payload
+
+    async def _call(self, operation, *args):
+        """Exécuter une opération seule sur la connexion, en fermant celle-ci si elle est interrompue"""
+        async with self._lock:
+            if self._transport is None:
+                raise ZKNetworkError("instance are not connected.")
+            try:
+                return await operation(*args)
+            except asyncio.CancelledError:
+                self._abort()
+                raise
+            except (OSError, asyncio.IncompleteReadError, ZKNetworkError) as e:
+                self._abort()
+                raise ZKNetworkError(str(e) or type(e).__name__) from e
+
+    # --- Connexion ---
+
+    async def connect(self):
+        """Se connecter (et s'authentifier si l'appareil a un mot de passe)"""
+        async with self._lock:
+            opener = _TcpTransport.open if self.tcp else _UdpTransport.open
+            try:
+                self._transport = await asyncio.wait_for(opener(self.ip, self.port), self.timeout)
+                self._session_id = 0
+                self._reply_id = USHRT_MAX - 1
+                code, _payload = await self._request(CMD_CONNECT)
+                if code == CMD_ACK_UNAUTH:
+                    code, _payload = await self._request(CMD_AUTH, make_commkey(self.password, self._session_id))
+            except asyncio.CancelledError:
+                self._abort()
+                raise
+            except (OSError, asyncio.IncompleteReadError, ZKNetworkError) as e:
+                self._abort()
+                raise ZKNetworkError(f"can't reach device ({self.ip}): {e}") from e
+            if code not in OK_CODES:
+                self._abort()
+                raise ZKErrorResponse("Unauthenticated" if code == CMD_ACK_UNAUTH else "Invalid response: Can't connect")
+            self.is_connect = True
+            return self
+
+    async def disconnect(self):
+        async def operation():
+            await self._simple(CMD_EXIT, error="can't disconnect")
+            self._abort()
+            return True
+        return await self._call(operation)
+
+    async def enable_device(self):
+        await self._call(self._simple, CMD_ENABLEDEVICE, b'', "Can't enable device")
+        self.is_enabled = True
+        return True
+
+    async def disable_device(self):
+        await self._call(self._simple, CMD_DISABLEDEVICE, b'', "Can't disable device")
+        self.is_enabled = False
+        return True
+
+    async def refresh_data(self):
+        await self._call(self._simple, CMD_REFRESHDATA, b'', "can't refresh data")
+        return True
+
+    async def test_voice(self, index=0):
+        code, _payload = await self._call(self._request, CMD_TESTVOICE, pack('<I', index))
+        return code in OK_CODES
+
+    async def send_command(self, command, data=b''):
+        """Commande sans méthode dédiée -> {'status', 'code', 'data'} (comme pyzk __send_command)"""
+        code, payload = await self._call(self._request, command, data)
+        return {'status': code in OK_CODES, 'code': code, 'data': payload}
+
+    # --- Informations ---
+
+    async def _option(self, name):
+        payload = await self._call(self._simple, CMD_OPTIONS_RRQ, name, f"Can't read {name!r}")
+        return option_value(payload)
+
+    async def get_serialnumber(self):
+        return await self._option(b'~SerialNumber\x00')
+
+    async def get_platform(self):
+        return await self._option(b'~Platform\x00')
+
+    async def get_mac(self):
+        return await self._option(b'MAC\x00')
+
+    async def get_device_name(self):
+        try:
+            return await self._option(b'~DeviceName\x00')
+        except ZKErrorResponse:
+            return ""
+
+    async def get_firmware_version(self):
+        payload = await self._call(self._simple, CMD_GET_VERSION, b'', "Can't read frimware version")
+        return payload.split(b'\x00')[0].decode(errors='ignore')
+
+    async def get_time(self):
+        payload = await self._call(self._simple, CMD_GET_TIME, b'', "can't get time")
+        return decode_time(payload[:4])
+
+    async def _read_sizes(self):
+        payload = await self._simple(CMD_GET_FREE_SIZES, error="can't read sizes")
+        for name, value in parse_sizes(payload).items():
+            setattr(self, name, value)
+        return True
+
+    async def read_sizes(self):
+        return await self._call(self._read_sizes)
+
+    # --- Utilisateurs et pointages ---
+
+    async def _get_users(self):
+        await self._read_sizes()
+        if self.users == 0:
+            self.next_uid = 1
+            return []
+        data = await self._read_with_buffer(CMD_USERTEMP_RRQ, FCT_USER)
+        users, packet_size = unpack_users(data, self.users, self.encoding)
+        if packet_size:
+            self.user_packet_size = packet_size
+        self.next_uid = max((u.uid for u in users), default=0) + 1
+        return users
+
+    async def get_users(self):
+        return await self._call(self._get_users)
+
+    async def _get_attendance(self):
+        await self._read_sizes()
+        if self.records == 0:
+            return []
+        records = self.records
+        users = await self._get_users()
+        data = await self._read_with_buffer(CMD_ATTLOG_RRQ)
+        return unpack_attendance(data, records, users)
+
+    async def get_attendance(self):
+        return await self._call(self._get_attendance)
+
+    async def _set_user(self, uid, name, privilege, password, group_id, user_id, card):
+        if uid is None:
+            uid = self.next_uid
+        user_id = user_id or str(uid)
+        payload = user_wrq_payload(uid, name, int(privilege), password, group_id, user_id, card,
+                                   self.user_packet_size, self.encoding)
+        await self._simple(CMD_USER_WRQ, payload, "Can't set user")
+        await self._simple(CMD_REFRESHDATA, error="can't refresh data")
+        if self.next_uid == uid:
+            self.next_uid += 1
+
+    async def set_user(self, uid=None, name='', privilege=0, password='', group_id='', user_id='', card=0):
+        await self._call(self._set_user, uid, name, privilege, password, group_id, user_id, card)
+
+    async def _delete_user(self, uid, user_id):
+        if not uid:
+            matches = [u for u in await self._get_users() if u.user_id == str(user_id)]
+            if not matches:
+                return False
+            uid = matches[0].uid
+        await self._simple(CMD_DELETE_USER, pack('<h', uid), "Can't delete user")
+        await self._simple(CMD_REFRESHDATA, error="can't refresh data")
+        return True
+
+    async def delete_user(self, uid=0, user_id=''):
+        return await self._call(self._delete_user, uid, user_id)
+
+    # --- Empreintes ---
+
+    async def _get_templates(self):
+        await self._read_sizes()
+        if self.fingers == 0:
+            return []
+        return unpack_templates(await self._read_with_buffer(CMD_DB_RRQ, FCT_FINGERTMP))
+
+    async def get_templates(self):
+        return await self._call(self._get_templates)
+
+    async def _save_user_template(self, user, fingers):
+        await self._send_with_buffer(pack_user_templates(user, fingers, self.user_packet_size, self.encoding))
+        await self._simple(CMD_SAVE_USERTEMPS, pack('<IHH', 12, 0, 8), "Can't save utemp")
+        await self._simple(CMD_REFRESHDATA, error="can't refresh data")
+
+    async def save_user_template(self, user, fingers=()):
+        """Enregistrer un utilisateur (objet User) et ses gabarits en une seule écriture"""
+        await self._call(self._save_user_template, user, list(fingers))
+
+
+async def run_on_devices(connections, operation, concurrency=100):
+    """Exécuter operation(conn) sur de nombreux appareils avec au plus `concurrency` en cours
+
+    Retourne une liste alignée sur `connections`: résultat ou exception de chaque appareil.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(conn):
+        async with semaphore:
+            return await operation(conn)
+
+    return await asyncio.gather(*(run(conn) for conn in connections), return_exceptions=True)
+
+
+class BlockingConnection:
+    """Interface synchrone (comme pyzk) d'un AsyncZK, exécuté dans une boucle en arrière-plan"""
+
+    def __init__(self, async_conn, loop=None):
+        self._conn = async_conn
+        self._own_loop = loop is None
+        self._loop = loop or asyncio.new_event_loop()
+        if self._own_loop:
+            threading.Thread(target=self._loop.run_forever, daemon=True).start()
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def __getattr__(self, name):
+        attribute = getattr(self._conn, name)
+        if asyncio.iscoroutinefunction(attribute):
+            return lambda *args, **kwargs: self._run(attribute(*args, **kwargs))
+        return attribute
+
+    def connect(self):
+        self._run(self._conn.connect())
+        return self
+
+    def disconnect(self):
+        try:
+            return self._run(self._conn.disconnect())
+        finally:
+            if self._own_loop:
+                self._loop.call_soon_threadsafe(self._loop.stop)
@@ -0,0 +1,230 @@
+"""Interface en ligne de commande non interactive (cron, systemd, scripts).
+
+    python zk_cli.py sync [--full] [--fleet]
+    python zk_cli.py stream
+    python zk_cli.py apply [--dry-run]
+    python zk_cli.py access push [--dry-run]
+    python zk_cli.py users list
+    python zk_cli.py attendance users
+    python zk_cli.py attendance query UID [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+    python zk_cli.py export [--format json|csv|ndjson] [--output FICHIER] [--gzip]
+                            [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--uid UID,...] [--type TYPE,...]
+
+Les fonctions sont celles du script principal (chargé comme module, sans le menu). pyzk
+n'est importé et l'appareil n'est contacté que par les commandes qui en ont besoin (sync,
+stream, apply, access push, users list): les commandes sur le stockage local démarrent sans connexion.
+
+Avec --json, le résultat est écrit sur la sortie standard en une ligne JSON
+({'command', 'status', 'exit_code', ...}) et les messages vont sur la sortie d'erreur.
+Le code de sortie indique le résultat (voir EXIT_*).
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import signal
+import sys
+
+# Codes de sortie
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_DEVICE = 3
+EXIT_NOT_FOUND = 4
+
+# Script principal (fonctions du menu)
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'from zk import ZK, const.py')
+
+
+def load_main_module():
+    """Charger le script principal comme module (ses fonctions, sans la boucle du menu)"""
+    spec = importlib.util.spec_from_file_location('zk_main', MAIN_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class DeviceUnavailable(Exception):
+    """Connexion à l'appareil impossible"""
+
+
+@contextlib.contextmanager
+def device_connection(main):
+    """Connexion à l'appareil le temps d'une commande"""
+    try:
+        conn = main.open_connection()
+    except Exception as e:
+        raise DeviceUnavailable(str(e))
+    try:
+        yield conn
+    finally:
+        conn.disconnect()
+
+
+def cmd_sync(main, args):
+    if args.fleet:
+        reports = main.sync_fleet_attendance(full=args.full)
+        if reports is None:
+            return EXIT_NOT_FOUND, {'error': f"inventaire introuvable: {main.DEVICES_FILE}"}
+        failed = [r for r in reports if r['status'] in ('erreur', 'délai dépassé')]
+        return (EXIT_DEVICE if failed else EXIT_OK), {
+            'new': sum(r['new'] for r in reports), 'devices': reports}
+    with device_connection(main) as conn:
+        return EXIT_OK, main.sync_attendance_to_json(conn, full=args.full)
+
+
+def cmd_stream(main, args):
+    # Arrêt propre (dernier lot écrit) sur SIGTERM, comme sur Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    return EXIT_OK, main.stream_attendance()
+
+
+def cmd_apply(main, args):
+    with device_connection(main) as conn:
+        return EXIT_OK, main.apply_all_restrictions(conn, dry_run=args.dry_run)
+
+
+def cmd_access_push(main, args):
+    with device_connection(main) as conn:
+        result = main.push_device_access(conn, dry_run=args.dry_run)
+    return (EXIT_ERROR if 'error' in result else EXIT_OK), result
+
+
+def cmd_users_list(main, args):
+    with device_connection(main) as conn:
+        users = [{'uid': u.uid, 'name': u.name, 'user_id': u.user_id, 'privilege': u.privilege,
+                  'group_id': u.group_id, 'card': u.card} for u in conn.get_users()]
+    for u in users:
+        print(f"{u['uid']:>6}  {u['user_id']:<12} {u['name']}")
+    return EXIT_OK, {'count': len(users), 'users': users}
+
+
+def cmd_attendance_users(main, args):
+    users = [{'uid': uid, 'name': name, 'count': count} for uid, name, count in main.list_attendance_users()]
+    for u in users:
+        print(f"{u['uid']:>6}  {u['name']:<30} {u['count']:>8}")
+    return EXIT_OK, {'count': len(users), 'users': users}
+
+
+def cmd_attendance_query(main, args):
+    records = main.query_attendance(args.uid, args.date_from, args.date_to)
+    if records is None:
+        return EXIT_NOT_FOUND, {'error': f"aucun pointage pour l'UID {args.uid}"}
+    for r in records:
+        print(f"{r['date']:<12} {r['heure']:<10} {r['type']}")
+    return EXIT_OK, {'uid': args.uid, 'count': len(records), 'records': records}
+
+
+def _split(values):
+    """Options répétables aux valeurs séparées par des virgules -> liste (None si absente)"""
+    if not values:
+        return None
+    return [item.strip() for value in values for item in value.split(',') if item.strip()]
+
+
+def cmd_export(main, args):
+    output = args.output or f"attendance_export.{args.format}" + ('.gz' if args.gzip else '')
+    filtered = args.gzip or args.date_from or args.date_to or args.uid or args.type
+    if args.format == 'json':
+        # Vue historique complète {uid: {'name', 'records'}} (chargée en mémoire)
+        if filtered:
+            return EXIT_USAGE, {'error': "filtres et --gzip disponibles en csv et ndjson seulement"}
+        data = main.load_attendance_data()
+        count = sum(len(entry['records']) for entry in data.values())
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+    else:
+        try:
+            punch_codes = main.parse_punch_types(_split(args.type)) if args.type else None
+        except ValueError as e:
+            return EXIT_USAGE, {'error': str(e)}
+        count = main.export_attendance(output, args.format, args.gzip, args.date_from, args.date_to,
+                                       _split(args.uid), punch_codes)
+    print(f"{count} pointage(s) exportés dans {output}")
+    return EXIT_OK, {'output': output, 'format': args.format, 'count': count}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='zk_cli', description="Commandes non interactives du script ZK")
+    parser.add_argument('--json', action='store_true', help="résultat en JSON sur la sortie standard")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sync = commands.add_parser('sync', help="synchroniser les pointages de l'appareil")
+    sync.add_argument('--full', action='store_true', help="resynchronisation complète")
+    sync.add_argument('--fleet', action='store_true', help="tous les appareils de l'inventaire")
+    sync.set_defaults(handler=cmd_sync)
+
+    stream = commands.add_parser('stream', help="ajouter les pointages en temps réel (jusqu'à l'arrêt)")
+    stream.set_defaults(handler=cmd_stream)
+
+    apply = commands.add_parser('apply', help="appliquer toutes les restrictions")
+    apply.add_argument('--dry-run', action='store_true',
+                       help="afficher les opérations prévues et le temps estimé sans rien modifier")
+    apply.set_defaults(handler=cmd_apply)
+
+    access = commands.add_parser('access', help="fuseaux horaires et groupes d'accès de l'appareil")
+    access_commands = access.add_subparsers(dest='action', required=True)
+    push = access_commands.add_parser('push', help="envoyer les règles par jour et par plage horaire")
+    push.add_argument('--dry-run', action='store_true', help="afficher les écritures prévues sans rien envoyer")
+    push.set_defaults(handler=cmd_access_push)
+
+    users = commands.add_parser('users', help="utilisateurs de l'appareil")
+    users_commands = users.add_subparsers(dest='action', required=True)
+    users_commands.add_parser('list', help="lister les utilisateurs").set_defaults(handler=cmd_users_list)
+
+    attendance = commands.add_parser('attendance', help="pointages enregistrés (sans appareil)")
+    attendance_commands = attendance.add_subparsers(dest='action', required=True)
+    attendance_commands.add_parser('users', help="utilisateurs avec pointages").set_defaults(
+        handler=cmd_attendance_users)
+    query = attendance_commands.add_parser('query', help="pointages d'un utilisateur")
+    query.add_argument('uid')
+    query.add_argument('--from', dest='date_from', help="date de début incluse (YYYY-MM-DD)")
+    query.add_argument('--to', dest='date_to', help="date de fin incluse (YYYY-MM-DD)")
+    query.set_defaults(handler=cmd_attendance_query)
+
+    export = commands.add_parser('export', help="exporter les pointages (sans appareil)")
+    export.add_argument('--format', default='json', choices=('json', 'csv', 'ndjson'),
+                        help="csv et ndjson sont écrits en flux (mémoire constante)")
+    export.add_argument('--output', help="fichier de sortie (défaut: attendance_export.<format>)")
+    export.add_argument('--gzip', action='store_true', help="compresser (aussi avec l'extension .gz)")
+    export.add_argument('--from', dest='date_from', help="date de début incluse (YYYY-MM-DD)")
+    export.add_argument('--to', dest='date_to', help="date de fin incluse (YYYY-MM-DD)")
+    export.add_argument('--uid', action='append', help="UID à exporter (répétable, ou séparés par des virgules)")
+    export.add_argument('--type', action='append',
+                        help="type de pointage, code ou nom (répétable, ou séparés par des virgules)")
+    export.set_defaults(handler=cmd_export)
+    return parser
+
+
+def run(argv=None):
+    """Exécuter une commande; retourne le code de sortie"""
+    args = build_parser().parse_args(argv)
+    command = ' '.join(filter(None, [args.command, getattr(args, 'action', None)]))
+
+    # En mode JSON, les messages des fonctions du script vont sur la sortie d'erreur
+    output = contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext()
+    with output:
+        try:
+            main = load_main_module()
+            try:
+                code, result = args.handler(main, args)
+            finally:
+                main.flush_state()
+        except DeviceUnavailable as e:
+            code, result = EXIT_DEVICE, {'error': f"appareil injoignable: {e}"}
+        except Exception as e:
+            code, result = EXIT_ERROR, {'error': str(e)}
+
+    result = result or {}
+    if args.json:
+        print(json.dumps({'command': command, 'status': 'ok' if code == EXIT_OK else 'error',
+                          'exit_code': code, **result}, ensure_ascii=False, default=str))
+    elif 'error' in result:
+        print(f"Erreur: {result['error']}", file=sys.stderr)
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,499 @@
+"""Émulateur local d'un appareil ZKTeco (protocole ZK sur TCP et UDP).
+
+Répond aux commandes utilisées par le script et par pyzk: connexion (avec mot de passe
+optionnel), activation/désactivation, lecture des compteurs (read_sizes), informations de
+l'appareil, lecture des utilisateurs, des pointages et des gabarits d'empreinte en tampon
+(1503/1504), création et suppression d'utilisateurs, enregistrement d'un utilisateur avec
+ses gabarits (save_user_template), fuseaux horaires et groupes d'accès (écriture et lecture)
+et événements temps réel (live_capture).
+
+Le jeu de données est synthétique (taille configurable) et reproductible (graine). La
+latence et la perte de paquets sont configurables: en UDP un paquet perdu n'obtient pas de
+réponse; en TCP (qui retransmet) une perte se traduit par un délai de retransmission.
+
+Usage:
+    python zk_emulator.py --users 10000 --records 200000 --latency 5 --loss 0.01
+
+puis pointer le script (ou pyzk) sur 127.0.0.1:4370 (ommit_ping=True).
+"""
+
+import asyncio
+import random
+import threading
+from datetime import datetime, timedelta
+from struct import pack, unpack
+
+from zk_protocol import (
+    CMD_ACK_ERROR,
+    CMD_ACK_OK,
+    CMD_ACK_UNAUTH,
+    CMD_ACK_UNKNOWN,
+    CMD_ATTLOG_RRQ,
+    CMD_AUTH,
+    CMD_CANCELCAPTURE,
+    CMD_CONNECT,
+    CMD_DATA,
+    CMD_DB_RRQ,
+    CMD_DELETE_USER,
+    CMD_DISABLEDEVICE,
+    CMD_ENABLEDEVICE,
+    CMD_EXIT,
+    CMD_FREE_DATA,
+    CMD_GET_FREE_SIZES,
+    CMD_GET_TIME,
+    CMD_GET_VERSION,
+    CMD_GRPTZ_RRQ,
+    CMD_GRPTZ_WRQ,
+    CMD_OPTIONS_RRQ,
+    CMD_PREPARE_BUFFER,
+    CMD_PREPARE_DATA,
+    CMD_READ_BUFFER,
+    CMD_REFRESHDATA,
+    CMD_REG_EVENT,
+    CMD_SAVE_USERTEMPS,
+    CMD_SET_TIME,
+    CMD_TESTVOICE,
+    CMD_TZ_RRQ,
+    CMD_TZ_WRQ,
+    CMD_USER_WRQ,
+    CMD_USERTEMP_RRQ,
+    FCT_USER,
+    TCP_TOP_SIZE,
+    USHRT_MAX,
+    Attendance,
+    User,
+    encode_time,
+    make_commkey,
+    make_packet,
+    pack_attendance,
+    pack_group_time_zones,
+    pack_live_event,
+    pack_sizes,
+    pack_templates,
+    pack_time_zone,
+    pack_users,
+    parse_packet,
+    tcp_frame,
+    tcp_frame_length,
+    unpack_group_time_zones,
+    unpack_time_zone,
+    unpack_user,
+    unpack_user_templates,
+)
+
+# Commandes acceptées sans effet (ACK_OK)
+NOOP_COMMANDS = {CMD_REFRESHDATA, CMD_TESTVOICE, CMD_FREE_DATA, CMD_CANCELCAPTURE, CMD_SET_TIME, 60}
+# Taille maximale des données d'un paquet UDP
+UDP_CHUNK = 1024
+# Délai simulé d'une retransmission TCP (secondes)
+TCP_RETRANSMIT_DELAY = 0.2
+
+
+def generate_dataset(n_users, n_records, seed=0, start=datetime(2026, 1, 1, 7, 0)):
+    """Utilisateurs et pointages synthétiques reproductibles"""
+    rng = random.Random(seed)
+    users = [User(uid, f'Utilisateur {uid}', 0, '', '', str(uid), 0) for uid in range(1, n_users + 1)]
+    records = []
+    t = start
+    # Pointages répartis sur les utilisateurs, en ordre chronologique comme sur l'appareil
+    for i in range(n_records):
+        t += timedelta(seconds=rng.randint(1, 120))
+        uid = rng.randint(1, n_users) if n_users else 1
+        records.append(Attendance(str(uid), t, 1, i % 2, uid))
+    return users, records
+
+
+def generate_templates(users, per_user, seed=0, size=512):
+    """Gabarits d'empreinte synthétiques {uid: {doigt: (validité, gabarit)}}"""
+    rng = random.Random(seed)
+    return {u.uid: {fid: (1, bytes(rng.getrandbits(8) for _ in range(size))) for fid in range(per_user)}
+            for u in users} if per_user else {}
+
+
+class DeviceState:
+    """Contenu de l'appareil émulé"""
+
+    def __init__(self, users, records, serial='EMU0001', name='ZK Emulator', password=0,
+                 record_size=40, user_packet_size=72, rec_cap=None, users_cap=None, templates=None):
+        self.users = {u.uid: u for u in users}
+        self.templates = templates or {}
+        # Fuseau 1 et groupe 1: accès permanent (valeurs par défaut d'un appareil)
+        self.time_zones = {1: [(0, 0, 23, 59)] * 7}
+        self.group_time_zones = {1: [1, 0, 0]}
+        self.records = records
+        self.serial = serial
+        self.name = name
+        self.password = password
+        self.record_size = record_size
+        self.user_packet_size = user_packet_size
+        self.rec_cap = rec_cap or max(len(records) * 2, 100000)
+        self.users_cap = users_cap or max(len(users) * 2, 10000)
+        self.enabled = True
+        self._buffers = {}
+        self.stats = {'commands': 0, 'dropped': 0, 'bytes_sent': 0}
+
+    def invalidate(self):
+        self._buffers.clear()
+
+    def buffer(self, command, fct):
+        """Contenu d'une lecture en tampon (mis en cache jusqu'à la prochaine modification)"""
+        key = (command, fct)
+        if key not in self._buffers:
+            if command == CMD_USERTEMP_RRQ and fct == FCT_USER:
+                self._buffers[key] = pack_users(sorted(self.users.values(), key=lambda u: u.uid),
+                                                self.user_packet_size)
+            elif command == CMD_ATTLOG_RRQ:
+                self._buffers[key] = pack_attendance(self.records, self.record_size)
+            elif command == CMD_DB_RRQ:
+                self._buffers[key] = pack_templates(
+                    (uid, fid, valid, template)
+                    for uid in sorted(self.templates)
+                    for fid, (valid, template) in sorted(self.templates[uid].items()))
+            else:
+                return None
+        return self._buffers[key]
+
+    def finger_count(self):
+        return sum(len(fingers) for fingers in self.templates.values())
+
+    def options(self):
+        return {
+            b'~SerialNumber': self.serial,
+            b'~DeviceName': self.name,
+            b'~Platform': 'ZEM560_EMU',
+            b'MAC': '00:17:61:00:00:01',
+            b'~ZKFPVersion': '10',
+            b'ZKFaceVersion': '0',
+            b'~ExtendFmt': '0',
+            b'~UserExtFmt': '0',
+            b'FaceFunOn': '0',
+            b'CompatOldFirmware': '0',
+        }
+
+    def add_live_record(self, uid=None):
+        """Ajouter un pointage « en direct » (utilisé pour les événements temps réel)"""
+        uid = uid or random.choice(list(self.users) or [1])
+        last = self.records[-1].timestamp if self.records else datetime.now()
+        record = Attendance(str(uid), max(datetime.now().replace(microsecond=0), last + timedelta(seconds=1)),
+                            1, len(self.records) % 2, uid)
+        self.records.append(record)
+        self.invalidate()
+        return record
+
+
+class Session:
+    """État d'une connexion cliente (session, tampon en cours, abonnement aux événements)"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.authenticated = False
+        self.buffer = b''
+        self.incoming = b''
+        self.events = 0
+        self.reply_id = 0
+
+
+class DeviceEmulator:
+    """Serveur TCP + UDP répondant comme un appareil ZK"""
+
+    def __init__(self, state, host='127.0.0.1', port=4370, latency=0.0, loss=0.0, live_interval=0.0, seed=0):
+        self.state = state
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.loss = loss
+        self.live_interval = live_interval
+        self.rng = random.Random(seed)
+        self._next_session = 1
+        self._tcp_server = None
+        self._udp_transport = None
+        self._udp_sessions = {}
+        self._live_subscribers = set()
+        self._live_task = None
+
+    # --- Traitement des commandes ---
+
+    def _new_session(self):
+        session = Session(self._next_session)
+        self._next_session = self._next_session % (USHRT_MAX - 1) + 1
+        return session
+
+    def handle(self, session, packet):
+        """Paquet reçu -> liste de (commande, données) à renvoyer"""
+        command, _session_id, reply_id, data = parse_packet(packet)
+        session.reply_id = reply_id
+        state = self.state
+        state.stats['commands'] += 1
+
+        if command == CMD_ACK_OK:
+            # Accusé de réception d'un événement temps réel: pas de réponse
+            return []
+        if command == CMD_CONNECT:
+            if state.password:
+                return [(CMD_ACK_UNAUTH, b'')]
+            session.authenticated = True
+            return [(CMD_ACK_OK, b'')]
+        if command == CMD_AUTH:
+            if data[:4] == make_commkey(state.password, session.session_id)[:4]:
+                session.authenticated = True
+                return [(CMD_ACK_OK, b'')]
+            return [(CMD_ACK_UNAUTH, b'')]
+        if not session.authenticated:
+            return [(CMD_ACK_UNAUTH, b'')]
+
+        if command == CMD_EXIT:
+            self._live_subscribers.discard(session)
+            return [(CMD_ACK_OK, b'')]
+        if command == CMD_ENABLEDEVICE:
+            state.enabled = True
+            return [(CMD_ACK_OK, b'')]
+        if command == CMD_DISABLEDEVICE:
+            state.enabled = False
+            return [(CMD_ACK_OK, b'')]
+        if command in NOOP_COMMANDS:
+            return [(CMD_ACK_OK, b'')]
+        if command == CMD_GET_FREE_SIZES:
+            return [(CMD_ACK_OK, pack_sizes(len(state.users), state.finger_count(), len(state.records),
+                                            state.users_cap, 10000, state.rec_cap))]
+        if command == CMD_GET_VERSION:
+            return [(CMD_ACK_OK, b'Ver 6.60 Emu 2026\x00')]
+        if command == CMD_GET_TIME:
+            return [(CMD_ACK_OK, pack('<I', encode_time(datetime.now())))]
+        if command == CMD_OPTIONS_RRQ:
+            name = data.split(b'\x00')[0]
+            value = state.options().get(name)
+            if value is None:
+                return [(CMD_ACK_ERROR, b'')]
+            return [(CMD_ACK_OK, name + b'=' + value.encode() + b'\x00')]
+        if command == CMD_PREPARE_BUFFER:
+            _flag, buffer_command, fct, _ext = unpack('<bhii', data[:11])
+            buffer = state.buffer(buffer_command, fct)
+            if buffer is None:
+                return [(CMD_ACK_ERROR, b'')]
+            session.buffer = buffer
+            return [(CMD_ACK_OK, pack('<BI', 0, len(buffer)) + b'\x00' * 4)]
+        if command == CMD_READ_BUFFER:
+            start, size = unpack('<ii', data[:8])
+            return [(CMD_PREPARE_DATA, pack('<II', size, 0)), ('data', session.buffer[start:start + size]),
+                    (CMD_ACK_OK, b'')]
+        if command == CMD_USER_WRQ:
+            user = unpack_user(data[:72] if len(data) >= 72 else data)
+            if not user.user_id or user.user_id == '0':
+                user.user_id = str(user.uid)
+            state.users[user.uid] = user
+            state.invalidate()
+            return [(CMD_ACK_OK, b'')]
+        if command == CMD_DELETE_USER:
+            uid = unpack('<h', data[:2])[0]
+            if state.users.pop(uid, None) is None:
+                return [(CMD_ACK_ERROR, b'')]
+            # Les gabarits sont supprimés avec l'utilisateur
+            state.templates.pop(uid, None)
+            state.invalidate()
+            return [(CMD_ACK_OK, b'')]
+        if command == CMD_PREPARE_DATA:
+            # Envoi de données par le client (suivi de paquets CMD_DATA)
+            session.incoming = b''
+            return [(CMD_ACK_OK, b'')]
+        if command == CMD_DATA:
+            session.incoming += data
+            return [(CMD_ACK_OK, b'')]
+        if command == CMD_SAVE_USERTEMPS:
+            user, fingers = unpack_user_templates(session.incoming)
+            session.incoming = b''
+            if not user.user_id or user.user_id == '0':
+                user.user_id = str(user.uid)
+            state.users[user.uid] = user
+            state.templates[user.uid] = {fid: (1, template) for fid, template in fingers}
+            state.invalidate()
+            return [(CMD_ACK_OK, b'')]
+        if command == CMD_TZ_WRQ:
+            index, windows = unpack_time_zone(data)
+            state.time_zones[index] = windows
+            return [(CMD_ACK_OK, b'')]
+        if command == CMD_TZ_RRQ:
+            index = unpack('<I', data[:4])[0]
+            windows = state.time_zones.get(index, [(0, 0, 0, 0)] * 7)
+            return [(CMD_ACK_OK, pack_time_zone(index, windows))]
+        if command == CMD_GRPTZ_WRQ:
+            group, time_zones = unpack_group_time_zones(data)
+            state.group_time_zones[group] = time_zones
+            return [(CMD_ACK_OK, b'')]
+        if command == CMD_GRPTZ_RRQ:
+            group = unpack('<I', data[:4])[0]
+            return [(CMD_ACK_OK, pack_group_time_zones(group, state.group_time_zones.get(group, [0, 0, 0])))]
+        if command == CMD_REG_EVENT:
+            session.events = unpack('<I', data[:4])[0] if len(data) >= 4 else 0
+            if session.events:
+                self._live_subscribers.add(session)
+            else:
+                self._live_subscribers.discard(session)
+            return [(CMD_ACK_OK, b'')]
+        return [(CMD_ACK_UNKNOWN, b'')]
+
+    def _packets(self, session, replies, udp):
+        """Réponses -> paquets (les données sont découpées en paquets de 1024 octets en UDP)"""
+        packets = []
+        # Le client attend le même numéro de réponse que sa requête
+        reply_id = (session.reply_id - 1) % USHRT_MAX
+        for command, data in replies:
+            if command == 'data':
+                chunks = [data[i:i + UDP_CHUNK] for i in range(0, len(data), UDP_CHUNK)] if udp else [data]
+                for chunk in chunks:
+                    packets.append(make_packet(CMD_DATA, session.session_id, reply_id, chunk))
+            else:
+                packets.append(make_packet(command, session.session_id, reply_id, data))
+        return packets
+
+    async def _delay(self, udp):
+        """Latence simulée; retourne False si le paquet est perdu (UDP)"""
+        if self.loss and self.rng.random() < self.loss:
+            if udp:
+                self.state.stats['dropped'] += 1
+                return False
+            await asyncio.sleep(TCP_RETRANSMIT_DELAY)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return True
+
+    # --- TCP ---
+
+    async def _tcp_client(self, reader, writer):
+        session = self._new_session()
+        session.writer = writer
+        try:
+            while True:
+                top = await reader.readexactly(TCP_TOP_SIZE)
+                length = tcp_frame_length(top)
+                if length is None:
+                    break
+                packet = await reader.readexactly(length)
+                if not await self._delay(udp=False):
+                    continue
+                replies = self.handle(session, packet)
+                for reply in self._packets(session, replies, udp=False):
+                    frame = tcp_frame(reply)
+                    self.state.stats['bytes_sent'] += len(frame)
+                    writer.write(frame)
+                await writer.drain()
+                if parse_packet(packet)[0] == CMD_EXIT:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._live_subscribers.discard(session)
+            writer.close()
+
+    # --- UDP ---
+
+    class _UdpProtocol(asyncio.DatagramProtocol):
+        def __init__(self, emulator):
+            self.emulator = emulator
+
+        def connection_made(self, transport):
+            self.emulator._udp_transport = transport
+
+        def datagram_received(self, data, addr):
+            asyncio.ensure_future(self.emulator._udp_packet(data, addr))
+
+    async def _udp_packet(self, packet, addr):
+        if parse_packet(packet)[0] == CMD_CONNECT or addr not in self._udp_sessions:
+            self._udp_sessions[addr] = self._new_session()
+            self._udp_sessions[addr].addr = addr
+        session = self._udp_sessions[addr]
+        if not await self._delay(udp=True):
+            return
+        for reply in self._packets(session, self.handle(session, packet), udp=True):
+            self.state.stats['bytes_sent'] += len(reply)
+            self._udp_transport.sendto(reply, addr)
+
+    # --- Événements temps réel ---
+
+    async def _live_loop(self):
+        while True:
+            await asyncio.sleep(self.live_interval)
+            if not self._live_subscribers:
+                continue
+            record = self.state.add_live_record(self.rng.choice(list(self.state.users) or [1]))
+            for session in list(self._live_subscribers):
+                packet = make_packet(CMD_REG_EVENT, session.session_id, 0, pack_live_event(record))
+                if hasattr(session, 'writer'):
+                    session.writer.write(tcp_frame(packet))
+                else:
+                    self._udp_transport.sendto(packet, session.addr)
+
+    # --- Démarrage ---
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._tcp_server = await asyncio.start_server(self._tcp_client, self.host, self.port)
+        if not self.port:
+            self.port = self._tcp_server.sockets[0].getsockname()[1]
+        await loop.create_datagram_endpoint(lambda: self._UdpProtocol(self), local_addr=(self.host, self.port))
+        if self.live_interval:
+            self._live_task = asyncio.ensure_future(self._live_loop())
+        return self
+
+    def stop(self):
+        if self._live_task:
+            self._live_task.cancel()
+        if self._tcp_server:
+            self._tcp_server.close()
+        if self._udp_transport:
+            self._udp_transport.close()
+
+
+def run_in_thread(emulator):
+    """Démarrer l'émulateur dans une boucle en arrière-plan (tests, benchmarks); retourne l'émulateur"""
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(emulator.start())
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+    emulator.loop = loop
+    return emulator
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Émulateur d'appareil ZKTeco (TCP/UDP)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4370)
+    parser.add_argument('--users', type=int, default=100, help="nombre d'utilisateurs")
+    parser.add_argument('--records', type=int, default=1000, help="nombre de pointages")
+    parser.add_argument('--fingers', type=int, default=0, help="gabarits d'empreinte par utilisateur")
+    parser.add_argument('--latency', type=float, default=0.0, help="latence par paquet (ms)")
+    parser.add_argument('--loss', type=float, default=0.0, help="taux de perte de paquets (0-1)")
+    parser.add_argument('--password', type=int, default=0)
+    parser.add_argument('--serial', default='EMU0001')
+    parser.add_argument('--record-size', type=int, default=40, choices=(8, 16, 40))
+    parser.add_argument('--live-interval', type=float, default=0.0,
+                        help="intervalle (s) entre deux pointages temps réel (0 = aucun)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    users, records = generate_dataset(args.users, args.records, args.seed)
+    state = DeviceState(users, records, serial=args.serial, password=args.password, record_size=args.record_size,
+                        templates=generate_templates(users, args.fingers, args.seed))
+    emulator = DeviceEmulator(state, args.host, args.port, latency=args.latency / 1000, loss=args.loss,
+                              live_interval=args.live_interval, seed=args.seed)
+
+    async def main():
+        await emulator.start()
+        print(f"Émulateur ZK en écoute sur {args.host}:{emulator.port} (TCP/UDP)")
+        print(f"  - Utilisateurs: {len(users)}")
+        print(f"  - Pointages: {len(records)}")
+        print(f"  - Gabarits d'empreinte: {state.finger_count()}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nÉmulateur arrêté.")
@@ -0,0 +1,479 @@
+"""Codage et décodage des paquets du protocole ZK (port 4370), sans dépendance à pyzk.
+
+Utilisé par le client asyncio (zk_async.py) et par l'émulateur d'appareil (zk_emulator.py).
+Les formats reprennent ceux de pyzk 0.9:
+
+  en-tête      : commande, somme de contrôle, session, numéro de réponse ('<4H')
+  trame TCP    : 0x5050, 0x7d82, longueur ('<HHI') suivie du paquet
+  utilisateur  : 28 octets (ZK6) ou 72 octets (ZK8)
+  pointage     : 8, 16 ou 40 octets selon le firmware
+  gabarit      : taille, uid, doigt, validité ('<HHbb') suivis du gabarit d'empreinte
+  fuseau       : index ('<I') puis 7 jours (dimanche d'abord) de 4 octets: heure et minute
+                 de début, heure et minute de fin
+  groupe       : index, 3 fuseaux, mode de vérification, jours fériés (GROUP_TZ_FORMAT)
+
+Les formats des fuseaux et des groupes ne viennent pas de pyzk (qui ne les gère pas) mais de
+la documentation du SDK autonome ZKTeco: ils n'ont été essayés qu'avec zk_emulator.py, qui
+utilise ce même module, et doivent être vérifiés sur un appareil réel.
+
+send_raw_command envoie une commande sans méthode dédiée (fuseaux, groupes) par le point
+d'envoi public send_command de la connexion (AsyncZK, BlockingConnection), ou à défaut par
+la fonction interne de pyzk (zk.base.ZK.__send_command, nom privé susceptible de changer).
+"""
+
+from datetime import datetime
+from struct import iter_unpack, pack, unpack
+
+USHRT_MAX = 65535
+
+# Points d'envoi de commandes brutes, par ordre de préférence (public, puis interne à pyzk)
+RAW_COMMAND_HOOKS = ('send_command', '_ZK__send_command')
+
+CMD_DB_RRQ = 7
+CMD_USER_WRQ = 8
+CMD_USERTEMP_RRQ = 9
+CMD_OPTIONS_RRQ = 11
+CMD_ATTLOG_RRQ = 13
+CMD_DELETE_USER = 18
+CMD_GRPTZ_RRQ = 25
+CMD_GRPTZ_WRQ = 26
+CMD_TZ_RRQ = 27
+CMD_TZ_WRQ = 28
+CMD_SAVE_USERTEMPS = 110
+CMD_GET_FREE_SIZES = 50
+CMD_CANCELCAPTURE = 62
+CMD_GET_TIME = 201
+CMD_SET_TIME = 202
+CMD_REG_EVENT = 500
+CMD_CONNECT = 1000
+CMD_EXIT = 1001
+CMD_ENABLEDEVICE = 1002
+CMD_DISABLEDEVICE = 1003
+CMD_REFRESHDATA = 1013
+CMD_TESTVOICE = 1017
+CMD_GET_VERSION = 1100
+CMD_AUTH = 1102
+CMD_PREPARE_DATA = 1500
+CMD_DATA = 1501
+CMD_FREE_DATA = 1502
+CMD_PREPARE_BUFFER = 1503
+CMD_READ_BUFFER = 1504
+
+CMD_ACK_OK = 2000
+CMD_ACK_ERROR = 2001
+CMD_ACK_UNAUTH = 2005
+CMD_ACK_UNKNOWN = 0xffff
+
+FCT_FINGERTMP = 2
+FCT_USER = 5
+
+MACHINE_PREPARE_DATA_1 = 20560  # 0x5050
+MACHINE_PREPARE_DATA_2 = 32130  # 0x7d82
+
+HEADER_SIZE = 8
+TCP_TOP_SIZE = 8
+
+GROUP_TZ_FORMAT = '<I3HBB'
+
+USER_DEFAULT = 0
+USER_ADMIN = 14
+
+
+class User:
+    """Utilisateur de l'appareil (mêmes attributs que zk.user.User)"""
+
+    def __init__(self, uid, name, privilege, password='', group_id='', user_id='', card=0):
+        self.uid = uid
+        self.name = name
+        self.privilege = privilege
+        self.password = str(password)
+        self.group_id = str(group_id)
+        self.user_id = user_id
+        self.card = int(card)
+
+    def __repr__(self):
+        return f'<User>: [uid:{self.uid}, name:{self.name} user_id:{self.user_id}]'
+
+
+class Attendance:
+    """Pointage de l'appareil (mêmes attributs que zk.attendance.Attendance)"""
+
+    def __init__(self, user_id, timestamp, status, punch=0, uid=0):
+        self.uid = uid
+        self.user_id = user_id
+        self.timestamp = timestamp
+        self.status = status
+        self.punch = punch
+
+    def __repr__(self):
+        return f'<Attendance>: {self.user_id} : {self.timestamp} ({self.status}, {self.punch})'
+
+
+class Finger:
+    """Gabarit d'empreinte (mêmes attributs que zk.finger.Finger)"""
+
+    def __init__(self, uid, fid, valid, template):
+        self.uid = int(uid)
+        self.fid = int(fid)
+        self.valid = int(valid)
+        self.template = template
+        self.size = len(template)
+
+    def __repr__(self):
+        return f'<Finger> [uid:{self.uid:>3}, fid:{self.fid}, size:{self.size:>4} v:{self.valid}]'
+
+
+def checksum(data):
+    """Somme de contrôle d'un paquet (zkemsdk.c)"""
+    total = 0
+    for (word,) in iter_unpack('<H', data[:len(data) - len(data) % 2]):
+        total += word
+        if total > USHRT_MAX:
+            total -= USHRT_MAX
+    if len(data) % 2:
+        total += data[-1]
+    while total > USHRT_MAX:
+        total -= USHRT_MAX
+    total = ~total
+    while total < 0:
+        total += USHRT_MAX
+    return total
+
+
+def make_packet(command, session_id, reply_id, data=b''):
+    """Paquet prêt à envoyer; le numéro de réponse est incrémenté comme le fait pyzk
+    (la somme de contrôle porte sur le numéro avant incrémentation)"""
+    raw = pack('<4H', command, 0, session_id, reply_id) + data
+    value = checksum(raw)
+    reply_id = (reply_id + 1) % USHRT_MAX
+    return pack('<4H', command, value, session_id, reply_id) + data
+
+
+def parse_packet(packet):
+    """Paquet reçu -> (commande, session, numéro de réponse, données)"""
+    command, _checksum, session_id, reply_id = unpack('<4H', packet[:HEADER_SIZE])
+    return command, session_id, reply_id, packet[HEADER_SIZE:]
+
+
+def tcp_frame(packet):
+    """Ajouter l'en-tête TCP (0x5050 0x7d82 longueur)"""
+    return pack('<HHI', MACHINE_PREPARE_DATA_1, MACHINE_PREPARE_DATA_2, len(packet)) + packet
+
+
+def tcp_frame_length(top):
+    """Longueur annoncée par un en-tête TCP, ou None s'il est invalide"""
+    magic1, magic2, length = unpack('<HHI', top)
+    if magic1 != MACHINE_PREPARE_DATA_1 or magic2 != MACHINE_PREPARE_DATA_2:
+        return None
+    return length
+
+
+def make_commkey(key, session_id, ticks=50):
+    """Clé d'authentification (commpro.c - MakeKey)"""
+    key = int(key)
+    k = 0
+    for i in range(32):
+        k = (k << 1 | 1) if key & (1 << i) else k << 1
+    k += int(session_id)
+    k = unpack('BBBB', pack('<I', k & 0xffffffff))
+    k = pack('BBBB', k[0] ^ ord('Z'), k[1] ^ ord('K'), k[2] ^ ord('S'), k[3] ^ ord('O'))
+    k = unpack('<HH', k)
+    k = unpack('BBBB', pack('<HH', k[1], k[0]))
+    b = 0xff & ticks
+    return pack('BBBB', k[0] ^ b, k[1] ^ b, b, k[3] ^ b)
+
+
+def encode_time(t):
+    """datetime -> entier de l'appareil (zkemsdk.c - EncodeTime)"""
+    return (
+        ((t.year % 100) * 12 * 31 + ((t.month - 1) * 31) + t.day - 1) * (24 * 60 * 60)
+        + (t.hour * 60 + t.minute) * 60 + t.second
+    )
+
+
+def decode_time(data):
+    """4 octets de l'appareil -> datetime (zkemsdk.c - DecodeTime)"""
+    t = unpack('<I', data)[0]
+    second = t % 60
+    t //= 60
+    minute = t % 60
+    t //= 60
+    hour = t % 24
+    t //= 24
+    day = t % 31 + 1
+    t //= 31
+    month = t % 12 + 1
+    t //= 12
+    return datetime(t + 2000, month, day, hour, minute, second)
+
+
+def decode_timehex(data):
+    """6 octets (année, mois, jour, heure, minute, seconde) -> datetime"""
+    year, month, day, hour, minute, second = unpack('6B', data)
+    return datetime(year + 2000, month, day, hour, minute, second)
+
+
+def option_value(data):
+    """Valeur d'une réponse CMD_OPTIONS_RRQ ('~SerialNumber=XXXX\\x00')"""
+    return data.split(b'=', 1)[-1].split(b'\x00')[0].replace(b'=', b'').decode(errors='ignore')
+
+
+def parse_sizes(data):
+    """Réponse CMD_GET_FREE_SIZES -> compteurs (mêmes noms que les attributs pyzk)"""
+    sizes = {}
+    if len(data) >= 80:
+        fields = unpack('<20i', data[:80])
+        sizes.update(users=fields[4], fingers=fields[6], records=fields[8], cards=fields[12],
+                     fingers_cap=fields[14], users_cap=fields[15], rec_cap=fields[16],
+                     fingers_av=fields[17], users_av=fields[18], rec_av=fields[19])
+        data = data[80:]
+    if len(data) >= 12:
+        fields = unpack('<3i', data[:12])
+        sizes.update(faces=fields[0], faces_cap=fields[2])
+    return sizes
+
+
+def pack_sizes(users, fingers, records, users_cap, fingers_cap, rec_cap, faces=0, faces_cap=0):
+    """Compteurs -> réponse CMD_GET_FREE_SIZES (92 octets)"""
+    fields = [0] * 20
+    fields[4], fields[6], fields[8] = users, fingers, records
+    fields[14], fields[15], fields[16] = fingers_cap, users_cap, rec_cap
+    fields[17], fields[18], fields[19] = fingers_cap - fingers, users_cap - users, rec_cap - records
+    return pack('<20i', *fields) + pack('<3i', faces, 0, faces_cap)
+
+
+def user_wrq_payload(uid, name, privilege, password, group_id, user_id, card, packet_size, encoding='UTF-8'):
+    """Données de CMD_USER_WRQ (création/modification d'un utilisateur)"""
+    if privilege not in (USER_DEFAULT, USER_ADMIN):
+        privilege = USER_DEFAULT
+    if packet_size == 28:
+        return pack('<HB5s8sIxBHI', uid, privilege, password.encode(encoding, errors='ignore'),
+                    name.encode(encoding, errors='ignore'), int(card), int(group_id or 0), 0, int(user_id))
+    name_pad = name.encode(encoding, errors='ignore').ljust(24, b'\x00')[:24]
+    return pack('<HB8s24s4sx7sx24s', uid, privilege, password.encode(encoding, errors='ignore'),
+                name_pad, pack('<I', int(card)), str(group_id).encode(), str(user_id).encode())
+
+
+def _text(raw, encoding='UTF-8'):
+    return raw.split(b'\x00')[0].decode(encoding, errors='ignore')
+
+
+def unpack_user(data, encoding='UTF-8'):
+    """Un enregistrement utilisateur de 28 ou 72 octets -> User (format de CMD_USER_WRQ)"""
+    if len(data) < 72:
+        uid, privilege, password, name, card, group_id, _tz, user_id = unpack('<HB5s8sIxBhI', data.ljust(28, b'\x00')[:28])
+        group_id, user_id = str(group_id), str(user_id)
+    else:
+        uid, privilege, password, name, card, group_id, user_id = unpack('<HB8s24sIx7sx24s', data[:72])
+        group_id, user_id = _text(group_id, encoding).strip(), _text(user_id, encoding)
+    name = _text(name, encoding).strip() or f'NN-{user_id}'
+    return User(uid, name, privilege, _text(password, encoding), group_id, user_id, card)
+
+
+def unpack_users(data, count, encoding='UTF-8'):
+    """Tampon CMD_USERTEMP_RRQ (taille totale + enregistrements) -> (utilisateurs, taille d'un paquet)"""
+    if len(data) <= 4 or not count:
+        return [], None
+    total_size = unpack('<I', data[:4])[0]
+    packet_size = total_size // count
+    data = data[4:]
+    users = []
+    for offset in range(0, len(data) - packet_size + 1, packet_size):
+        users.append(unpack_user(data[offset:offset + packet_size], encoding))
+    return users, packet_size
+
+
+def pack_users(users, packet_size, encoding='UTF-8'):
+    """Utilisateurs -> tampon CMD_USERTEMP_RRQ"""
+    body = b''.join(
+        user_wrq_payload(u.uid, u.name, u.privilege, u.password, u.group_id, u.user_id, u.card,
+                         packet_size, encoding).ljust(packet_size, b'\x00')
+        for u in users
+    )
+    return pack('<I', len(body)) + body
+
+
+def unpack_attendance(data, count, users=()):
+    """Tampon CMD_ATTLOG_RRQ -> pointages (enregistrements de 8, 16 ou 40 octets)"""
+    if len(data) < 4 or not count:
+        return []
+    total_size = unpack('<I', data[:4])[0]
+    record_size = total_size // count
+    data = data[4:]
+    by_uid = {u.uid: u for u in users}
+    by_user_id = {u.user_id: u for u in users}
+    records = []
+    for offset in range(0, len(data) - record_size + 1, record_size):
+        chunk = data[offset:offset + record_size]
+        if record_size == 8:
+            uid, status, timestamp, punch = unpack('<HB4sB', chunk)
+            user = by_uid.get(uid)
+            user_id = user.user_id if user else str(uid)
+        elif record_size == 16:
+            user_id, timestamp, status, punch, _reserved, _workcode = unpack('<I4sBB2sI', chunk)
+            user_id = str(user_id)
+            user = by_user_id.get(user_id)
+            uid = user.uid if user else user_id
+        else:
+            uid, user_id, status, timestamp, punch, _space = unpack('<H24sB4sB8s', chunk[:40])
+            user_id = _text(user_id)
+        records.append(Attendance(user_id, decode_time(timestamp), status, punch, uid))
+    return records
+
+
+def pack_attendance(records, record_size=40):
+    """Pointages -> tampon CMD_ATTLOG_RRQ"""
+    body = []
+    for r in records:
+        timestamp = pack('<I', encode_time(r.timestamp))
+        if record_size == 8:
+            body.append(pack('<HB4sB', int(r.uid), r.status, timestamp, r.punch))
+        elif record_size == 16:
+            body.append(pack('<I4sBB2sI', int(r.user_id), timestamp, r.status, r.punch, b'', 0))
+        else:
+            body.append(pack('<H24sB4sB8s', int(r.uid), str(r.user_id).encode(), r.status, timestamp, r.punch, b''))
+    body = b''.join(body)
+    return pack('<I', len(body)) + body
+
+
+def pack_templates(fingers):
+    """Gabarits [(uid, fid, valid, gabarit)] -> tampon CMD_DB_RRQ (get_templates)"""
+    body = b''.join(pack('<HHbb', len(template) + 6, uid, fid, valid) + template
+                    for uid, fid, valid, template in fingers)
+    return pack('<I', len(body)) + body
+
+
+def unpack_templates(data):
+    """Tampon CMD_DB_RRQ (get_templates) -> [Finger]"""
+    if len(data) < 4:
+        return []
+    total_size = unpack('<I', data[:4])[0]
+    data = data[4:4 + total_size]
+    fingers = []
+    offset = 0
+    while offset + 6 <= len(data):
+        size, uid, fid, valid = unpack('<HHbb', data[offset:offset + 6])
+        if size < 6:
+            break
+        fingers.append(Finger(uid, fid, valid, data[offset + 6:offset + size]))
+        offset += size
+    return fingers
+
+
+def pack_user_templates(user, fingers, packet_size, encoding='UTF-8'):
+    """Utilisateur et gabarits (objets avec fid, template) -> données de save_user_template
+
+    Même disposition que pyzk (User.repack29/repack73, Finger.repack_only): tailles
+    ('<III'), fiche utilisateur précédée de 0x02, table des gabarits puis gabarits.
+    """
+    password = str(user.password).encode(encoding, errors='ignore')
+    name = user.name.encode(encoding, errors='ignore')
+    if packet_size == 28:
+        upack = pack('<BHB5s8sIxBhI', 2, user.uid, user.privilege, password, name, int(user.card),
+                     int(user.group_id) if user.group_id else 0, 0, int(user.user_id))
+    else:
+        upack = pack('<BHB8s24sIB7sx24s', 2, user.uid, user.privilege, password, name, int(user.card), 1,
+                     str(user.group_id).encode(encoding, errors='ignore'),
+                     str(user.user_id).encode(encoding, errors='ignore'))
+    table = b''
+    fpack = b''
+    for finger in fingers:
+        table += pack('<bHbI', 2, user.uid, 0x10 + finger.fid, len(fpack))
+        fpack += pack('<H', len(finger.template)) + finger.template
+    return pack('<III', len(upack), len(table), len(fpack)) + upack + table + fpack
+
+
+def unpack_user_templates(data, encoding='UTF-8'):
+    """Données de save_user_template (CMD_SAVE_USERTEMPS) -> (User, [(fid, gabarit)])"""
+    user_size, table_size, _fingers_size = unpack('<III', data[:12])
+    user = unpack_user(data[13:12 + user_size], encoding)
+    fingers_data = data[12 + user_size + table_size:]
+    fingers = []
+    for _kind, _uid, fnum, start in iter_unpack('<bHbI', data[12 + user_size:12 + user_size + table_size]):
+        size = unpack('<H', fingers_data[start:start + 2])[0]
+        fingers.append((fnum - 0x10, fingers_data[start + 2:start + 2 + size]))
+    return user, fingers
+
+
+def pack_time_zone(index, windows):
+    """Fuseau horaire d'accès -> données de CMD_TZ_WRQ
+
+    windows: 7 fenêtres (dimanche d'abord) (heure début, minute début, heure fin, minute fin)
+    """
+    return pack('<I', index) + bytes(value for window in windows for value in window)
+
+
+def unpack_time_zone(data):
+    """Données de CMD_TZ_WRQ / réponse de CMD_TZ_RRQ -> (index, [7 fenêtres])"""
+    index = unpack('<I', data[:4])[0]
+    return index, [tuple(data[4 + 4 * day:8 + 4 * day]) for day in range(7)]
+
+
+def pack_group_time_zones(group, time_zones, verify_style=0, holidays=False):
+    """Fuseaux d'un groupe d'accès (3, 0 = aucun) -> données de CMD_GRPTZ_WRQ"""
+    return pack(GROUP_TZ_FORMAT, group, *time_zones, verify_style, 1 if holidays else 0)
+
+
+def unpack_group_time_zones(data):
+    """Données de CMD_GRPTZ_WRQ -> (groupe, [3 fuseaux])"""
+    group, tz1, tz2, tz3, _verify_style, _holidays = unpack(GROUP_TZ_FORMAT, data[:12])
+    return group, [tz1, tz2, tz3]
+
+
+class RawCommandUnsupported(Exception):
+    """La connexion ne permet pas d'envoyer une commande brute"""
+
+
+def raw_command_sender(conn):
+    """Fonction d'envoi (command, data) -> {'status', 'code'} de la connexion, None si absente"""
+    for name in RAW_COMMAND_HOOKS:
+        send = getattr(conn, name, None)
+        if callable(send):
+            return send
+    return None
+
+
+def send_raw_command(conn, command, data=b''):
+    """Envoyer une commande sans méthode dédiée; retourne {'status': bool, 'code': int, ...}
+
+    Lève RawCommandUnsupported si la connexion n'a aucun point d'envoi (RAW_COMMAND_HOOKS).
+    """
+    send = raw_command_sender(conn)
+    if send is None:
+        raise RawCommandUnsupported(
+            f"{type(conn).__name__} ne permet pas l'envoi de commandes brutes "
+            f"(aucune des méthodes {', '.join(RAW_COMMAND_HOOKS)})")
+    response = send(command, data)
+    if not isinstance(response, dict) or 'status' not in response:
+        raise RawCommandUnsupported(f"réponse inattendue de {type(conn).__name__}: {response!r}")
+    return response
+
+
+def pack_live_event(record):
+    """Pointage -> données d'un événement temps réel CMD_REG_EVENT (format 32 octets)"""
+    t = record.timestamp
+    timehex = pack('6B', t.year - 2000, t.month, t.day, t.hour, t.minute, t.second)
+    return pack('<24sBB6s', str(record.user_id).encode(), record.status, record.punch, timehex)
+
+
+def unpack_live_events(data):
+    """Données d'un événement CMD_REG_EVENT -> [(user_id, status, punch, datetime)]"""
+    events = []
+    while len(data) >= 12:
+        if len(data) == 12:
+            user_id, status, punch, timehex = unpack('<IBB6s', data)
+            data = data[12:]
+        elif len(data) == 32:
+            user_id, status, punch, timehex = unpack('<24sBB6s', data[:32])
+            data = data[32:]
+        elif len(data) == 36:
+            user_id, status, punch, timehex, _other = unpack('<24sBB6s4s', data[:36])
+            data = data[36:]
+        elif len(data) >= 52:
+            user_id, status, punch, timehex, _other = unpack('<24sBB6s20s', data[:52])
+            data = data[52:]
+        else:
+            break
+        user_id = str(user_id) if isinstance(user_id, int) else _text(user_id)
+        events.append((user_id, status, punch, decode_timehex(timehex)))
+    return events